@@ -0,0 +1,65 @@
+"""
+Micro-benchmark of the listing card parser backends on saved listing pages.
+
+    cd scraper
+    python -m benchmarks.card_parsers page1.html page2.html --repeat 20
+
+Pages can be saved with e.g. `curl -o page1.html <listing url>`. Both
+backends must return the same card records, otherwise the run stops.
+"""
+import argparse
+import statistics
+import time
+
+from utils.crawler.card_parsers import CARD_PARSERS, etree
+
+
+def time_parser(parser, pages: list, repeat: int) -> list:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for html in pages:
+            parser(html)
+        timings.append((time.perf_counter() - start) / len(pages))
+    return timings
+
+
+def comparable(records: list) -> list:
+    # added_at is the parse time, so it differs between backends
+    return [{key: value for key, value in record.items() if key != "added_at"} for record in records]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pages", nargs="+", help="Saved listing page HTML files")
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    pages = []
+    for path in args.pages:
+        with open(path, "rb") as file:
+            pages.append(file.read())
+
+    backends = dict(CARD_PARSERS)
+    if etree is None:
+        print("lxml is not installed, benchmarking BeautifulSoup only")
+        del backends["lxml"]
+
+    reference = [comparable(CARD_PARSERS["bs4"](html)) for html in pages]
+    print(f"{sum(len(cards) for cards in reference)} cards in {len(pages)} pages")
+    for name, parse in backends.items():
+        if [comparable(parse(html)) for html in pages] != reference:
+            raise SystemExit(f"{name} records differ from bs4")
+
+    results = {}
+    for name, parse in backends.items():
+        timings = time_parser(parse, pages, args.repeat)
+        results[name] = statistics.median(timings)
+        print(f"{name:>5}: median {results[name] * 1000:.2f} ms/page, best {min(timings) * 1000:.2f} ms/page")
+
+    if "lxml" in results:
+        print(f"lxml speedup: {results['bs4'] / results['lxml']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,365 @@
+"""
+Throughput benchmark of the scraper stages, in isolation and end to end.
+
+    python scraper/benchmarks/throughput.py --listings 50 --output bench.json
+    python scraper/benchmarks/throughput.py --listings 50 --compare bench.json
+
+Network stages run against the record/replay stand-in server, so record
+fixtures first with a normal run under REPLAY.MODE "record". Stages:
+
+    listing_pages  fetch and parse URL_TEMPLATE pages (replayed)
+    cards          parse a synthetic page of --listings cards, or --pages files
+    details        scrape_details in CRAWLERS.DETAIL.MODE (replayed)
+    browser        scrape_details_page with the gallery, in Chromium (replayed)
+    images         image downloads of each listing (replayed)
+    vision         image selection, preprocessing and the OpenAI call (replayed)
+    nearby         Places lookup (replayed)
+    save           buffered sink writes of --listings synthetic listings
+    end_to_end     ScraperPipeline.run on a fresh store (replayed)
+
+Stages run on the pipeline's own stage methods, so they send the same
+requests as a real run. The JSON output has listings/sec and p50/p95
+latency per stage, plus peak RSS and the peak number of Chromium
+processes. With --compare, a stage more than --tolerance slower than in
+the given results fails the run with exit code 1.
+"""
+import os
+import sys
+import copy
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import tempfile
+import subprocess
+import numpy as np
+import pandas as pd
+import psutil
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.connection.listing_store import ListingStore
+from utils.connection.loader import load_config, load_env_variables
+from utils.connection.proxy import get_proxies
+from utils.crawler.listings_crawler import request_listing_html, parse_listing_cards, scrape_listing_card
+from utils.crawler.details_crawler import scrape_details_page
+from utils.pipeline.pipeline import ScraperPipeline
+
+
+'''
+RESOURCES
+'''
+
+def is_chromium(process: psutil.Process) -> bool:
+    name = process.name().lower()
+    return "chrom" in name or "headless_shell" in name
+
+
+class ResourceMonitor:
+    """Samples the RSS of this process and its children, and their Chromium processes."""
+
+    def __init__(self, interval: float = 0.1):
+        self.interval = interval
+        self.peak_rss = 0
+        self.peak_chromium = 0
+        self._task = None
+
+    def sample(self) -> None:
+        process = psutil.Process()
+        rss = process.memory_info().rss
+        chromium = 0
+        for child in process.children(recursive=True):
+            try:
+                rss += child.memory_info().rss
+                chromium += is_chromium(child)
+            except psutil.Error:
+                continue
+        self.peak_rss = max(self.peak_rss, rss)
+        self.peak_chromium = max(self.peak_chromium, chromium)
+
+    async def _run(self):
+        while True:
+            self.sample()
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> dict:
+        self._task.cancel()
+        self.sample()
+        return {"peak_rss_mb": round(self.peak_rss / 2 ** 20, 1), "peak_chromium_processes": self.peak_chromium}
+
+
+'''
+STAGES
+'''
+
+def summarize(latencies: list, errors: int, items: int, seconds: float, resources: dict) -> dict:
+    latencies_ms = np.array(latencies) * 1000 if latencies else np.zeros(1)
+    return {
+        "items": items,
+        "errors": errors,
+        "seconds": round(seconds, 3),
+        "listings_per_sec": round(items / seconds, 3) if seconds else None,
+        "p50_ms": round(float(np.percentile(latencies_ms, 50)), 2),
+        "p95_ms": round(float(np.percentile(latencies_ms, 95)), 2),
+        **resources
+    }
+
+
+async def bench_stage(name: str, inputs: list, worker, concurrency: int, weight=None) -> tuple:
+    """
+    Runs `worker` over `inputs`, `concurrency` at a time, timing every call.
+    A call that raises or returns None is an error. `weight(result)` is the
+    number of listings a result holds, one by default. Returns the summary
+    and the results of the successful calls.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, results = [], []
+    errors = 0
+
+    async def timed(item):
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                result = await worker(item)
+            except Exception as e:
+                print(f"{name}: {e}")
+                result = None
+            latencies.append(time.perf_counter() - started)
+            if result is None:
+                errors += 1
+            else:
+                results.append(result)
+
+    monitor = ResourceMonitor()
+    monitor.start()
+    started = time.perf_counter()
+    await asyncio.gather(*[timed(item) for item in inputs])
+    seconds = time.perf_counter() - started
+    items = sum(weight(result) for result in results) if weight else len(results)
+    summary = summarize(latencies, errors, items, seconds, await monitor.stop())
+    print(f"{name:>13}: {summary['items']} ok, {errors} errors, {summary['listings_per_sec']}/s, "
+          f"p50 {summary['p50_ms']} ms, p95 {summary['p95_ms']} ms")
+    return summary, results
+
+
+'''
+SYNTHETIC LISTINGS
+'''
+
+def synthetic_listing_page(size: int) -> str:
+    # Same markup as the listing cards of the live site
+    cards = []
+    for i in range(size):
+        cards.append(f"""
+        <div class="listingCard">
+          <a class="lc-cardCover" href="/apartamento-en-arriendo/bogota/{9000000 + i}"></a>
+          <div class="lc-price">$ {random.randint(1, 9)}.{random.randint(100, 999)}.000</div>
+          <strong class="lc-location">Barrio {i}, Bogotá, Bogotá D.C.</strong>
+          <div class="lc-typologyTag">{random.randint(1, 4)} Habs. {random.randint(1, 3)} Baños {random.randint(35, 180)} m²</div>
+          <strong class="body body-2 high">Inmobiliaria {i % 17}</strong>
+        </div>""")
+    return f"<html><body>{''.join(cards)}<a href='/pagina2'>2</a></body></html>"
+
+
+def synthetic_listing(i: int) -> dict:
+    return {
+        "card_info": {"Link": f"https://www.fincaraiz.com.co/apartamento-en-arriendo/bogota/{9000000 + i}",
+                      "Price": str(random.randint(900, 9000) * 1000), "Bedrooms": "2", "Bathrooms": "2",
+                      "Area": "70", "Agency": f"Inmobiliaria {i % 17}", "Location": f"Barrio {i}, Bogotá",
+                      "Datetime_Added": time.strftime("%Y-%m-%d %H:%M:%S")},
+        "details": {"coordinates": (4.6 + random.random() / 10, -74.1 + random.random() / 10),
+                    "administracion": random.randint(100, 900) * 1000,
+                    "facilities": {"Gimnasio", "Portería 24h", "Ascensor"},
+                    "upload_date": pd.Timestamp.now(),
+                    "technical_data": {"Estrato": "4", "Piso": str(i % 20)}},
+        "description": "Apartamento luminoso con cocina abierta y balcón. " * 8,
+        "places": [{"nombre": f"Lugar {j}", "dirección": "Calle 1 # 2-3", "tipos": ["supermarket"],
+                    "distancia_km": round(random.random(), 2)} for j in range(10)]
+    }
+
+
+'''
+BENCHMARK
+'''
+
+def benchmark_config(config: dict, workdir: str, latency_scale: float) -> dict:
+    # Fresh state, caches and outputs for every run, and every request replayed
+    config = copy.deepcopy(config)
+    config['GENERAL']['CSV_PATH'] = os.path.join(workdir, "listings.csv")
+    config['GENERAL']['STATE_PATH'] = os.path.join(workdir, "state.sqlite")
+    config['GENERAL']['SINK']['PARQUET_DIR'] = os.path.join(workdir, "parquet")
+    config['OPENAI']['CACHE']['ENABLED'] = False
+    config['MAPS_NEARBY']['CACHE']['PATH'] = os.path.join(workdir, "nearby.sqlite")
+    config['REPLAY']['MODE'] = "replay"
+    config['REPLAY']['LATENCY_SCALE'] = latency_scale
+    return config
+
+
+async def run_benchmark(args) -> dict:
+    # Same synthetic listings on every run, so results compare across commits
+    random.seed(0)
+    env_dict = load_env_variables(".env")
+    workdir = tempfile.mkdtemp(prefix="scraper-bench-")
+    config = benchmark_config(load_config("config.json"), workdir, args.latency_scale)
+    headers, proxy_server_dict, proxy_http_dict = get_proxies(env_dict, config)
+    concurrency = config['PIPELINE']['CONCURRENCY']
+    stages = set(args.stages.split(","))
+    results = {}
+
+    def new_pipeline(store):
+        return ScraperPipeline(config=config, env_dict=env_dict, headers=headers,
+                               proxy_server_dict=proxy_server_dict, proxy_http_dict=proxy_http_dict,
+                               store=store)
+
+    store = ListingStore(os.path.join(workdir, "stages.sqlite"))
+    async with new_pipeline(store) as pipeline:
+        listings_config = config['CRAWLERS']['LISTINGS']
+        typology_pattern = pipeline.typology_pattern
+
+        # Links for the detail stages come from the replayed listing pages, or the saved ones
+        async def listing_page(page_num):
+            url = listings_config['URL_TEMPLATE'].format(page=page_num)
+            html = await request_listing_html(pipeline.listing_session, url, proxy=None)
+            return parse_listing_cards(html, listings_config['PARSER'])
+
+        if args.pages:
+            pages = [open(path, "rb").read() for path in args.pages]
+            card_pages = [parse_listing_cards(html, listings_config['PARSER']) for html in pages]
+        else:
+            pages = [synthetic_listing_page(args.listings)]
+            results["listing_pages"], card_pages = await bench_stage("listing_pages", range(1, args.listing_pages + 1),
+                                                                     listing_page, listings_config['CONCURRENCY'],
+                                                                     weight=len)
+        links = [card["link"] for cards in card_pages for card in cards if card["link"]]
+        links = [links[i % len(links)] for i in range(args.listings)] if links else []
+        listings = [{"card_info": {"Link": link}} for link in links]
+
+        if "cards" in stages:
+            async def parse_page(html):
+                cards = parse_listing_cards(html, listings_config['PARSER'])
+                return [scrape_listing_card(card, (), typology_pattern) for card in cards]
+            results["cards"], _ = await bench_stage("cards", pages, parse_page, 1, weight=len)
+
+        detailed = []
+        if "details" in stages or "images" in stages or "vision" in stages or "nearby" in stages:
+            results["details"], detailed = await bench_stage("details", listings, pipeline.scrape_details,
+                                                             concurrency['DETAILS'])
+        if "browser" in stages:
+            detail_config = config['CRAWLERS']['DETAIL']
+
+            async def browser_page(listing):
+                return await scrape_details_page(headless=detail_config['HEADLESS'], proxy=None, headers=headers,
+                                                 url=listing["card_info"]["Link"], img_folder=None,
+                                                 timeout=detail_config['TIMEOUT']['REQUEST_TIMEOUT'],
+                                                 element_timeout=detail_config['TIMEOUT']['ELEMENT_TIMEOUT'],
+                                                 pool=pipeline.pool)
+            results["browser"], _ = await bench_stage("browser", listings, browser_page,
+                                                      detail_config['POOL']['CONTEXTS'])
+
+        with_images = []
+        if "images" in stages or "vision" in stages:
+            results["images"], with_images = await bench_stage("images", detailed, pipeline.collect_images,
+                                                               concurrency['IMAGES'])
+        if "vision" in stages:
+            results["vision"], _ = await bench_stage("vision", with_images,
+                                                     lambda listing: pipeline.describe(listing["images"]),
+                                                     concurrency['ENRICH'])
+        if "nearby" in stages:
+            results["nearby"], _ = await bench_stage("nearby", detailed,
+                                                     lambda listing: pipeline.nearby(listing["details"]["coordinates"]),
+                                                     concurrency['ENRICH'])
+        if "save" in stages:
+            async def save(listing):
+                await pipeline.save(listing)
+                return True
+            results["save"], _ = await bench_stage("save", [synthetic_listing(i) for i in range(args.listings)],
+                                                   save, concurrency['SINK'])
+            await asyncio.to_thread(pipeline.sink.flush)
+    store.close()
+
+    if "end_to_end" in stages:
+        config['CRAWLERS']['LISTINGS']['MAX_PAGES'] = args.listing_pages
+        store = ListingStore(os.path.join(workdir, "end_to_end.sqlite"))
+        monitor = ResourceMonitor()
+        monitor.start()
+        started = time.perf_counter()
+        async with new_pipeline(store) as pipeline:
+            await pipeline.run()
+        seconds = time.perf_counter() - started
+        done = store.stats()["done"]
+        store.close()
+        results["end_to_end"] = summarize([seconds], 0, done, seconds, await monitor.stop())
+        print(f"   end_to_end: {done} listings in {seconds:.1f}s, {results['end_to_end']['listings_per_sec']}/s")
+
+    return {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "settings": {"listings": args.listings, "listing_pages": args.listing_pages,
+                     "latency_scale": args.latency_scale, "saved_pages": len(args.pages or [])},
+        "stages": results,
+        "peak_rss_mb": max((stage["peak_rss_mb"] for stage in results.values()), default=None),
+        "peak_chromium_processes": max((stage["peak_chromium_processes"] for stage in results.values()), default=None)
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    # Throughput lower or p95 latency higher than the baseline by more than `tolerance`
+    regressions = []
+    for name, stage in results["stages"].items():
+        base = baseline.get("stages", {}).get(name)
+        if not base:
+            continue
+        if base["listings_per_sec"] and stage["listings_per_sec"] is not None and \
+                stage["listings_per_sec"] < base["listings_per_sec"] * (1 - tolerance):
+            regressions.append(f"{name}: {stage['listings_per_sec']}/s vs {base['listings_per_sec']}/s")
+        if base["p95_ms"] and stage["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {stage['p95_ms']} ms vs {base['p95_ms']} ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--listings", type=int, default=50, help="Size of the listing set")
+    parser.add_argument("--listing-pages", type=int, default=2, help="Replayed listing pages to fetch")
+    parser.add_argument("--pages", nargs="*", help="Saved listing page HTML files, instead of replayed pages")
+    parser.add_argument("--stages", default="cards,details,images,vision,nearby,save,end_to_end")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="Multiplier of the recorded latencies")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--compare", help="Results JSON of a previous commit")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    args = parser.parse_args()
+
+    results = asyncio.run(run_benchmark(args))
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output)
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"Regression against {baseline.get('commit')}: {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
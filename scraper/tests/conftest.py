@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The scraper modules import each other as `utils.…`, relative to scraper/
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
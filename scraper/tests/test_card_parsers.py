@@ -0,0 +1,44 @@
+import pytest
+
+pytest.importorskip("lxml")
+
+from utils.crawler.card_parsers import parse_cards_bs4, parse_cards_lxml
+
+CARD = """
+<div class="listingCard">
+    <a class="lc-cardCover" href="/apartamento-en-arriendo/bogota/19123456{index}"></a>
+    <div class="lc-price"><span>$ 2.500.000</span></div>
+    <strong class="lc-location">Chapinero, Bogotá</strong>
+    <div class="lc-typologyTag">3 Habs. 2 Baños 85 m²</div>
+    <strong class="body body-2 high">Inmobiliaria Ñandú</strong>
+</div>
+"""
+
+
+def page(head: str = "") -> bytes:
+    cards = "".join(CARD.format(index=index) for index in range(3))
+    return f"<html><head>{head}</head><body>{cards}</body></html>".encode("utf-8")
+
+
+def without_timestamp(records: list) -> list:
+    return [{key: value for key, value in record.items() if key != "added_at"} for record in records]
+
+
+@pytest.mark.parametrize("head", ["", '<meta charset="utf-8">'])
+def test_backends_agree(head):
+    html = page(head)
+    records = without_timestamp(parse_cards_lxml(html))
+    assert records == without_timestamp(parse_cards_bs4(html))
+    assert len(records) == 3
+    assert records[0]["typology"] == "3 Habs. 2 Baños 85 m²"
+    assert records[0]["agency"] == "Inmobiliaria Ñandú"
+
+
+def test_backends_agree_on_text():
+    html = page().decode("utf-8")
+    assert without_timestamp(parse_cards_lxml(html)) == without_timestamp(parse_cards_bs4(html))
+
+
+def test_empty_page():
+    assert parse_cards_lxml(b"") == []
+    assert parse_cards_bs4(b"<html></html>") == []
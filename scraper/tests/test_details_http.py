@@ -0,0 +1,116 @@
+import json
+import pytest
+
+for module in ("aiohttp", "bs4"):
+    pytest.importorskip(module)
+pd = pytest.importorskip("pandas")
+
+from utils.crawler.details_http import parse_details_html, to_int, to_naive_utc
+
+NEXT_DATA = {
+    "latitude": 4.6097,
+    "longitude": -74.0817,
+    "price": {"amount": 2500000},
+    "commonExpenses": {"amount": 350000},
+    "facilities": [{"name": "Gimnasio"}, "Piscina"],
+    "technicalSheet": [{"text": "Estrato", "value": "4"}, {"text": "Parqueaderos", "value": None}],
+    "created_at": "2025-04-05T15:00:00-05:00",
+    "description": "Apartamento iluminado",
+    "images": [{"image": "https://img.example.com/1.jpg"}, {}]
+}
+
+DOM = """
+<div class="property-price-tag">
+    <span class="price">$ 2.500.000</span>
+    <span class="commonExpenses">+ $ 350.000 admin.</span>
+</div>
+<div class="property-facilities">
+    <div class="ant-row"><span class="ant-typography">Gimnasio</span></div>
+    <div class="ant-row"><span class="ant-typography body">Not a label</span></div>
+</div>
+<div class="technical-sheet">
+    <div class="ant-row">
+        <span class="ant-typography">Estrato</span>
+        <div class="ant-typography ant-typography-ellipsis ant-typography-ellipsis-multiple-line"><strong>4</strong></div>
+    </div>
+</div>
+<div class="ant-typography property-description body body-regular body-1 high"><span>Apartamento iluminado</span></div>
+<span class="ant-typography" style="font-size:13px">Publicado el 5 de abril de 2025</span>
+"""
+
+
+def page(next_data: dict = None, body: str = "") -> str:
+    script = ""
+    if next_data is not None:
+        payload = json.dumps({"props": {"pageProps": {"data": next_data}}})
+        script = f'<script id="__NEXT_DATA__" type="application/json">{payload}</script>'
+    return f"<html><body>{body}{script}</body></html>"
+
+
+def test_to_int():
+    assert to_int("$ 350.000") == 350000
+    assert to_int(350000.0) == 350000
+    assert to_int("") is None
+    assert to_int(True) is None
+
+
+def test_to_naive_utc():
+    assert to_naive_utc("2025-04-05T15:00:00-05:00") == pd.Timestamp("2025-04-05 20:00:00")
+    assert to_naive_utc("not a date") is None
+
+
+def test_details_from_next_data():
+    details = parse_details_html(page(NEXT_DATA))
+    assert details == {
+        "coordinates": (4.6097, -74.0817),
+        "price": 2500000,
+        "administracion": 350000,
+        "facilities": {"Gimnasio", "Piscina"},
+        "upload_date": pd.Timestamp("2025-04-05 20:00:00"),
+        "technical_data": {"Estrato": "4"},
+        "description": "Apartamento iluminado",
+        "image_urls": ["https://img.example.com/1.jpg"],
+        "missing_fields": []
+    }
+
+
+def test_location_point_is_read_as_lat_lng():
+    data = {"locations": {"location_point": "POINT (-74.0817 4.6097)"}}
+    assert parse_details_html(page(data))["coordinates"] == (4.6097, -74.0817)
+
+
+def test_explicit_nulls_in_next_data():
+    data = dict(NEXT_DATA, latitude=None, locations=None, images=None)
+    details = parse_details_html(page(data))
+    assert details["coordinates"] is None
+    assert details["missing_fields"] == ["coordinates", "image_urls"]
+    assert parse_details_html(page(dict(NEXT_DATA, images=[])))["missing_fields"] == []
+
+
+def test_details_from_dom():
+    details = parse_details_html(page(body=DOM))
+    assert details["price"] == 2500000
+    assert details["administracion"] == 350000
+    assert details["facilities"] == {"Gimnasio"}
+    assert details["technical_data"] == {"Estrato": "4"}
+    assert details["description"] == "Apartamento iluminado"
+    assert details["upload_date"] == pd.Timestamp("2025-04-05")
+    # The map is only drawn in the browser, and the gallery is only in __NEXT_DATA__
+    assert details["missing_fields"] == ["coordinates", "image_urls"]
+    assert details["image_urls"] == []
+
+
+def test_dom_fills_the_gaps_of_next_data():
+    data = {key: value for key, value in NEXT_DATA.items() if key not in ("description", "commonExpenses")}
+    details = parse_details_html(page(data, DOM))
+    assert details["description"] == "Apartamento iluminado"
+    assert details["administracion"] == 350000
+    assert details["missing_fields"] == []
+
+
+def test_missing_sections_are_reported():
+    details = parse_details_html(page(body="<p>Sin datos</p>"))
+    assert details["missing_fields"] == ["coordinates", "administracion", "facilities", "upload_date",
+                                         "technical_data", "description", "image_urls"]
+    assert details["facilities"] == []
+    assert details["price"] is None
@@ -0,0 +1,62 @@
+import math
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from utils.processing.geocalc import (calculate_distance, haversine_one_to_many, haversine_matrix, find_close_pairs,
+                                      pixel_to_latlng, pixels_to_latlng, encode_geohash, decode_geohash)
+
+# Bogotá, Medellín, Cali and a point ~50 m from the first
+LATS = [4.7110, 6.2442, 3.4516, 4.7114]
+LNGS = [-74.0721, -75.5812, -76.5320, -74.0722]
+
+
+def scalar_haversine(lat1, lng1, lat2, lng2):
+    dlat = math.radians(lat2 - lat1)
+    dlng = math.radians(lng2 - lng1)
+    a = math.sin(dlat / 2)**2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlng / 2)**2
+    return 2 * 6371.0 * math.asin(math.sqrt(a))
+
+
+def test_one_to_many_matches_the_scalar_formula():
+    distances = haversine_one_to_many(LATS[0], LNGS[0], LATS, LNGS)
+    expected = [scalar_haversine(LATS[0], LNGS[0], lat, lng) for lat, lng in zip(LATS, LNGS)]
+    assert distances == pytest.approx(expected)
+    assert distances[0] == 0
+    assert calculate_distance(LATS[0], LNGS[0], LATS[1], LNGS[1]) == pytest.approx(expected[1])
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 1024])
+def test_matrix_is_the_same_for_every_chunk_size(chunk_size):
+    matrix = haversine_matrix(LATS, LNGS, chunk_size=chunk_size)
+    assert matrix.shape == (4, 4)
+    assert matrix == pytest.approx(matrix.T)
+    for i in range(4):
+        assert matrix[i] == pytest.approx(haversine_one_to_many(LATS[i], LNGS[i], LATS, LNGS))
+
+
+def test_matrix_between_two_sets():
+    matrix = haversine_matrix(LATS[:2], LNGS[:2], LATS[2:], LNGS[2:], chunk_size=1)
+    assert matrix.shape == (2, 2)
+    assert matrix[0, 1] == pytest.approx(scalar_haversine(LATS[0], LNGS[0], LATS[3], LNGS[3]))
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 1024])
+def test_close_pairs(chunk_size):
+    assert find_close_pairs(LATS, LNGS, threshold_km=0.1, chunk_size=chunk_size) == [(0, 3)]
+    assert len(find_close_pairs(LATS, LNGS, threshold_km=1000, chunk_size=chunk_size)) == 6
+
+
+def test_batched_pixels_match_the_scalar_conversion():
+    pixels_x = [0, 12345.5, 256 * 2**15 / 2]
+    pixels_y = [256 * 2**15 / 2, 98765.25, 0]
+    lats, lngs = pixels_to_latlng(pixels_x, pixels_y, 15)
+    for x, y, lat, lng in zip(pixels_x, pixels_y, lats, lngs):
+        assert (lat, lng) == pytest.approx(pixel_to_latlng(x, y, 15))
+
+
+def test_geohash_round_trip():
+    geohash = encode_geohash(LATS[0], LNGS[0], 7)
+    assert len(geohash) == 7
+    lat, lng = decode_geohash(geohash)[:2]
+    assert calculate_distance(LATS[0], LNGS[0], lat, lng) < 0.2
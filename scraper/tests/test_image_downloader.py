@@ -0,0 +1,38 @@
+import asyncio
+import pytest
+
+aiohttp = pytest.importorskip("aiohttp")
+
+from utils.crawler.image_downloader import ImageDownloader
+
+
+class Content:
+    def __init__(self, chunks: list, fail_after: int = None):
+        self.chunks = chunks
+        self.fail_after = fail_after
+
+    async def iter_chunked(self, size):
+        for index, chunk in enumerate(self.chunks):
+            if index == self.fail_after:
+                raise aiohttp.ClientPayloadError("connection reset")
+            yield chunk
+
+
+class Response:
+    def __init__(self, content: Content):
+        self.content = content
+
+
+def test_stream_to_file(tmp_path):
+    filename = str(tmp_path / "image.jpg")
+    size = asyncio.run(ImageDownloader()._stream_to_file(Response(Content([b"ab", b"cd"])), filename))
+    assert size == 4
+    assert (tmp_path / "image.jpg").read_bytes() == b"abcd"
+    assert [path.name for path in tmp_path.iterdir()] == ["image.jpg"]
+
+
+def test_interrupted_stream_leaves_no_partial_file(tmp_path):
+    filename = str(tmp_path / "image.jpg")
+    with pytest.raises(aiohttp.ClientPayloadError):
+        asyncio.run(ImageDownloader()._stream_to_file(Response(Content([b"ab", b"cd"], fail_after=1)), filename))
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,45 @@
+import re
+import pytest
+
+for module in ("aiohttp", "requests", "bs4"):
+    pytest.importorskip(module)
+
+from utils.crawler.listings_crawler import parse_last_page, scrape_listing_card
+
+TYPOLOGY_PATTERN = re.compile(r"(\d+)\s*Habs\.?\s*(\d+)\s*Baño[s]?\s*(\d+)\s*m²")
+LINK = "https://www.fincaraiz.com.co/apartamento-en-arriendo/bogota/191234567"
+
+
+@pytest.mark.parametrize("html, last_page", [
+    ('<a href="/arriendo/bogota/pagina2">2</a><a rel="last" href="/arriendo/bogota/pagina40">»</a>', 40),
+    ('<link href="/arriendo/bogota/pagina12" rel="last">', 12),
+    (b'<script>{"pagination":{"totalPages":17}}</script>', 17),
+    # A windowed paginator only shows the pages around the current one
+    ('<a href="/arriendo/bogota/pagina2">2</a><a href="/arriendo/bogota/pagina7">7</a>', None),
+    ('', None),
+])
+def test_parse_last_page(html, last_page):
+    assert parse_last_page(html) == last_page
+
+
+def card(**overrides) -> dict:
+    return {"link": LINK, "price": "$ 2.500.000", "typology": "3 Habs. 2 Baños 85 m²",
+            "agency": "Inmobiliaria", "location": "Chapinero, Bogotá", "added_at": "2025-04-05 10:00:00",
+            **overrides}
+
+
+def test_scrape_listing_card():
+    assert scrape_listing_card(card(), (), TYPOLOGY_PATTERN) == {
+        "Link": LINK, "Price": "2500000", "Bedrooms": "3", "Bathrooms": "2", "Area": "85",
+        "Agency": "Inmobiliaria", "Location": "Chapinero, Bogotá", "Datetime_Added": "2025-04-05 10:00:00"}
+
+
+def test_scrape_listing_card_skips_known_and_linkless_cards():
+    assert scrape_listing_card(card(), {LINK}, TYPOLOGY_PATTERN) is None
+    assert scrape_listing_card(card(link=None), (), TYPOLOGY_PATTERN) is None
+
+
+def test_scrape_listing_card_without_price_or_typology():
+    card_info = scrape_listing_card(card(price=None, typology="Lote"), (), TYPOLOGY_PATTERN)
+    assert card_info["Price"] is None
+    assert (card_info["Bedrooms"], card_info["Bathrooms"], card_info["Area"]) == (None, None, None)
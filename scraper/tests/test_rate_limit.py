@@ -0,0 +1,124 @@
+import asyncio
+import pytest
+from utils.connection.rate_limit import HostLimiter, RateLimiter, Slot, parse_retry_after
+
+DEFAULT = {"RATE": 1000, "BURST": 100, "MIN_CONCURRENCY": 1, "MAX_CONCURRENCY": 8,
+           "INITIAL_CONCURRENCY": 4, "DECREASE_FACTOR": 0.5, "DECREASE_COOLDOWN": 60}
+
+
+class Response:
+    def __init__(self, status, headers=None):
+        self.status = status
+        self.headers = headers or {}
+
+
+def host_limiter(**overrides) -> HostLimiter:
+    config = {**DEFAULT, **overrides}
+    return HostLimiter(host="example.com",
+                       rate=config['RATE'],
+                       burst=config['BURST'],
+                       min_concurrency=config['MIN_CONCURRENCY'],
+                       max_concurrency=config['MAX_CONCURRENCY'],
+                       initial_concurrency=config['INITIAL_CONCURRENCY'],
+                       decrease_factor=config['DECREASE_FACTOR'],
+                       decrease_cooldown=config['DECREASE_COOLDOWN'])
+
+
+async def request(limiter: HostLimiter, outcome: str, retry_after: float = None) -> None:
+    await limiter.acquire()
+    await limiter.release(outcome, retry_after)
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after("-1") == 0.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("soon") is None
+
+
+@pytest.mark.parametrize("status, cancelled, outcome", [
+    (200, False, "ok"), (404, False, "ok"), (429, False, "throttled"), (503, False, "error"),
+    (None, False, "error"), (None, True, "cancelled"), (200, True, "ok")])
+def test_slot_outcome(status, cancelled, outcome):
+    slot = Slot()
+    if status is not None:
+        slot.record(Response(status, {"Retry-After": "2"}))
+    slot.cancelled = cancelled
+    assert slot.outcome() == outcome
+
+
+def test_successes_widen_the_window_additively():
+    limiter = host_limiter()
+    for _ in range(4):
+        asyncio.run(request(limiter, "ok"))
+    # Four successes at a window of ~4 add about one slot
+    assert 4.9 < limiter.concurrency < 5.0
+    for _ in range(100):
+        asyncio.run(request(limiter, "ok"))
+    assert limiter.concurrency == DEFAULT['MAX_CONCURRENCY']
+
+
+def test_failures_shrink_the_window_once_per_cooldown():
+    limiter = host_limiter()
+    asyncio.run(request(limiter, "throttled"))
+    asyncio.run(request(limiter, "error"))
+    assert limiter.concurrency == 2
+    limiter._last_decrease -= DEFAULT['DECREASE_COOLDOWN']
+    asyncio.run(request(limiter, "error"))
+    limiter._last_decrease -= DEFAULT['DECREASE_COOLDOWN']
+    asyncio.run(request(limiter, "error"))
+    assert limiter.concurrency == DEFAULT['MIN_CONCURRENCY']
+
+
+def test_cancelled_requests_leave_the_window_alone():
+    limiter = host_limiter()
+    asyncio.run(request(limiter, "cancelled"))
+    assert limiter.concurrency == DEFAULT['INITIAL_CONCURRENCY']
+    assert limiter.stats()["cancelled"] == 1
+    assert limiter.in_flight == 0
+
+
+def test_retry_after_pauses_the_host():
+    limiter = host_limiter()
+    asyncio.run(request(limiter, "throttled", retry_after=30))
+    assert limiter.paused_until - limiter._updated > 29
+
+
+def test_acquire_waits_for_a_free_slot():
+    async def run():
+        limiter = host_limiter(INITIAL_CONCURRENCY=1)
+        await limiter.acquire()
+        waiting = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0.01)
+        assert not waiting.done()
+        await limiter.release("ok")
+        await asyncio.wait_for(waiting, 1)
+        assert limiter.in_flight == 1
+    asyncio.run(run())
+
+
+def test_cancelled_request_is_counted_as_cancelled():
+    async def run():
+        limiter = RateLimiter({"DEFAULT": DEFAULT, "HOSTS": {}})
+
+        async def hanging():
+            async with limiter.limit("https://example.com/a"):
+                await asyncio.sleep(10)
+
+        task = asyncio.create_task(hanging())
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return limiter.stats()["example.com"]
+    stats = asyncio.run(run())
+    assert stats["cancelled"] == 1
+    assert stats["in_flight"] == 0
+    assert stats["concurrency"] == DEFAULT['INITIAL_CONCURRENCY']
+
+
+def test_host_settings_override_the_default():
+    limiter = RateLimiter({"DEFAULT": DEFAULT, "HOSTS": {"slow.example.com": {"MAX_CONCURRENCY": 2}}})
+    assert limiter.host("https://slow.example.com/x").max_concurrency == 2
+    assert limiter.host("https://example.com/x").max_concurrency == DEFAULT['MAX_CONCURRENCY']
+    assert limiter.host("https://example.com/y") is limiter.host("https://example.com/x")
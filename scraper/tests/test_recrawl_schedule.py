@@ -0,0 +1,93 @@
+import time
+import pytest
+
+pytest.importorskip("pandas")
+
+from utils.connection.listing_store import ListingStore
+from utils.connection.recrawl_schedule import (RecrawlSchedule, details_fingerprint, images_fingerprint,
+                                               coordinates_key)
+
+HOUR = 3600
+LINK = "https://www.fincaraiz.com.co/apartamento-en-arriendo/bogota/191234567"
+RECRAWL = {"INITIAL_INTERVAL_HOURS": 48, "MIN_INTERVAL_HOURS": 12, "MAX_INTERVAL_HOURS": 336,
+           "BACKOFF": 2.0, "MAX_FAILURES": 3}
+
+
+@pytest.fixture
+def schedule(tmp_path):
+    path = str(tmp_path / "state.sqlite")
+    store = ListingStore(path)
+    for stage, value in (("card_info", {"Link": LINK}), ("details", {}), ("description", "Bonito"), ("places", [])):
+        store.save_stage(LINK, stage, value)
+    store.mark_done(LINK)
+    # Imported from the CSV history: no stages to carry over into a refreshed row
+    store.mark_done("https://www.fincaraiz.com.co/apartamento-en-arriendo/bogota/191234568")
+    schedule = RecrawlSchedule(path, RECRAWL)
+    schedule.sync()
+    yield schedule
+    schedule.close()
+    store.close()
+
+
+def entry(schedule):
+    return schedule._conn.execute("""
+        SELECT interval, next_check - last_checked, changes, failures FROM recrawl
+    """).fetchone()
+
+
+def make_due(schedule):
+    schedule._conn.execute("UPDATE recrawl SET next_check = ?", (time.time() - 1,))
+
+
+def test_sync_schedules_finished_listings_once(schedule):
+    assert schedule.sync() == 0
+    assert schedule.stats()["scheduled"] == 1
+    interval, delay, changes, failures = entry(schedule)
+    assert interval == delay == 48 * HOUR
+    assert schedule.due(10) == []
+
+
+def test_quiet_checks_back_off_up_to_the_maximum(schedule):
+    for expected in (96, 192, 336, 336):
+        schedule.record(LINK, changed=False)
+        assert entry(schedule)[0] == expected * HOUR
+
+
+def test_changes_halve_the_interval_down_to_the_minimum(schedule):
+    for expected in (24, 12, 12):
+        schedule.record(LINK, changed=True)
+        assert entry(schedule)[0] == expected * HOUR
+    assert entry(schedule)[2] == 3
+
+
+def test_record_stores_fields_returned_by_due(schedule):
+    schedule.record(LINK, changed=False, etag='"abc"', fingerprint="f", extractor="http")
+    make_due(schedule)
+    due, = schedule.due(10)
+    assert (due["link"], due["etag"], due["fingerprint"], due["extractor"]) == (LINK, '"abc"', "f", "http")
+
+
+def test_failures_back_off_then_park_and_reset(schedule):
+    for failures, delay in ((1, 12), (2, 24), (3, 336), (4, 336)):
+        schedule.record_failure(LINK)
+        assert entry(schedule)[1:] == (delay * HOUR, 0, failures)
+    assert entry(schedule)[0] == 48 * HOUR
+    assert schedule.stats()["failing"] == 1
+    schedule.record(LINK, changed=False)
+    assert entry(schedule)[3] == 0
+
+
+def test_delisted_listings_are_never_due(schedule):
+    make_due(schedule)
+    schedule.mark_delisted(LINK)
+    assert schedule.due(10) == []
+    assert schedule.stats()["delisted"] == 1
+
+
+def test_fingerprints_ignore_gallery_order_and_geocoding_noise():
+    details = {"coordinates": (4.6097101, -74.0817501), "price": 2500000, "image_urls": ["a", "b"]}
+    reordered = dict(details, image_urls=["b", "a"])
+    assert images_fingerprint(details) == images_fingerprint(reordered)
+    assert details_fingerprint(details) != details_fingerprint(dict(details, price=2400000))
+    assert coordinates_key(details) == coordinates_key({"coordinates": (4.609710149, -74.081750149)})
+    assert coordinates_key({"coordinates": (None, None)}) is None
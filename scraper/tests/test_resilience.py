@@ -0,0 +1,127 @@
+import asyncio
+import pytest
+
+aiohttp = pytest.importorskip("aiohttp")
+
+from multidict import CIMultiDict, CIMultiDictProxy
+from yarl import URL
+from utils.connection.resilience import CircuitBreaker, CircuitOpenError, Resilience, classify_error
+
+DEFAULT = {"ATTEMPTS": 3, "BACKOFF": 0.0, "MAX_BACKOFF": 0.0, "HEDGE_DELAY": None,
+           "BREAKER_FAILURES": 5, "BREAKER_COOLDOWN": 60}
+
+
+def response_error(status: int) -> aiohttp.ClientResponseError:
+    # A real RequestInfo, since the retry message formats the error with its URL
+    url = URL("https://www.fincaraiz.com.co/apartamento-en-arriendo/bogota/191234567")
+    request_info = aiohttp.RequestInfo(url=url, method="GET", headers=CIMultiDictProxy(CIMultiDict()), real_url=url)
+    return aiohttp.ClientResponseError(request_info=request_info, history=(), status=status)
+
+
+def open_breaker(breaker: CircuitBreaker) -> None:
+    for _ in range(breaker.failures):
+        breaker.before_call()
+        breaker.record_failure()
+
+
+def test_classify_error():
+    assert classify_error(response_error(429)) == "throttled"
+    assert classify_error(response_error(503)) == "server"
+    assert classify_error(response_error(404)) == "fatal"
+    assert classify_error(asyncio.TimeoutError()) == "timeout"
+    assert classify_error(aiohttp.ClientConnectionError()) == "connection"
+    assert classify_error(ValueError()) == "fatal"
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker("places", failures=3, cooldown=60)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == "closed"
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_half_open_breaker_lets_one_trial_through():
+    breaker = CircuitBreaker("places", failures=2, cooldown=60)
+    open_breaker(breaker)
+    breaker.opened_at -= 60
+    breaker.before_call()
+    assert breaker.state == "half_open"
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == "closed"
+    breaker.before_call()
+
+
+def test_failed_trial_opens_the_breaker_again():
+    breaker = CircuitBreaker("places", failures=2, cooldown=60)
+    open_breaker(breaker)
+    breaker.opened_at -= 60
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    assert breaker.opens == 2
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_call_retries_retryable_errors():
+    calls = []
+
+    async def request():
+        calls.append(1)
+        if len(calls) < 3:
+            raise response_error(503)
+        return "ok"
+
+    resilience = Resilience({"DEFAULT": DEFAULT, "ENDPOINTS": {}})
+    assert asyncio.run(resilience.call("details", request)) == "ok"
+    assert len(calls) == 3
+    assert resilience.stats()["counters"] == {"details.retries.server": 2}
+
+
+def test_call_does_not_retry_fatal_errors():
+    calls = []
+
+    async def request():
+        calls.append(1)
+        raise response_error(404)
+
+    resilience = Resilience({"DEFAULT": DEFAULT, "ENDPOINTS": {}})
+    with pytest.raises(aiohttp.ClientResponseError):
+        asyncio.run(resilience.call("details", request))
+    assert len(calls) == 1
+    assert resilience.breakers["details"].consecutive_failures == 0
+
+
+def test_open_breaker_rejects_calls_without_requesting():
+    async def request():
+        raise aiohttp.ClientConnectionError()
+
+    resilience = Resilience({"DEFAULT": DEFAULT, "ENDPOINTS": {"places": {"ATTEMPTS": 1, "BREAKER_FAILURES": 2}}})
+    for _ in range(2):
+        with pytest.raises(aiohttp.ClientConnectionError):
+            asyncio.run(resilience.call("places", request))
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(resilience.call("places", request))
+    assert resilience.stats()["breakers"] == {"places": "open"}
+
+
+def test_hedge_wins_when_the_first_request_stalls():
+    calls = []
+
+    async def request():
+        calls.append(1)
+        if len(calls) == 1:
+            await asyncio.sleep(10)
+        return len(calls)
+
+    resilience = Resilience({"DEFAULT": {**DEFAULT, "HEDGE_DELAY": 0.01}, "ENDPOINTS": {}})
+    assert asyncio.run(resilience.call("details", request)) == 2
+    assert resilience.stats()["counters"] == {"details.hedges": 1, "details.hedge_wins": 1}
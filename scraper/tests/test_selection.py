@@ -0,0 +1,52 @@
+import io
+import pytest
+
+pytest.importorskip("numpy")
+Image = pytest.importorskip("PIL.Image")
+
+from utils.processing.selection import cluster_near_duplicates, hamming_distance, select_diverse_images
+
+
+def encode(image, image_format: str = "PNG") -> bytes:
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format)
+    return buffer.getvalue()
+
+
+def gradient(vertical: bool = False, colour: tuple = (255, 255, 255)):
+    # Brightness grows left to right (or top to bottom), so every dHash bit is set (or none is)
+    image = Image.new("RGB", (64, 64))
+    image.putdata([tuple(int(c * (y if vertical else x) / 63) for c in colour)
+                   for y in range(64) for x in range(64)])
+    return image
+
+
+def test_hamming_distance():
+    assert hamming_distance(0b1011, 0b1011) == 0
+    assert hamming_distance(0b1011, 0b0110) == 3
+
+
+def test_cluster_near_duplicates():
+    fingerprints = [(0b0000, None), (0b1111, None), (0b0001, None), (0b1110, None)]
+    assert cluster_near_duplicates(fingerprints, max_hamming=1) == [[0, 2], [1, 3]]
+    assert cluster_near_duplicates(fingerprints, max_hamming=0) == [[0], [1], [2], [3]]
+
+
+def test_near_duplicates_are_collapsed_and_gallery_order_kept():
+    horizontal = encode(gradient())
+    recompressed = encode(gradient(), "JPEG")
+    vertical = encode(gradient(vertical=True))
+    images = [horizontal, recompressed, b"not an image", vertical]
+    assert select_diverse_images(images, k=3, max_hamming=10) == [horizontal, vertical]
+
+
+def test_cover_photo_comes_first_and_k_is_respected():
+    cover = encode(gradient())
+    others = [encode(gradient(vertical=True)), encode(gradient(colour=(255, 0, 0), vertical=True))]
+    assert select_diverse_images([cover] + others, k=1, max_hamming=10) == [cover]
+    assert len(select_diverse_images([cover] + others, k=2, max_hamming=0)) == 2
+
+
+def test_undecodable_images_fall_back_to_the_first_k():
+    images = [b"a", b"b", b"c"]
+    assert select_diverse_images(images, k=2, max_hamming=10) == [b"a", b"b"]
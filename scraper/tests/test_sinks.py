@@ -0,0 +1,62 @@
+import csv
+import pytest
+
+for module in ("aiohttp", "pandas", "pyarrow"):
+    pytest.importorskip(module)
+
+from utils.connection.sinks import BufferedSink, CsvSink
+
+
+class FlakySink:
+    nested = False
+
+    def __init__(self, failures: int = 0):
+        self.failures = failures
+        self.batches = []
+
+    def write(self, rows: list) -> None:
+        if self.failures:
+            self.failures -= 1
+            raise OSError("disk full")
+        self.batches.append(list(rows))
+
+
+def test_flushes_every_flush_rows():
+    sink = FlakySink()
+    flushed = []
+    buffered = BufferedSink(sink, flush_rows=2, flush_seconds=60, on_flush=flushed.extend)
+    for link in ("a", "b", "c"):
+        buffered.add({"Link": link})
+    assert sink.batches == [[{"Link": "a"}, {"Link": "b"}]]
+    assert flushed == [{"Link": "a"}, {"Link": "b"}]
+    buffered.flush_if_due()
+    assert len(sink.batches) == 1
+    buffered.flush()
+    assert sink.batches[-1] == [{"Link": "c"}]
+
+
+def test_failed_write_keeps_the_rows_for_the_next_flush():
+    sink = FlakySink(failures=1)
+    flushed = []
+    buffered = BufferedSink(sink, flush_rows=10, flush_seconds=60, on_flush=flushed.extend)
+    buffered.add({"Link": "a"})
+    with pytest.raises(OSError):
+        buffered.flush()
+    assert flushed == []
+    buffered.add({"Link": "b"})
+    buffered.flush()
+    assert sink.batches == [[{"Link": "a"}, {"Link": "b"}]]
+    assert flushed == [{"Link": "a"}, {"Link": "b"}]
+
+
+def test_csv_sink_adds_new_columns_to_an_existing_file(tmp_path):
+    path = str(tmp_path / "listings.csv")
+    sink = CsvSink(path)
+    sink.write([{"Link": "a", "Price": "1"}])
+    sink.write([{"Link": "b", "Price": "2", "Datetime_Scraped": "2025-04-05 10:00:00"}])
+    sink.write([{"Price": "3", "Link": "c"}])
+    with open(path, newline="", encoding="utf-8") as file:
+        rows = list(csv.DictReader(file))
+    assert rows == [{"Link": "a", "Price": "1", "Datetime_Scraped": ""},
+                    {"Link": "b", "Price": "2", "Datetime_Scraped": "2025-04-05 10:00:00"},
+                    {"Link": "c", "Price": "3", "Datetime_Scraped": ""}]
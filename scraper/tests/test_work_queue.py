@@ -0,0 +1,109 @@
+import time
+import pytest
+from utils.connection.work_queue import WorkQueue
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = WorkQueue(str(tmp_path / "queue.sqlite"), lease_seconds=60, max_attempts=2)
+    yield queue
+    queue.close()
+
+
+def expire_leases(queue):
+    queue._conn.execute("UPDATE tasks SET lease_until = ? WHERE state = 'leased'", (time.time() - 1,))
+
+
+def test_put_is_idempotent(queue):
+    assert queue.put("listing", "1", {"link": "a"})
+    assert not queue.put("listing", "1", {"link": "a"})
+    assert queue.stats() == {"listing": {"queued": 1}}
+
+
+def test_claim_prefers_pages_and_leases_once(queue):
+    queue.put("listing", "1", {"link": "a"})
+    queue.put("page", "1", {"page": 1})
+    claimed = queue.claim("w1", limit=1)
+    assert [task["id"] for task in claimed] == ["page:1"]
+    assert claimed[0]["attempts"] == 1
+    assert [task["id"] for task in queue.claim("w2", limit=5)] == ["listing:1"]
+    assert queue.claim("w3", limit=5) == []
+
+
+def test_complete_requires_the_lease(queue):
+    queue.put("page", "1", {"page": 1})
+    queue.claim("w1")
+    assert not queue.complete("page:1", "w2", {"cards": 0})
+    assert queue.complete("page:1", "w1", {"cards": 0})
+    assert queue.results(["page:1"]) == {"page:1": {"cards": 0}}
+
+
+def test_expired_lease_is_claimed_again_and_lost_to_the_old_worker(queue):
+    queue.put("listing", "1", {"link": "a"})
+    queue.claim("w1")
+    expire_leases(queue)
+    claimed = queue.claim("w2")
+    assert claimed[0]["attempts"] == 2
+    assert queue.heartbeat("w1", ["listing:1"]) == ["listing:1"]
+    assert queue.heartbeat("w2", ["listing:1"]) == []
+    assert not queue.complete("listing:1", "w1")
+
+
+def test_expired_lease_fails_after_max_attempts(queue):
+    queue.put("listing", "1", {"link": "a"})
+    queue.claim("w1")
+    expire_leases(queue)
+    assert queue.requeue_expired() == {"requeued": 1, "failed": 0}
+    queue.claim("w1")
+    expire_leases(queue)
+    assert queue.requeue_expired() == {"requeued": 0, "failed": 1}
+    assert queue.results(["listing:1"]) == {"listing:1": None}
+
+
+def test_fail_requeues_until_max_attempts(queue):
+    queue.put("listing", "1", {"link": "a"})
+    queue.claim("w1")
+    queue.fail("listing:1", "w1", "boom")
+    assert queue.stats() == {"listing": {"queued": 1}}
+    queue.claim("w1")
+    queue.fail("listing:1", "w1", "boom")
+    assert queue.stats() == {"listing": {"failed": 1}}
+
+
+def test_finished_waits_for_close_and_other_workers(queue):
+    run_id = queue.open_run()
+    queue.put("listing", "1", {"link": "a"})
+    queue.claim("w1")
+    assert not queue.finished("w1", run_id)
+    queue.close_run()
+    assert not queue.finished("w2", run_id)
+    assert queue.finished("w1", run_id)
+    queue.complete("listing:1", "w1")
+    assert queue.finished("w2", run_id)
+    assert queue.drained()
+
+
+def test_workers_wait_for_an_open_run(queue):
+    assert queue.current_run() is None
+    previous_run = queue.open_run()
+    assert queue.current_run() == previous_run
+    queue.close_run()
+    # A worker started between runs must not take the previous close as its own
+    assert queue.current_run() is None
+    run_id = queue.open_run()
+    assert run_id != previous_run
+    assert queue.current_run() == run_id
+    assert not queue.finished("w1", run_id)
+    assert not queue.drained()
+    queue.close_run()
+    assert queue.finished("w1", run_id)
+    assert not queue.finished("w1", previous_run)
+
+
+def test_open_run_drops_finished_tasks_only(queue):
+    queue.put("listing", "1", {"link": "a"})
+    queue.put("listing", "2", {"link": "b"})
+    queue.claim("w1", limit=1)
+    queue.complete("listing:1", "w1")
+    queue.open_run()
+    assert queue.stats() == {"listing": {"queued": 1}}
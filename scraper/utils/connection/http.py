@@ -0,0 +1,13 @@
+import aiohttp
+
+
+def create_http_session(headers: dict,
+                        limit_per_host: int,
+                        timeout: int,
+                        verify_ssl: bool = False) -> aiohttp.ClientSession:
+    # One pooled keep-alive session shared by every request of a crawler.
+    # Certificates are only checked for the APIs, the proxies intercept TLS
+    connector = aiohttp.TCPConnector(limit_per_host=limit_per_host, ssl=verify_ssl)
+    return aiohttp.ClientSession(headers=headers,
+                                 connector=connector,
+                                 timeout=aiohttp.ClientTimeout(total=timeout))
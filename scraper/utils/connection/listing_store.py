@@ -0,0 +1,176 @@
+import os
+import re
+import csv
+import json
+import time
+import sqlite3
+import threading
+import pandas as pd
+
+
+'''
+SERIALIZATION
+'''
+
+def to_json_value(obj):
+    # json.dumps default= hook for the types found in card_info and details
+    if isinstance(obj, set):
+        return sorted(obj)
+    if isinstance(obj, pd.Timestamp):
+        return None if pd.isna(obj) else obj.isoformat()
+    if obj is pd.NaT:
+        return None
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def decode_details(details: dict) -> dict:
+    # Restores the Python types scrape_details returns
+    if details.get("coordinates") is not None:
+        details["coordinates"] = tuple(details["coordinates"])
+    if isinstance(details.get("facilities"), list):
+        details["facilities"] = set(details["facilities"])
+    if details.get("upload_date"):
+        details["upload_date"] = pd.to_datetime(details["upload_date"])
+    return details
+
+
+def listing_id(link: str) -> str:
+    # Listing links end with the numeric property id
+    match = re.search(r"/(\d+)/?$", link or "")
+    return match.group(1) if match else link
+
+
+'''
+LISTING STORE
+'''
+
+STAGES = ("card_info", "details", "description", "places")
+
+
+class ListingStore:
+    """
+    Embedded SQLite (WAL) index of listings by id. Each listing records the
+    output of every finished stage, so a restarted run can skip completed
+    listings and resume partial ones where they stopped. Membership
+    (`link in store`) is an indexed lookup, so it can stand in for the
+    existing_links set.
+    """
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS listings (
+                id TEXT PRIMARY KEY,
+                link TEXT NOT NULL,
+                done INTEGER NOT NULL DEFAULT 0,
+                card_info TEXT,
+                details TEXT,
+                description TEXT,
+                places TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_listings_done ON listings (done)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._conn.commit()
+
+    def __contains__(self, link) -> bool:
+        return self.is_done(link)
+
+    def is_done(self, link: str) -> bool:
+        with self._lock:
+            row = self._conn.execute("SELECT done FROM listings WHERE id = ?", (listing_id(link),)).fetchone()
+        return bool(row and row[0])
+
+    def import_csv_links(self, csv_path: str) -> int:
+        """
+        One-time migration of the links already in the output CSV. Later
+        runs skip it, so startup does not grow with the CSV history.
+        """
+        with self._lock:
+            imported = self._conn.execute("SELECT value FROM meta WHERE key = 'csv_imported'").fetchone()
+        if imported or not os.path.exists(csv_path):
+            return 0
+
+        now = time.time()
+        with open(csv_path, newline="", encoding="utf-8", errors="replace") as file:
+            rows = [(listing_id(row["Link"]), row["Link"], now)
+                    for row in csv.DictReader(file) if row.get("Link")]
+        with self._lock:
+            self._conn.executemany("""
+                INSERT INTO listings (id, link, done, updated_at) VALUES (?, ?, 1, ?)
+                ON CONFLICT(id) DO UPDATE SET done = 1
+            """, rows)
+            self._conn.execute("INSERT OR REPLACE INTO meta VALUES ('csv_imported', ?)", (str(now),))
+            self._conn.commit()
+        print(f"Imported {len(rows)} links from {csv_path}")
+        return len(rows)
+
+    def save_stage(self, link: str, stage: str, value) -> None:
+        if stage not in STAGES:
+            raise ValueError(f"Unknown stage: {stage}")
+        encoded = json.dumps(value, default=to_json_value, ensure_ascii=False)
+        with self._lock:
+            self._conn.execute(f"""
+                INSERT INTO listings (id, link, {stage}, updated_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT(id) DO UPDATE SET {stage} = excluded.{stage}, updated_at = excluded.updated_at
+            """, (listing_id(link), link, encoded, time.time()))
+            self._conn.commit()
+
+    def mark_done(self, link: str) -> None:
+        with self._lock:
+            self._conn.execute("""
+                INSERT INTO listings (id, link, done, updated_at) VALUES (?, ?, 1, ?)
+                ON CONFLICT(id) DO UPDATE SET done = 1, updated_at = excluded.updated_at
+            """, (listing_id(link), link, time.time()))
+            self._conn.commit()
+
+    def _row_to_listing(self, row) -> dict:
+        listing = {}
+        for stage, value in zip(STAGES, row):
+            if value is not None:
+                listing[stage] = json.loads(value)
+        if "details" in listing:
+            listing["details"] = decode_details(listing["details"])
+        return listing
+
+    def get(self, link: str) -> dict:
+        with self._lock:
+            row = self._conn.execute(f"SELECT {', '.join(STAGES)} FROM listings WHERE id = ?",
+                                     (listing_id(link),)).fetchone()
+        return self._row_to_listing(row) if row else None
+
+    def pending(self, max_attempts: int = None) -> list:
+        """
+        Partial listings left by an interrupted run, with their finished
+        stages. Every call counts as one more attempt for the listings it
+        returns, and listings resumed `max_attempts` times are left out, so
+        one that always fails is not retried forever.
+        """
+        with self._lock:
+            rows = self._conn.execute(f"""
+                SELECT id, {', '.join(STAGES)} FROM listings
+                WHERE done = 0 AND card_info IS NOT NULL AND (? IS NULL OR attempts < ?)
+            """, (max_attempts, max_attempts)).fetchall()
+            self._conn.executemany("UPDATE listings SET attempts = attempts + 1 WHERE id = ?",
+                                   [(row[0],) for row in rows])
+            self._conn.commit()
+        return [self._row_to_listing(row[1:]) for row in rows]
+
+    def stats(self, max_attempts: int = None) -> dict:
+        with self._lock:
+            listings, done, abandoned = self._conn.execute("""
+                SELECT COUNT(*), COALESCE(SUM(done), 0),
+                       COALESCE(SUM(done = 0 AND ? IS NOT NULL AND attempts >= ?), 0)
+                FROM listings
+            """, (max_attempts, max_attempts)).fetchone()
+        return {"listings": listings, "done": done, "abandoned": abandoned}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
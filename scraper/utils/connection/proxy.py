@@ -26,9 +26,16 @@ def get_request_headers(config):
     return headers
 
 def proxy_dicts(env_dict):
+    # Without PROXY, the first endpoint of the PROXIES pool is the default
+    proxy = env_dict.get("PROXY") or (env_dict.get("PROXIES") or "").split(",")[0].strip()
+    if not proxy:
+        # No proxy configured: connect directly
+        return None, {"http": None, "https": None}
+    return parse_proxy(proxy)
 
-    proxy = env_dict.get("PROXY")
-    match = re.match(r"http://(.*?):(.*?)@(.*):(\d+)", proxy)
+def parse_proxy(proxy):
+
+    match = re.match(r"http://(.*?):(.*?)@(.*):(\d+)", proxy or "")
     if not match:
         raise ValueError("Proxy format is invalid.")
     username, password, host, port = match.groups()
@@ -0,0 +1,155 @@
+import csv
+import time
+import random
+import asyncio
+from utils.connection.proxy import parse_proxy
+
+
+'''
+HEADER PROFILES
+'''
+
+class HeaderProfiles:
+    """User agents from USER_AGENTS_PATH, combined with the fixed Accept headers."""
+
+    def __init__(self, config: dict):
+        filepath = config['PROXY']['USER_AGENTS_PATH']
+        self.accept_language = config['PROXY']['ACCEPT_LANGUAGE']
+        self.accept = config['PROXY']['ACCEPT']
+        with open(filepath, newline="", encoding="utf-8") as file:
+            self.agents = [row["user_agent"] for row in csv.DictReader(file)]
+        if not self.agents:
+            raise ValueError(f"No user agents found in {filepath}")
+
+    def random(self) -> dict:
+        return {
+            "User-Agent": random.choice(self.agents),
+            "Accept-Language": self.accept_language,
+            "Accept": self.accept,
+        }
+
+
+'''
+PROXY POOL
+'''
+
+class ProxyPool:
+    """
+    Pool of proxy endpoints scored by a rolling EWMA of their success rate
+    and latency. `acquire` picks an endpoint at random, weighted towards
+    healthy and fast ones. An endpoint that fails FAILURE_THRESHOLD times
+    in a row, or whose success rate drops under MIN_SUCCESS_RATE, is
+    quarantined for QUARANTINE_BASE seconds, doubling on every strike up to
+    QUARANTINE_MAX.
+
+    A None proxy is a direct connection. Each endpoint carries a header
+    profile, replaced whenever the endpoint starts a new session: a new
+    browser context, or coming back from quarantine.
+    """
+
+    def __init__(self, proxies: list, profiles: HeaderProfiles, pool_config: dict):
+        if not proxies:
+            raise ValueError("The proxy pool needs at least one proxy.")
+        self.profiles = profiles
+        self.alpha = pool_config['EWMA_ALPHA']
+        self.failure_threshold = pool_config['FAILURE_THRESHOLD']
+        self.min_success_rate = pool_config['MIN_SUCCESS_RATE']
+        self.quarantine_base = pool_config['QUARANTINE_BASE']
+        self.quarantine_max = pool_config['QUARANTINE_MAX']
+        self.endpoints = []
+        for proxy in proxies:
+            server_dict, http_dict = parse_proxy(proxy) if proxy else (None, {"http": None, "https": None})
+            self.endpoints.append({
+                "name": server_dict["server"] if server_dict else "direct",
+                "url": proxy,
+                "server": server_dict,
+                "http": http_dict,
+                "headers": profiles.random(),
+                "success_rate": 1.0,
+                "latency": None,
+                "failures": 0,
+                "strikes": 0,
+                "quarantined_until": 0.0,
+                "requests": 0
+            })
+
+    def _score(self, endpoint: dict, default_latency: float) -> float:
+        latency = endpoint["latency"] if endpoint["latency"] is not None else default_latency
+        return endpoint["success_rate"] / max(latency, 0.05)
+
+    def is_quarantined(self, endpoint: dict) -> bool:
+        return endpoint["quarantined_until"] > time.monotonic()
+
+    def acquire(self) -> dict:
+        available = [endpoint for endpoint in self.endpoints if not self.is_quarantined(endpoint)]
+        if not available:
+            # Everything is quarantined: use the endpoint released soonest rather than stall
+            return min(self.endpoints, key=lambda endpoint: endpoint["quarantined_until"])
+
+        # Endpoints without measurements yet are scored at the typical latency so they get tried
+        latencies = sorted(endpoint["latency"] for endpoint in available if endpoint["latency"] is not None)
+        default_latency = latencies[len(latencies) // 2] if latencies else 1.0
+        weights = [self._score(endpoint, default_latency) for endpoint in available]
+        return random.choices(available, weights=weights)[0]
+
+    def report(self, endpoint: dict, ok: bool, latency: float) -> None:
+        endpoint["requests"] += 1
+        endpoint["success_rate"] = self.alpha * (1.0 if ok else 0.0) + (1 - self.alpha) * endpoint["success_rate"]
+        if ok:
+            endpoint["latency"] = latency if endpoint["latency"] is None else \
+                self.alpha * latency + (1 - self.alpha) * endpoint["latency"]
+            endpoint["failures"] = 0
+            if endpoint["success_rate"] >= self.min_success_rate:
+                endpoint["strikes"] = 0
+            return
+
+        endpoint["failures"] += 1
+        if endpoint["failures"] >= self.failure_threshold or endpoint["success_rate"] < self.min_success_rate:
+            self._quarantine(endpoint)
+
+    def _quarantine(self, endpoint: dict) -> None:
+        duration = min(self.quarantine_base * 2 ** endpoint["strikes"], self.quarantine_max)
+        endpoint["strikes"] += 1
+        endpoint["failures"] = 0
+        endpoint["quarantined_until"] = time.monotonic() + duration
+        endpoint["headers"] = self.profiles.random()
+        print(f"Proxy {endpoint['name']} quarantined for {duration:.0f}s "
+              f"(success rate {endpoint['success_rate']:.2f})")
+
+    def new_session_headers(self, endpoint: dict) -> dict:
+        endpoint["headers"] = self.profiles.random()
+        return endpoint["headers"]
+
+    async def call(self, request):
+        """
+        Runs `request(endpoint)` through an acquired endpoint and reports
+        the outcome. A None result or an exception counts as a failure. A
+        cancelled request, such as the losing hedge, is not reported.
+        """
+        endpoint = self.acquire()
+        started = time.monotonic()
+        try:
+            result = await request(endpoint)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.report(endpoint, False, time.monotonic() - started)
+            raise
+        self.report(endpoint, result is not None, time.monotonic() - started)
+        return result
+
+    def stats(self) -> list:
+        return [{"server": endpoint["name"],
+                 "requests": endpoint["requests"],
+                 "success_rate": round(endpoint["success_rate"], 3),
+                 "latency": round(endpoint["latency"], 3) if endpoint["latency"] is not None else None,
+                 "quarantined": self.is_quarantined(endpoint)}
+                for endpoint in self.endpoints]
+
+
+def create_proxy_pool(env_dict: dict, config: dict) -> ProxyPool:
+    # PROXIES is a comma separated list, a single PROXY is still accepted. Without either, connect directly
+    proxies = [proxy.strip() for proxy in (env_dict.get("PROXIES") or "").split(",") if proxy.strip()]
+    if not proxies:
+        proxies = [env_dict.get("PROXY") or None]
+    return ProxyPool(proxies, HeaderProfiles(config), config['PROXY']['POOL'])
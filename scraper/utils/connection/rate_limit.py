@@ -0,0 +1,198 @@
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+
+'''
+RESPONSES
+'''
+
+def parse_retry_after(value) -> float:
+    # Retry-After is either delay-seconds or an HTTP-date
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class Slot:
+    """
+    What one limited request observed. No recorded response means it
+    failed, unless it was cancelled first (e.g. the losing hedge).
+    """
+
+    def __init__(self):
+        self.status = None
+        self.retry_after = None
+        self.cancelled = False
+
+    def record(self, response) -> None:
+        self.status = response.status
+        # aiohttp headers are case-insensitive, Playwright's are a dict of lower-case names
+        self.retry_after = parse_retry_after(response.headers.get("Retry-After") or response.headers.get("retry-after"))
+
+    def outcome(self) -> str:
+        if self.status is None and self.cancelled:
+            return "cancelled"
+        if self.status is None or self.status >= 500:
+            return "error"
+        if self.status == 429:
+            return "throttled"
+        return "ok"
+
+
+'''
+HOST LIMITER
+'''
+
+class HostLimiter:
+    """
+    Token bucket (`rate` requests per second, up to `burst` at once) plus an
+    AIMD concurrency window. Every successful request widens the window by
+    about one slot per window's worth of requests; a 429, 5xx or network
+    error shrinks it by `decrease_factor`, at most once per
+    `decrease_cooldown` seconds so one burst of failures counts once. A
+    Retry-After pauses the host for that long. A request cancelled before
+    any response only frees its slot.
+    """
+
+    def __init__(self,
+                 host: str,
+                 rate: float,
+                 burst: int,
+                 min_concurrency: int,
+                 max_concurrency: int,
+                 initial_concurrency: int,
+                 decrease_factor: float,
+                 decrease_cooldown: float):
+        self.host = host
+        self.rate = rate
+        self.burst = burst
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.decrease_factor = decrease_factor
+        self.decrease_cooldown = decrease_cooldown
+        self.concurrency = float(initial_concurrency)
+        self.in_flight = 0
+        self.tokens = float(burst)
+        self.paused_until = 0.0
+        self.counts = {"ok": 0, "throttled": 0, "error": 0, "cancelled": 0}
+        self._updated = time.monotonic()
+        self._last_decrease = 0.0
+        self._condition = asyncio.Condition()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self) -> None:
+        async with self._condition:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                elif self.in_flight >= int(self.concurrency):
+                    # Woken up by release()
+                    wait = None
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    self.in_flight += 1
+                    return
+                else:
+                    wait = (1 - self.tokens) / self.rate
+                try:
+                    await asyncio.wait_for(self._condition.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def release(self, outcome: str, retry_after: float = None) -> None:
+        async with self._condition:
+            self.in_flight -= 1
+            self.counts[outcome] += 1
+            now = time.monotonic()
+            if outcome == "cancelled":
+                pass
+            elif outcome == "ok":
+                self.concurrency = min(self.max_concurrency, self.concurrency + 1 / self.concurrency)
+            else:
+                if now - self._last_decrease >= self.decrease_cooldown:
+                    self.concurrency = max(self.min_concurrency, self.concurrency * self.decrease_factor)
+                    self._last_decrease = now
+                    print(f"Rate limit on {self.host} ({outcome}): concurrency down to {int(self.concurrency)}")
+                if retry_after:
+                    self.paused_until = max(self.paused_until, now + retry_after)
+                    print(f"Pausing {self.host} for {retry_after:.1f}s (Retry-After)")
+            self._condition.notify_all()
+
+    def stats(self) -> dict:
+        return {"concurrency": round(self.concurrency, 2), "in_flight": self.in_flight, **self.counts}
+
+
+'''
+RATE LIMITER
+'''
+
+class RateLimiter:
+    """
+    Shared registry of HostLimiters, created on first use from
+    RATE_LIMITS.HOSTS[host] over RATE_LIMITS.DEFAULT.
+
+    Usage:
+        async with limiter.limit(url) as slot:
+            async with session.get(url) as response:
+                slot.record(response)
+    """
+
+    def __init__(self, rate_config: dict):
+        self.default = rate_config['DEFAULT']
+        self.hosts = rate_config['HOSTS']
+        self._limiters = {}
+
+    def host(self, url: str) -> HostLimiter:
+        host = urlsplit(url).hostname
+        if host not in self._limiters:
+            host_config = {**self.default, **self.hosts.get(host, {})}
+            self._limiters[host] = HostLimiter(host=host,
+                                               rate=host_config['RATE'],
+                                               burst=host_config['BURST'],
+                                               min_concurrency=host_config['MIN_CONCURRENCY'],
+                                               max_concurrency=host_config['MAX_CONCURRENCY'],
+                                               initial_concurrency=host_config['INITIAL_CONCURRENCY'],
+                                               decrease_factor=host_config['DECREASE_FACTOR'],
+                                               decrease_cooldown=host_config['DECREASE_COOLDOWN'])
+        return self._limiters[host]
+
+    @asynccontextmanager
+    async def limit(self, url: str):
+        host_limiter = self.host(url)
+        await host_limiter.acquire()
+        slot = Slot()
+        try:
+            yield slot
+        except asyncio.CancelledError:
+            slot.cancelled = True
+            raise
+        finally:
+            await host_limiter.release(slot.outcome(), slot.retry_after)
+
+    def stats(self) -> dict:
+        return {host: host_limiter.stats() for host, host_limiter in self._limiters.items()}
+
+
+@asynccontextmanager
+async def limited(limiter: RateLimiter, url: str):
+    # Lets request helpers take an optional limiter
+    if limiter is None:
+        yield Slot()
+        return
+    async with limiter.limit(url) as slot:
+        yield slot
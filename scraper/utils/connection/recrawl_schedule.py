@@ -0,0 +1,181 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from utils.connection.listing_store import to_json_value, listing_id
+
+
+'''
+FINGERPRINTS
+'''
+
+# The fields scrape_details_page extracts, in a fixed order
+FINGERPRINT_FIELDS = ("coordinates", "price", "administracion", "facilities", "upload_date",
+                      "technical_data", "description", "image_urls")
+
+
+def digest(value) -> str:
+    encoded = json.dumps(value, default=to_json_value, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def details_fingerprint(details: dict) -> str:
+    return digest({field: details.get(field) for field in FINGERPRINT_FIELDS})
+
+
+def images_fingerprint(details: dict) -> str:
+    # Gallery order does not matter, only which images it holds
+    return digest(sorted(details.get("image_urls") or []))
+
+
+def coordinates_key(details: dict) -> str:
+    # Rounded to ~1 m, so re-geocoding noise is not a move
+    coordinates = details.get("coordinates")
+    if not coordinates or None in coordinates:
+        return None
+    return f"{coordinates[0]:.5f},{coordinates[1]:.5f}"
+
+
+'''
+RECRAWL SCHEDULE
+'''
+
+class RecrawlSchedule:
+    """
+    Revisit schedule of finished listings, kept next to the ListingStore
+    tables in the same SQLite file. Every listing has its own interval:
+    halved when a check finds a change, grown by BACKOFF when it does not,
+    within MIN_INTERVAL_HOURS and MAX_INTERVAL_HOURS. `due` returns the
+    listings past their next check, stalest relative to their interval
+    first, so listings that change often are revisited more often.
+
+    A failed check is retried after MIN_INTERVAL_HOURS, growing by BACKOFF
+    with every consecutive failure. After MAX_FAILURES in a row the listing
+    is only retried every MAX_INTERVAL_HOURS, so listings that always fail
+    cannot crowd the due ones out of a batch.
+
+    Each entry keeps what the next check compares against: the validators
+    for conditional requests (ETag, Last-Modified), the details
+    fingerprint, and separate fingerprints of the gallery and the
+    coordinates, which decide whether vision and Places must run again.
+    The fingerprints are only comparable between checks of the same
+    extractor ("http" or "browser"), which is stored alongside them.
+    """
+
+    def __init__(self, path: str, recrawl_config: dict):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.min_interval = recrawl_config['MIN_INTERVAL_HOURS'] * 3600
+        self.max_interval = recrawl_config['MAX_INTERVAL_HOURS'] * 3600
+        self.initial_interval = recrawl_config['INITIAL_INTERVAL_HOURS'] * 3600
+        self.backoff = recrawl_config['BACKOFF']
+        self.max_failures = recrawl_config['MAX_FAILURES']
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS recrawl (
+                id TEXT PRIMARY KEY,
+                link TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                fingerprint TEXT,
+                images TEXT,
+                coordinates TEXT,
+                extractor TEXT,
+                interval REAL NOT NULL,
+                last_checked REAL NOT NULL,
+                next_check REAL NOT NULL,
+                changes INTEGER NOT NULL DEFAULT 0,
+                failures INTEGER NOT NULL DEFAULT 0,
+                delisted INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_recrawl_next ON recrawl (delisted, next_check)")
+        self._conn.commit()
+
+    def sync(self) -> int:
+        """
+        Schedules the finished listings of the store that are not scheduled
+        yet, a first check INITIAL_INTERVAL_HOURS after they were finished.
+        Listings imported from the CSV history are left out: without their
+        stored stages a change could not be written as a complete row.
+        """
+        with self._lock:
+            added = self._conn.execute("""
+                INSERT OR IGNORE INTO recrawl (id, link, interval, last_checked, next_check)
+                SELECT id, link, ?, updated_at, updated_at + ? FROM listings
+                WHERE done = 1 AND card_info IS NOT NULL AND details IS NOT NULL
+                      AND description IS NOT NULL AND places IS NOT NULL
+            """, (self.initial_interval, self.initial_interval)).rowcount
+            self._conn.commit()
+        if added:
+            print(f"Scheduled {added} listings for recrawl")
+        return added
+
+    def due(self, limit: int) -> list:
+        now = time.time()
+        with self._lock:
+            rows = self._conn.execute("""
+                SELECT link, etag, last_modified, fingerprint, images, coordinates, extractor FROM recrawl
+                WHERE delisted = 0 AND next_check <= ?
+                ORDER BY (? - last_checked) / interval DESC LIMIT ?
+            """, (now, now, limit)).fetchall()
+        columns = ("link", "etag", "last_modified", "fingerprint", "images", "coordinates", "extractor")
+        return [dict(zip(columns, row)) for row in rows]
+
+    def record(self, link: str, changed: bool, **fields) -> None:
+        """
+        Reschedules `link` after a check. `fields` updates the stored
+        validators and fingerprints (etag, last_modified, fingerprint,
+        images, coordinates, extractor).
+        """
+        now = time.time()
+        with self._lock:
+            interval = self._conn.execute("SELECT interval FROM recrawl WHERE id = ?", (listing_id(link),)).fetchone()[0]
+            interval = max(interval / 2, self.min_interval) if changed else min(interval * self.backoff, self.max_interval)
+            assignments = "".join(f", {column} = ?" for column in fields)
+            self._conn.execute(f"""
+                UPDATE recrawl SET interval = ?, last_checked = ?, next_check = ?, changes = changes + ?,
+                                   failures = 0{assignments}
+                WHERE id = ?
+            """, (interval, now, now + interval, int(changed), *fields.values(), listing_id(link)))
+            self._conn.commit()
+
+    def record_failure(self, link: str) -> None:
+        # The interval itself is kept: it describes how often the listing changes, not how it fails
+        now = time.time()
+        with self._lock:
+            failures = self._conn.execute("SELECT failures FROM recrawl WHERE id = ?",
+                                          (listing_id(link),)).fetchone()[0] + 1
+            if failures >= self.max_failures:
+                delay = self.max_interval
+                print(f"Recrawl of {link} failed {failures} times in a row, next try in "
+                      f"{delay / 3600:.0f}h")
+            else:
+                delay = min(self.min_interval * self.backoff ** (failures - 1), self.max_interval)
+            self._conn.execute("""
+                UPDATE recrawl SET failures = ?, last_checked = ?, next_check = ? WHERE id = ?
+            """, (failures, now, now + delay, listing_id(link)))
+            self._conn.commit()
+
+    def mark_delisted(self, link: str) -> None:
+        with self._lock:
+            self._conn.execute("UPDATE recrawl SET delisted = 1, last_checked = ? WHERE id = ?",
+                               (time.time(), listing_id(link)))
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            scheduled, due, delisted, changes, failing = self._conn.execute("""
+                SELECT COUNT(*), COALESCE(SUM(delisted = 0 AND next_check <= ?), 0),
+                       COALESCE(SUM(delisted), 0), COALESCE(SUM(changes), 0),
+                       COALESCE(SUM(failures >= ?), 0)
+                FROM recrawl
+            """, (time.time(), self.max_failures)).fetchone()
+        return {"scheduled": scheduled, "due": due, "delisted": delisted, "changes": changes, "failing": failing}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,307 @@
+import os
+import json
+import time
+import random
+import asyncio
+import hashlib
+import aiohttp
+import requests
+from aiohttp import web
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+
+
+'''
+FIXTURES
+'''
+
+# Dropped from recorded responses: the stand-in serves decoded bodies with its own framing
+HOP_HEADERS = {"connection", "content-encoding", "content-length", "keep-alive",
+               "transfer-encoding", "date", "server", "set-cookie"}
+# Not forwarded upstream when recording
+REQUEST_SKIP_HEADERS = {"host", "content-length", "connection", "accept-encoding", "transfer-encoding"}
+
+
+def request_key(method: str, url: str, body: bytes) -> str:
+    # Headers are left out on purpose: user agents rotate and API keys must not matter
+    digest = hashlib.sha256()
+    digest.update(method.upper().encode())
+    digest.update(b" " + url.encode())
+    digest.update(b"\n" + hashlib.sha256(body or b"").digest())
+    return digest.hexdigest()
+
+
+class FixtureStore:
+    """
+    Content-addressed fixtures. Response bodies are stored once under
+    `bodies/` by their SHA-256, and every recorded request has a small JSON
+    entry under `requests/` with its status, headers, body hash and the
+    upstream latency observed while recording. No request headers are
+    stored, so API keys never reach the fixtures.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(os.path.join(root, "requests"), exist_ok=True)
+        os.makedirs(os.path.join(root, "bodies"), exist_ok=True)
+
+    def _request_path(self, key: str) -> str:
+        return os.path.join(self.root, "requests", key[:2], f"{key}.json")
+
+    def _body_path(self, body_hash: str) -> str:
+        return os.path.join(self.root, "bodies", body_hash[:2], body_hash)
+
+    def _write(self, path: str, content: bytes) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.part"
+        with open(temp_path, "wb") as file:
+            file.write(content)
+        os.replace(temp_path, path)
+
+    def get(self, key: str):
+        try:
+            with open(self._request_path(key), encoding="utf-8") as file:
+                entry = json.load(file)
+            with open(self._body_path(entry["body"]), "rb") as file:
+                return entry, file.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, key: str, method: str, url: str, status: int, headers: dict, body: bytes, elapsed: float) -> None:
+        body_hash = hashlib.sha256(body).hexdigest()
+        if not os.path.exists(self._body_path(body_hash)):
+            self._write(self._body_path(body_hash), body)
+        entry = {"method": method, "url": url, "status": status, "headers": headers,
+                 "body": body_hash, "elapsed": round(elapsed, 4)}
+        self._write(self._request_path(key), json.dumps(entry, ensure_ascii=False, indent=1).encode("utf-8"))
+
+
+'''
+STAND-IN SERVER
+'''
+
+def rewrite_url(base_url: str, url: str) -> str:
+    # https://host/path?query -> {base_url}/https/host/path?query
+    parts = urlsplit(url)
+    rewritten = f"{base_url}/{parts.scheme}/{parts.netloc}{parts.path or '/'}"
+    return f"{rewritten}?{parts.query}" if parts.query else rewritten
+
+
+def original_url(request: web.Request) -> str:
+    # From the raw path, so percent-encoding survives and keys match the client's URL
+    _, scheme, netloc, path = request.rel_url.raw_path.split("/", 3)
+    url = f"{scheme}://{netloc}/{path}"
+    query = request.rel_url.raw_query_string
+    return f"{url}?{query}" if query else url
+
+
+class ReplayServer:
+    """
+    Local stand-in for every host the scraper talks to. Clients reach it
+    through rewrite_url (see ReplaySession, replay_requests_session and
+    install_replay_route).
+
+    In "record" mode each request is forwarded to the real host and 2xx
+    responses are saved to the fixtures. Only `proxied_hosts` go through
+    `upstream_proxy`, which intercepts TLS; every other host, the APIs
+    included, is reached directly with certificate checks.
+    In "replay" mode responses come from the fixtures only, delayed by the
+    recorded latency times `latency_scale`, or by a fixed `latency_ms`.
+    Requests without a fixture get a 404.
+    """
+
+    def __init__(self,
+                 fixtures_dir: str,
+                 mode: str,
+                 latency_scale: float = 1.0,
+                 latency_ms: float = None,
+                 upstream_proxy: str = None,
+                 proxied_hosts: list = None,
+                 port: int = 0):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown replay mode: {mode}")
+        self.fixtures = FixtureStore(fixtures_dir)
+        self.mode = mode
+        self.latency_scale = latency_scale
+        self.latency_ms = latency_ms
+        self.upstream_proxy = upstream_proxy
+        self.proxied_hosts = set(proxied_hosts or [])
+        self.port = port
+        self.base_url = None
+        self.counts = {"hits": 0, "misses": 0, "recorded": 0}
+        self._runner = None
+        self._upstream = None
+        self._proxied_upstream = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def start(self):
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_route("*", "/{scheme}/{netloc}/{path:.*}", self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", self.port)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        self.base_url = f"http://127.0.0.1:{port}"
+        if self.mode == "record":
+            self._upstream = aiohttp.ClientSession(auto_decompress=True)
+            if self.upstream_proxy:
+                # The scraping proxies intercept TLS, so certificates cannot be checked through them
+                self._proxied_upstream = aiohttp.ClientSession(connector=aiohttp.TCPConnector(ssl=False),
+                                                               auto_decompress=True)
+        print(f"Replay server ({self.mode}) listening on {self.base_url}")
+        return self
+
+    async def close(self):
+        if self._upstream:
+            await self._upstream.close()
+            self._upstream = None
+        if self._proxied_upstream:
+            await self._proxied_upstream.close()
+            self._proxied_upstream = None
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+        print(f"Replay server: {self.counts}")
+
+    async def handle(self, request: web.Request) -> web.Response:
+        url = original_url(request)
+        body = await request.read()
+        key = request_key(request.method, url, body)
+        if self.mode == "record":
+            return await self._record(request, key, url, body)
+
+        fixture = await asyncio.to_thread(self.fixtures.get, key)
+        if fixture is None:
+            self.counts["misses"] += 1
+            print(f"No fixture for {request.method} {url}")
+            return web.Response(status=404, headers={"X-Replay-Miss": "1"})
+        entry, content = fixture
+        self.counts["hits"] += 1
+        delay = self.latency_ms / 1000 if self.latency_ms is not None else entry["elapsed"] * self.latency_scale
+        if delay > 0:
+            await asyncio.sleep(delay * (0.9 + 0.2 * random.random()))
+        return web.Response(status=entry["status"], headers=entry["headers"], body=content)
+
+    async def _record(self, request: web.Request, key: str, url: str, body: bytes) -> web.Response:
+        headers = {name: value for name, value in request.headers.items()
+                   if name.lower() not in REQUEST_SKIP_HEADERS}
+        proxied = self._proxied_upstream is not None and urlsplit(url).hostname in self.proxied_hosts
+        session = self._proxied_upstream if proxied else self._upstream
+        started = time.perf_counter()
+        try:
+            async with session.request(request.method, url, headers=headers, data=body or None,
+                                       proxy=self.upstream_proxy if proxied else None,
+                                       allow_redirects=True) as response:
+                content = await response.read()
+                status = response.status
+                response_headers = {name: value for name, value in response.headers.items()
+                                    if name.lower() not in HOP_HEADERS}
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            # Upstream failures are passed on but never recorded
+            print(f"Recording {url} failed: {e}")
+            return web.Response(status=502)
+        elapsed = time.perf_counter() - started
+        if not 200 <= status < 300:
+            # Replaying an error would serve it as the recorded answer
+            print(f"Not recording {url}: status {status}")
+            return web.Response(status=status, headers=response_headers, body=content)
+        await asyncio.to_thread(self.fixtures.put, key, request.method, url, status, response_headers, content, elapsed)
+        self.counts["recorded"] += 1
+        return web.Response(status=status, headers=response_headers, body=content)
+
+
+'''
+CLIENTS
+'''
+
+class ReplaySession:
+    """
+    Wraps an aiohttp.ClientSession so every request goes to the stand-in
+    server. Proxies are dropped: the stand-in talks to the real hosts.
+    """
+
+    def __init__(self, session: aiohttp.ClientSession, base_url: str):
+        self._session = session
+        self.base_url = base_url
+
+    def request(self, method: str, url: str, **kwargs):
+        kwargs.pop("proxy", None)
+        kwargs.pop("ssl", None)
+        return self._session.request(method, rewrite_url(self.base_url, str(url)), **kwargs)
+
+    def get(self, url: str, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    @property
+    def closed(self) -> bool:
+        return self._session.closed
+
+    async def close(self):
+        await self._session.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+
+class ReplayAdapter(HTTPAdapter):
+    """requests transport adapter that sends every request to the stand-in server."""
+
+    def __init__(self, base_url: str, **kwargs):
+        self.base_url = base_url
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        request.url = rewrite_url(self.base_url, request.url)
+        kwargs["proxies"] = {}
+        return super().send(request, **kwargs)
+
+
+def replay_requests_session(base_url: str, session: requests.Session = None) -> requests.Session:
+    session = session or requests.Session()
+    session.trust_env = False
+    session.mount("http://", ReplayAdapter(base_url))
+    session.mount("https://", ReplayAdapter(base_url))
+    return session
+
+
+async def install_replay_route(page, base_url: str) -> None:
+    """
+    Sends every request of a Playwright page to the stand-in server.
+    Install it before other routes: those run first and hand the requests
+    they let through to it with route.fallback().
+    """
+    async def handle(route):
+        try:
+            response = await route.fetch(url=rewrite_url(base_url, route.request.url))
+            await route.fulfill(response=response)
+        except Exception as e:
+            print(f"Replay route failed for {route.request.url}: {e}")
+            await route.abort()
+
+    await page.route("**/*", handle)
+
+
+def create_replay_server(replay_config: dict, upstream_proxy: str = None) -> ReplayServer:
+    # None when REPLAY.MODE is "off". `upstream_proxy` only carries REPLAY.PROXIED_HOSTS
+    if replay_config['MODE'] == "off":
+        return None
+    return ReplayServer(fixtures_dir=replay_config['FIXTURES_DIR'],
+                        mode=replay_config['MODE'],
+                        latency_scale=replay_config['LATENCY_SCALE'],
+                        latency_ms=replay_config['LATENCY_MS'],
+                        upstream_proxy=upstream_proxy,
+                        proxied_hosts=replay_config['PROXIED_HOSTS'],
+                        port=replay_config['PORT'])
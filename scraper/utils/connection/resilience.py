@@ -0,0 +1,196 @@
+import time
+import random
+import asyncio
+import aiohttp
+from utils.connection.rate_limit import parse_retry_after
+from utils.monitoring.metrics import METRICS
+
+
+'''
+ERROR CLASSIFICATION
+'''
+
+RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling the endpoint while its circuit breaker is open."""
+
+
+def classify_error(error: Exception) -> str:
+    """
+    "throttled" (429), "server" (5xx and 408), "timeout" and "connection"
+    are worth retrying. Anything else, like other 4xx or a malformed
+    response, is "fatal" and fails the call right away.
+    """
+    if isinstance(error, aiohttp.ClientResponseError):
+        if error.status == 429:
+            return "throttled"
+        return "server" if error.status in RETRY_STATUSES else "fatal"
+    if isinstance(error, asyncio.TimeoutError):
+        return "timeout"
+    if isinstance(error, aiohttp.ClientError):
+        return "connection"
+    return "fatal"
+
+
+def error_retry_after(error: Exception) -> float:
+    headers = getattr(error, "headers", None)
+    return parse_retry_after(headers.get("Retry-After")) if headers else None
+
+
+'''
+CIRCUIT BREAKER
+'''
+
+class CircuitBreaker:
+    """
+    Opens after `failures` consecutive retryable failures and rejects calls
+    for `cooldown` seconds. Then a single trial call is let through: its
+    success closes the circuit, its failure opens it again.
+    """
+
+    def __init__(self, name: str, failures: int, cooldown: float):
+        self.name = name
+        self.failures = failures
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.opens = 0
+        self._trial = False
+
+    def before_call(self) -> None:
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.cooldown:
+                raise CircuitOpenError(f"Circuit for {self.name} is open")
+            self.state = "half_open"
+        if self.state == "half_open":
+            if self._trial:
+                raise CircuitOpenError(f"Circuit for {self.name} is half open")
+            self._trial = True
+
+    def record_success(self) -> None:
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self._trial = False
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        if self.state == "half_open" or self.consecutive_failures >= self.failures:
+            if self.state != "open":
+                self.opens += 1
+                print(f"Circuit for {self.name} opened after {self.consecutive_failures} failures")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+        self._trial = False
+
+
+'''
+RESILIENT CALLS
+'''
+
+class Resilience:
+    """
+    Common call layer for external endpoints, configured per endpoint name
+    from RESILIENCE.ENDPOINTS over RESILIENCE.DEFAULT:
+
+    - retries: up to ATTEMPTS tries with jittered exponential backoff
+      (BACKOFF * 2^n, capped at MAX_BACKOFF), or the server's Retry-After
+      when it is longer, for the retryable error kinds of classify_error;
+    - hedging: with HEDGE_DELAY set, a duplicate request is started when
+      the first one has not finished after that many seconds, and the
+      first success wins;
+    - circuit breaking: BREAKER_FAILURES consecutive failures stop calls
+      to the endpoint for BREAKER_COOLDOWN seconds.
+
+    Retries, hedges and rejected calls are counted in `metrics`.
+    """
+
+    def __init__(self, resilience_config: dict):
+        self.default = resilience_config['DEFAULT']
+        self.endpoints = resilience_config['ENDPOINTS']
+        self.breakers = {}
+        self.metrics = {}
+
+    def _config(self, endpoint: str) -> dict:
+        return {**self.default, **self.endpoints.get(endpoint, {})}
+
+    def _breaker(self, endpoint: str) -> CircuitBreaker:
+        if endpoint not in self.breakers:
+            config = self._config(endpoint)
+            self.breakers[endpoint] = CircuitBreaker(endpoint, config['BREAKER_FAILURES'], config['BREAKER_COOLDOWN'])
+        return self.breakers[endpoint]
+
+    def count(self, endpoint: str, name: str) -> None:
+        key = f"{endpoint}.{name}"
+        self.metrics[key] = self.metrics.get(key, 0) + 1
+
+    async def _hedged(self, endpoint: str, request, delay: float):
+        first = asyncio.ensure_future(request())
+        pending = {first}
+        error = None
+        try:
+            done, pending = await asyncio.wait(pending, timeout=delay)
+            if done:
+                return first.result()
+
+            self.count(endpoint, "hedges")
+            second = asyncio.ensure_future(request())
+            pending.add(second)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            self.count(endpoint, "hedge_wins")
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def call(self, endpoint: str, request):
+        """
+        Awaits `request()`, a coroutine factory that raises on failure,
+        with the retry, hedging and breaker settings of `endpoint`.
+        """
+        config = self._config(endpoint)
+        breaker = self._breaker(endpoint)
+        for attempt in range(1, config['ATTEMPTS'] + 1):
+            try:
+                breaker.before_call()
+            except CircuitOpenError:
+                self.count(endpoint, "rejected")
+                raise
+            try:
+                if config['HEDGE_DELAY']:
+                    result = await self._hedged(endpoint, request, config['HEDGE_DELAY'])
+                else:
+                    result = await request()
+            except Exception as e:
+                kind = classify_error(e)
+                if kind == "timeout":
+                    METRICS.inc("timeouts", endpoint=endpoint)
+                if kind == "fatal":
+                    # The endpoint answered, the request itself is at fault
+                    breaker.record_success()
+                    raise
+                breaker.record_failure()
+                if attempt == config['ATTEMPTS']:
+                    self.count(endpoint, "exhausted")
+                    raise
+                self.count(endpoint, f"retries.{kind}")
+                METRICS.inc("retries", endpoint=endpoint, kind=kind)
+                backoff = min(config['BACKOFF'] * 2 ** (attempt - 1), config['MAX_BACKOFF']) * (1 + random.random())
+                delay = max(backoff, error_retry_after(e) or 0.0)
+                print(f"Retrying {endpoint} in {delay:.1f}s after {kind} error: {e}")
+                await asyncio.sleep(delay)
+                continue
+            breaker.record_success()
+            return result
+
+    def stats(self) -> dict:
+        return {"counters": dict(self.metrics),
+                "breakers": {name: breaker.state for name, breaker in self.breakers.items()}}
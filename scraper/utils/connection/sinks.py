@@ -0,0 +1,202 @@
+import os
+import csv
+import json
+import time
+import uuid
+import threading
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from utils.monitoring.metrics import METRICS
+
+
+'''
+ROWS
+'''
+
+def to_json_safe(obj):
+    if isinstance(obj, set):
+        return json.dumps(list(obj))
+    else:
+        return json.dumps(obj)
+
+
+CARD_COLUMNS = ["Link", "Price", "Bedrooms", "Bathrooms", "Area", "Agency", "Location", "Datetime_Added"]
+
+
+def build_row(card_info, details, description, places, nested=False) -> dict:
+    """
+    One output row. With `nested`, coordinates, facilities, technical_data
+    and places keep their native types instead of JSON strings.
+    Datetime_Scraped tells a recrawled row from the earlier rows of the
+    same listing.
+    """
+    row = {column: card_info.get(column) for column in CARD_COLUMNS}
+    row["Datetime_Scraped"] = time.strftime("%Y-%m-%d %H:%M:%S")
+    if nested:
+        upload_date = details.get("upload_date")
+        facilities = details.get("facilities")
+        technical_data = details.get("technical_data")
+        row.update({
+            "coordinates": list(details["coordinates"]) if details.get("coordinates") else None,
+            "administracion": details.get("administracion"),
+            "facilities": sorted(facilities) if facilities else [],
+            "upload_date": None if upload_date is None or pd.isna(upload_date) else pd.Timestamp(upload_date).to_pydatetime(),
+            "technical_data": list(technical_data.items()) if technical_data else None,
+            "description": description,
+            "places": places
+        })
+    else:
+        row.update({
+            "coordinates": to_json_safe(details.get("coordinates")),
+            "administracion": details.get("administracion"),
+            "facilities": to_json_safe(details.get("facilities")),
+            "upload_date": details.get("upload_date"),
+            "technical_data": to_json_safe(details.get("technical_data")),
+            "description": f'"{description}"',
+            "places": to_json_safe(places)
+        })
+    return row
+
+
+'''
+SINKS
+'''
+
+PARQUET_SCHEMA = pa.schema(
+    [(column, pa.string()) for column in CARD_COLUMNS + ["Datetime_Scraped"]] + [
+        ("coordinates", pa.list_(pa.float64())),
+        ("administracion", pa.int64()),
+        ("facilities", pa.list_(pa.string())),
+        ("upload_date", pa.timestamp("us")),
+        ("technical_data", pa.map_(pa.string(), pa.string())),
+        ("description", pa.string()),
+        ("places", pa.list_(pa.struct([
+            ("nombre", pa.string()),
+            ("dirección", pa.string()),
+            ("tipos", pa.list_(pa.string())),
+            ("distancia_km", pa.float64())
+        ])))
+    ]
+)
+
+
+class CsvSink:
+    """
+    Appends rows to the legacy CSV, writing the header on first use. A file
+    written before a column was added is rewritten once with the new
+    column, empty for the old rows.
+    """
+
+    nested = False
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def write(self, rows: list) -> None:
+        df = pd.DataFrame(rows)
+        if not os.path.exists(self.path):
+            df.to_csv(self.path, index=False, mode='w')
+            return
+        with open(self.path, newline="", encoding="utf-8") as file:
+            header = next(csv.reader(file), [])
+        added = [column for column in df.columns if column not in header]
+        if added:
+            existing = pd.read_csv(self.path, dtype=str, keep_default_na=False)
+            header = header + added
+            # Written next to the history and swapped in, so a crash never leaves it truncated
+            temp_path = f"{self.path}.{os.getpid()}.part"
+            existing.reindex(columns=header).to_csv(temp_path, index=False, mode='w')
+            os.replace(temp_path, self.path)
+        df.reindex(columns=header).to_csv(self.path, index=False, mode='a', header=False)
+
+
+class ParquetSink:
+    """
+    Writes each batch as a Parquet file under `root/date=YYYY-MM-DD/`,
+    partitioned by the day the listing was added.
+    """
+
+    nested = True
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def write(self, rows: list) -> None:
+        partitions = {}
+        for row in rows:
+            day = (row.get("Datetime_Added") or time.strftime("%Y-%m-%d"))[:10]
+            partitions.setdefault(day, []).append(row)
+
+        for day, day_rows in partitions.items():
+            folder = os.path.join(self.root, f"date={day}")
+            os.makedirs(folder, exist_ok=True)
+            table = pa.Table.from_pylist(day_rows, schema=PARQUET_SCHEMA)
+            filename = f"part-{time.strftime('%H%M%S')}-{uuid.uuid4().hex[:8]}.parquet"
+            pq.write_table(table, os.path.join(folder, filename))
+
+
+class BufferedSink:
+    """
+    Buffers rows and writes them to `sink` every `flush_rows` rows or
+    `flush_seconds` seconds. `on_flush` is called with the rows once they
+    are on disk, so callers can mark them as done only then.
+    """
+
+    def __init__(self, sink, flush_rows: int, flush_seconds: float, on_flush=None):
+        self.sink = sink
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self.on_flush = on_flush
+        self._rows = []
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+
+    @property
+    def nested(self) -> bool:
+        return self.sink.nested
+
+    def add(self, row: dict) -> None:
+        with self._lock:
+            self._rows.append(row)
+            if len(self._rows) >= self.flush_rows:
+                self._flush()
+
+    def flush_if_due(self) -> None:
+        with self._lock:
+            if self._rows and time.monotonic() - self._last_flush >= self.flush_seconds:
+                self._flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush()
+
+    def _flush(self) -> None:
+        rows, self._rows = self._rows, []
+        self._last_flush = time.monotonic()
+        if not rows:
+            return
+        try:
+            with METRICS.timer("sink_write"):
+                self.sink.write(rows)
+        except Exception:
+            # Keep the rows for the next flush instead of dropping them
+            self._rows = rows + self._rows
+            raise
+        print(f"Flushed {len(rows)} rows")
+        METRICS.inc("rows_written", len(rows))
+        if self.on_flush:
+            self.on_flush(rows)
+
+
+def create_sink(sink_config: dict, csv_path: str, on_flush=None) -> BufferedSink:
+    if sink_config['FORMAT'] == "parquet":
+        sink = ParquetSink(sink_config['PARQUET_DIR'])
+    elif sink_config['FORMAT'] == "csv":
+        sink = CsvSink(csv_path)
+    else:
+        raise ValueError(f"Unknown sink format: {sink_config['FORMAT']}")
+    return BufferedSink(sink,
+                        flush_rows=sink_config['FLUSH_ROWS'],
+                        flush_seconds=sink_config['FLUSH_SECONDS'],
+                        on_flush=on_flush)
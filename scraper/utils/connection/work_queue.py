@@ -0,0 +1,233 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+
+
+'''
+WORK QUEUE
+'''
+
+# Leased tasks past their lease_until are back up for grabs
+CLAIMABLE = "(state = 'queued' OR (state = 'leased' AND lease_until < ?)) AND attempts < ?"
+
+
+class WorkQueue:
+    """
+    Shared SQLite (WAL) queue of listing-page and listing tasks, the local
+    stand-in for a queue service. Any number of worker processes can open
+    the same file; on several hosts it has to live on a shared filesystem
+    with working locks.
+
+    A worker `claim`s tasks under a lease of LEASE_SECONDS and keeps it
+    alive with `heartbeat`. A task whose lease runs out is claimed again by
+    the next worker, and one that has been claimed MAX_ATTEMPTS times is
+    marked failed. Task ids are "<kind>:<key>", so putting a task that is
+    already queued, leased or done is a no-op.
+
+    Each coordinator run has its own id. Closing marks that run as closed,
+    so a worker that starts before the next `open_run` waits for it
+    instead of taking the previous run's close as its own.
+    """
+
+    def __init__(self, path: str, lease_seconds: float, max_attempts: int):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        # Autocommit, with explicit BEGIN IMMEDIATE where a read and a write must be atomic across processes
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS tasks (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                state TEXT NOT NULL DEFAULT 'queued',
+                worker TEXT,
+                lease_until REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_state ON tasks (state, lease_until)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+    def _transaction(self, function):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = function()
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+        return result
+
+    # Coordinator
+
+    def open_run(self) -> str:
+        # Finished tasks of earlier runs are dropped, unfinished ones carry over
+        run_id = uuid.uuid4().hex
+        def open_run():
+            self._conn.execute("DELETE FROM tasks WHERE state IN ('done', 'failed')")
+            self._conn.execute("INSERT OR REPLACE INTO meta VALUES ('run', ?)", (run_id,))
+        self._transaction(open_run)
+        return run_id
+
+    def close_run(self) -> None:
+        # No more tasks will be put in the current run: workers may exit once the queue is empty
+        with self._lock:
+            self._conn.execute("""
+                INSERT OR REPLACE INTO meta SELECT 'closed', value FROM meta WHERE key = 'run'
+            """)
+
+    def _run_state(self) -> tuple:
+        # (current run id, whether it is closed), with the lock held
+        meta = dict(self._conn.execute("SELECT key, value FROM meta WHERE key IN ('run', 'closed')").fetchall())
+        run_id = meta.get("run")
+        return run_id, run_id is not None and meta.get("closed") == run_id
+
+    def put(self, kind: str, key: str, payload: dict) -> bool:
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute("""
+                INSERT OR IGNORE INTO tasks (id, kind, payload, created_at, updated_at) VALUES (?, ?, ?, ?, ?)
+            """, (f"{kind}:{key}", kind, json.dumps(payload, ensure_ascii=False), now, now))
+        return cursor.rowcount > 0
+
+    def results(self, task_ids: list) -> dict:
+        # {task_id: result} for the finished tasks among `task_ids`, failed ones map to None
+        with self._lock:
+            rows = self._conn.execute(f"""
+                SELECT id, state, result FROM tasks
+                WHERE id IN ({', '.join('?' * len(task_ids))}) AND state IN ('done', 'failed')
+            """, list(task_ids)).fetchall()
+        return {task_id: json.loads(result) if state == "done" and result else None
+                for task_id, state, result in rows}
+
+    def requeue_expired(self) -> dict:
+        """
+        Returns expired leases to the queue, or fails them once they used up
+        MAX_ATTEMPTS. `claim` takes expired leases on its own; this keeps
+        the states and `stats` accurate while no worker is claiming.
+        """
+        now = time.time()
+        def requeue():
+            failed = self._conn.execute("""
+                UPDATE tasks SET state = 'failed', worker = NULL, error = 'lease expired', updated_at = ?
+                WHERE state = 'leased' AND lease_until < ? AND attempts >= ?
+            """, (now, now, self.max_attempts)).rowcount
+            requeued = self._conn.execute("""
+                UPDATE tasks SET state = 'queued', worker = NULL, updated_at = ?
+                WHERE state = 'leased' AND lease_until < ?
+            """, (now, now)).rowcount
+            return {"requeued": requeued, "failed": failed}
+        counts = self._transaction(requeue)
+        if counts["requeued"] or counts["failed"]:
+            print(f"Expired leases: {counts['requeued']} requeued, {counts['failed']} failed")
+        return counts
+
+    def drained(self) -> bool:
+        with self._lock:
+            _, closed = self._run_state()
+            active = self._conn.execute("SELECT COUNT(*) FROM tasks WHERE state IN ('queued', 'leased')").fetchone()[0]
+        return closed and active == 0
+
+    # Workers
+
+    def current_run(self) -> str:
+        # Id of the open run, None while no run is open
+        with self._lock:
+            run_id, closed = self._run_state()
+        return None if closed else run_id
+
+    def claim(self, worker: str, limit: int = 1) -> list:
+        # Page tasks first: they are what produces the listing tasks
+        now = time.time()
+        def claim():
+            rows = self._conn.execute(f"""
+                SELECT id, kind, payload, attempts FROM tasks WHERE {CLAIMABLE}
+                ORDER BY kind = 'page' DESC, created_at LIMIT ?
+            """, (now, self.max_attempts, limit)).fetchall()
+            self._conn.executemany("""
+                UPDATE tasks SET state = 'leased', worker = ?, lease_until = ?, attempts = attempts + 1, updated_at = ?
+                WHERE id = ?
+            """, [(worker, now + self.lease_seconds, now, row[0]) for row in rows])
+            return [{"id": task_id, "kind": kind, "payload": json.loads(payload), "attempts": attempts + 1}
+                    for task_id, kind, payload, attempts in rows]
+        return self._transaction(claim)
+
+    def heartbeat(self, worker: str, task_ids: list) -> list:
+        """Extends the leases `worker` still holds. Returns the ids whose lease was lost."""
+        if not task_ids:
+            return []
+        now = time.time()
+        def heartbeat():
+            lost = []
+            for task_id in task_ids:
+                updated = self._conn.execute("""
+                    UPDATE tasks SET lease_until = ?, updated_at = ?
+                    WHERE id = ? AND worker = ? AND state = 'leased'
+                """, (now + self.lease_seconds, now, task_id, worker)).rowcount
+                if not updated:
+                    lost.append(task_id)
+            return lost
+        return self._transaction(heartbeat)
+
+    def complete(self, task_id: str, worker: str, result: dict = None) -> bool:
+        # False when the lease was lost to another worker in the meantime
+        with self._lock:
+            cursor = self._conn.execute("""
+                UPDATE tasks SET state = 'done', worker = NULL, result = ?, updated_at = ?
+                WHERE id = ? AND worker = ? AND state = 'leased'
+            """, (json.dumps(result) if result is not None else None, time.time(), task_id, worker))
+        return cursor.rowcount > 0
+
+    def fail(self, task_id: str, worker: str, error: str = None) -> None:
+        # Back to the queue for another attempt, or failed for good after MAX_ATTEMPTS
+        with self._lock:
+            self._conn.execute("""
+                UPDATE tasks SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END,
+                                 worker = NULL, error = ?, updated_at = ?
+                WHERE id = ? AND worker = ? AND state = 'leased'
+            """, (self.max_attempts, error, time.time(), task_id, worker))
+
+    def finished(self, worker: str, run_id: str) -> bool:
+        """
+        True once run `run_id` is closed and nothing is left for `worker` to
+        claim or wait for: no queued tasks and no live leases of other
+        workers, which could still expire and come back.
+        """
+        self.requeue_expired()
+        with self._lock:
+            current_run, closed = self._run_state()
+            waiting = self._conn.execute("""
+                SELECT COUNT(*) FROM tasks
+                WHERE state = 'queued' OR (state = 'leased' AND worker != ?)
+            """, (worker,)).fetchone()[0]
+        return current_run == run_id and closed and waiting == 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            rows = self._conn.execute("SELECT kind, state, COUNT(*) FROM tasks GROUP BY kind, state").fetchall()
+        stats = {}
+        for kind, state, count in rows:
+            stats.setdefault(kind, {})[state] = count
+        return stats
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def create_work_queue(distributed_config: dict) -> WorkQueue:
+    return WorkQueue(path=distributed_config['QUEUE_PATH'],
+                     lease_seconds=distributed_config['LEASE_SECONDS'],
+                     max_attempts=distributed_config['MAX_ATTEMPTS'])
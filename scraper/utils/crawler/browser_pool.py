@@ -0,0 +1,157 @@
+import time
+import asyncio
+from contextlib import asynccontextmanager
+from playwright.async_api import async_playwright
+from utils.connection.replay import install_replay_route
+from utils.crawler.routing import *
+
+
+'''
+BROWSER POOL
+'''
+
+
+class BrowserPool:
+    """
+    Long-lived Chromium browser shared by a worker. The pool keeps `size`
+    reusable context/page slots and recycles a slot after `max_navigations`
+    borrows so a single page cannot grow memory without bound. When a
+    `routing` config is given, every page aborts or stubs the requests it
+    does not need and keeps per-borrow counters in `route_stats(page)`.
+
+    With a `proxy_pool`, each context gets its own endpoint and header
+    profile from the pool. Every borrow is reported to the pool, as a
+    failure when the caller raised or called `mark_failed(page)`, and a
+    slot whose endpoint gets quarantined moves to another endpoint.
+
+    With a `replay_url`, pages load everything from the record/replay
+    stand-in server instead, and no proxy is used.
+
+    Usage:
+        async with BrowserPool(...) as pool:
+            async with pool.page() as page:
+                await page.goto(url)
+    """
+
+    def __init__(self,
+                 headless: bool,
+                 proxy: dict,
+                 headers: dict,
+                 size: int = 1,
+                 max_navigations: int = 25,
+                 routing: dict = None,
+                 proxy_pool = None,
+                 replay_url: str = None):
+        self.headless = headless
+        self.proxy = proxy
+        self.headers = headers
+        self.size = size
+        self.max_navigations = max_navigations
+        self.routing = routing
+        self.proxy_pool = proxy_pool
+        self.replay_url = replay_url
+        self._playwright = None
+        self._browser = None
+        self._slots = asyncio.Queue()
+        self._lock = asyncio.Lock()
+        self._route_stats = {}
+        self._failed = set()
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def start(self):
+        self._playwright = await async_playwright().start()
+        await self._launch()
+        for _ in range(self.size):
+            self._slots.put_nowait(await self._new_slot())
+        return self
+
+    async def close(self):
+        while not self._slots.empty():
+            slot = self._slots.get_nowait()
+            await self._close_slot(slot)
+        if self._browser:
+            await self._browser.close()
+            self._browser = None
+        if self._playwright:
+            await self._playwright.stop()
+            self._playwright = None
+
+    async def _launch(self):
+        self._browser = await self._playwright.chromium.launch(proxy=None if self.replay_url else self.proxy,
+                                                               headless=self.headless)
+
+    async def _ensure_browser(self):
+        # Relaunch once if Chromium crashed or was disconnected
+        async with self._lock:
+            if self._browser is None or not self._browser.is_connected():
+                print("Browser disconnected. Relaunching...")
+                await self._launch()
+
+    async def _new_slot(self) -> dict:
+        endpoint = None
+        if self.replay_url:
+            context = await self._browser.new_context(extra_http_headers=self.headers)
+        elif self.proxy_pool is not None:
+            endpoint = self.proxy_pool.acquire()
+            context = await self._browser.new_context(proxy=endpoint["server"],
+                                                      extra_http_headers=self.proxy_pool.new_session_headers(endpoint))
+        else:
+            context = await self._browser.new_context(extra_http_headers=self.headers)
+        page = await context.new_page()
+        if self.replay_url:
+            # Installed first so it runs after the blocking routes
+            await install_replay_route(page, self.replay_url)
+        if self.routing and self.routing.get('ENABLED', False):
+            stats = new_route_stats()
+            await install_routes(page, self.routing, stats)
+            self._route_stats[page] = stats
+        return {"context": context, "page": page, "navigations": 0, "endpoint": endpoint}
+
+    async def _close_slot(self, slot: dict):
+        self._route_stats.pop(slot["page"], None)
+        try:
+            await slot["context"].close()
+        except Exception as e:
+            print(f"Error closing browser context: {e}")
+
+    async def _recycle(self, slot: dict) -> dict:
+        await self._close_slot(slot)
+        await self._ensure_browser()
+        return await self._new_slot()
+
+    def mark_failed(self, page) -> None:
+        """Reports the current borrow of `page` as a failure of its proxy."""
+        self._failed.add(page)
+
+    def route_stats(self, page) -> dict:
+        """Request counters and bytes saved since `page` was borrowed."""
+        return dict(self._route_stats.get(page, {}))
+
+    @asynccontextmanager
+    async def page(self):
+        """Borrows a page from the pool, waiting if every slot is in use."""
+        slot = await self._slots.get()
+        ok = False
+        started = time.monotonic()
+        try:
+            endpoint = slot["endpoint"]
+            if slot["navigations"] >= self.max_navigations or slot["page"].is_closed() or \
+                    (endpoint is not None and self.proxy_pool.is_quarantined(endpoint)):
+                slot = await self._recycle(slot)
+            slot["navigations"] += 1
+            if slot["page"] in self._route_stats:
+                reset_route_stats(self._route_stats[slot["page"]])
+            started = time.monotonic()
+            yield slot["page"]
+            ok = slot["page"] not in self._failed
+        finally:
+            self._failed.discard(slot["page"])
+            if slot["endpoint"] is not None:
+                self.proxy_pool.report(slot["endpoint"], ok, time.monotonic() - started)
+            self._slots.put_nowait(slot)
@@ -0,0 +1,128 @@
+import functools
+from bs4 import BeautifulSoup, UnicodeDammit
+from datetime import datetime
+
+try:
+    from lxml import etree
+    from lxml import html as lxml_html
+except ImportError:
+    etree = None
+    lxml_html = None
+
+
+'''
+CARD RECORDS
+'''
+
+BASE_URL = "https://www.fincaraiz.com.co"
+
+
+def card_record(href, price, location, typology, agency, added_at) -> dict:
+    # Raw text of a listing card, turned into card_info by scrape_listing_card
+    return {
+        "link": BASE_URL + href if href else None,
+        "price": price,
+        "location": location,
+        "typology": typology,
+        "agency": agency,
+        "added_at": added_at
+    }
+
+
+def page_timestamp() -> str:
+    # Cards of one page share the time the page was parsed
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+'''
+BEAUTIFULSOUP BACKEND
+'''
+
+def tag_text(tag):
+    return tag.get_text(strip=True) if tag else None
+
+
+def parse_cards_bs4(html) -> list:
+    soup = BeautifulSoup(html, "html.parser")
+    added_at = page_timestamp()
+    records = []
+    for card in soup.find_all("div", class_="listingCard"):
+        link_tag = card.find('a', class_='lc-cardCover')
+        records.append(card_record(href=link_tag.get('href') if link_tag else None,
+                                   price=tag_text(card.find('div', class_='lc-price')),
+                                   location=tag_text(card.find('strong', class_='lc-location')),
+                                   typology=tag_text(card.find('div', class_='lc-typologyTag')),
+                                   agency=tag_text(card.find('strong', class_='body body-2 high')),
+                                   added_at=added_at))
+    return records
+
+
+'''
+LXML BACKEND
+'''
+
+def has_class(name: str) -> str:
+    # XPath equivalent of the CSS selector .name
+    return f'contains(concat(" ", normalize-space(@class), " "), " {name} ")'
+
+
+if etree is not None:
+    # Compiled once at import, evaluated in C for every page
+    CARDS_XPATH = etree.XPath(f'//div[{has_class("listingCard")}]')
+    LINK_XPATH = etree.XPath(f'(.//a[{has_class("lc-cardCover")}])[1]/@href')
+    PRICE_XPATH = etree.XPath(f'(.//div[{has_class("lc-price")}])[1]')
+    LOCATION_XPATH = etree.XPath(f'(.//strong[{has_class("lc-location")}])[1]')
+    TYPOLOGY_XPATH = etree.XPath(f'(.//div[{has_class("lc-typologyTag")}])[1]')
+    AGENCY_XPATH = etree.XPath('(.//strong[@class="body body-2 high"])[1]')
+
+
+def element_text(elements):
+    # Same result as BeautifulSoup's get_text(strip=True)
+    if not elements:
+        return None
+    return "".join(text.strip() for text in elements[0].itertext())
+
+
+def parse_cards_lxml(html) -> list:
+    if not html:
+        return []
+    if isinstance(html, bytes):
+        # Decoded like BeautifulSoup does: lxml alone reads pages without <meta charset> as Latin-1
+        html = UnicodeDammit(html, is_html=True).unicode_markup
+    document = lxml_html.fromstring(html)
+    added_at = page_timestamp()
+    records = []
+    for card in CARDS_XPATH(document):
+        hrefs = LINK_XPATH(card)
+        records.append(card_record(href=str(hrefs[0]) if hrefs else None,
+                                   price=element_text(PRICE_XPATH(card)),
+                                   location=element_text(LOCATION_XPATH(card)),
+                                   typology=element_text(TYPOLOGY_XPATH(card)),
+                                   agency=element_text(AGENCY_XPATH(card)),
+                                   added_at=added_at))
+    return records
+
+
+'''
+BACKENDS
+'''
+
+CARD_PARSERS = {
+    "bs4": parse_cards_bs4,
+    "lxml": parse_cards_lxml
+}
+
+
+@functools.lru_cache(maxsize=None)
+def get_card_parser(backend: str):
+    """
+    Returns the card parser for `backend` ("bs4" or "lxml"). lxml is an
+    optional dependency, so "lxml" falls back to BeautifulSoup when it is
+    not installed.
+    """
+    if backend not in CARD_PARSERS:
+        raise ValueError(f"Unknown parser backend: {backend}")
+    if backend == "lxml" and etree is None:
+        print("lxml is not installed, parsing listing cards with BeautifulSoup")
+        return parse_cards_bs4
+    return CARD_PARSERS[backend]
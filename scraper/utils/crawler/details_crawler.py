@@ -1,7 +1,13 @@
 import asyncio
-from playwright.async_api import async_playwright
 import aiohttp
 import os
+from utils.connection.proxy_pool import ProxyPool
+from utils.connection.rate_limit import RateLimiter, limited
+from utils.connection.resilience import Resilience
+from utils.crawler.browser_pool import BrowserPool
+from utils.crawler.details_http import *
+from utils.crawler.image_downloader import *
+from utils.monitoring.metrics import METRICS
 from utils.processing.parsing import *
 from utils.processing.geocalc import *
 
@@ -10,22 +16,14 @@ from utils.processing.geocalc import *
 IMAGES
 '''
 
-async def download_image(image_url, folder):
-    async with aiohttp.ClientSession() as session:
-        async with session.get(image_url) as response:
-            if response.status == 200:
-                filename = os.path.join(folder, image_url.split('/')[-1])
-                with open(filename, 'wb') as file:
-                    file.write(await response.read())
-                print(f"Image saved: {filename}")
-            else:
-                print(f"Failed to download {image_url}")
-
-async def get_apartment_images(page, timeout,  folder):
-    # Ensure the download folder exists
-    if not os.path.exists(folder):
-        os.makedirs(folder)
+async def download_image(image_url, folder, downloader:ImageDownloader = None):
+    if downloader is None:
+        async with ImageDownloader() as downloader:
+            return await downloader.download(image_url, folder)
+    return await downloader.download(image_url, folder)
 
+@METRICS.timed("extractor", extractor="get_image_urls")
+async def get_image_urls(page, timeout):
     # Click on the cover to reveal images
     cover_element = await page.query_selector('.cover-gradient')
     if cover_element:
@@ -33,49 +31,46 @@ async def get_apartment_images(page, timeout,  folder):
         await page.wait_for_selector('.pmp-image', timeout=timeout)  # Wait for images to load
 
         # Scrape the images from the revealed gallery
-        image_elements = await page.query_selector_all('.pmp-image img')
-        image_urls = []
-        for img in image_elements:
-            img_src = await img.get_attribute('src')
-            if img_src:
-                image_urls.append(img_src)
-
-        # Download the images asynchronously
-        download_tasks = [download_image(url, folder) for url in image_urls]
-        await asyncio.gather(*download_tasks)
-
-        print(f"Downloaded {len(image_urls)} images.")
+        return await page.eval_on_selector_all('.pmp-image img',
+                                               'imgs => imgs.map(img => img.getAttribute("src")).filter(Boolean)')
     else:
         print("Could not find the cover element.")
+        return []
+
+@METRICS.timed("extractor", extractor="get_apartment_images")
+async def get_apartment_images(page, timeout,  folder, downloader:ImageDownloader = None):
+    # Without a folder only the gallery URLs are collected, for in-memory fetching
+    image_urls = await get_image_urls(page, timeout)
+    if image_urls and folder:
+        await download_images(image_urls, folder, downloader)
+    return image_urls
+
+async def download_images(image_urls, folder, downloader:ImageDownloader = None):
+    # Download the images through the shared, bounded downloader
+    if downloader is None:
+        async with ImageDownloader() as downloader:
+            return await download_images(image_urls, folder, downloader)
+
+    records = await downloader.download_all(image_urls, folder)
+    summary = summarize_downloads(records)
+    print(f"Downloaded {summary['downloaded']}/{summary['images']} images "
+          f"({summary['bytes']} bytes in {summary['seconds']:.2f}s, {summary['retries']} retries).")
+    return records
 
 '''
 COORDINATES
 '''
 
-async def get_marker_offset(page):
-    marker = await page.query_selector('img[src="/icons/fr-symbol.svg"]')
-    if marker:
-        style = await marker.get_attribute("style")
-        return extract_translate3d(style)
-    return None
-
-
-async def get_tile_info(page):
-    return await page.evaluate('''() => {
-        const tile = document.querySelector('.leaflet-tile-loaded');
-        if (!tile) return null;
-        return {
-            url: tile.src,
-            transform: tile.style.transform
-        };
-    }''')
+def parse_tile_url(url):
+    url_parts = url.split('/')
+    zoom = int(url_parts[-3])
+    tile_x = int(url_parts[-2])
+    tile_y = int(url_parts[-1].split('.')[0].split('@')[0])
+    return zoom, tile_x, tile_y
 
 
 def calculate_marker_coordinates(tile_info, tile_transform, marker_offset):
-    url_parts = tile_info['url'].split('/')
-    zoom = int(url_parts[-3])
-    tile_x = int(url_parts[-2])
-    tile_y = int(tile_info['url'].split('/')[-1].split('.')[0].split('@')[0])
+    zoom, tile_x, tile_y = parse_tile_url(tile_info['url'])
     tile_offset_x, tile_offset_y = extract_translate3d(tile_transform)
 
     global_tile_px_x = tile_x * 256
@@ -88,22 +83,18 @@ def calculate_marker_coordinates(tile_info, tile_transform, marker_offset):
     return pixel_to_latlng(marker_global_x, marker_global_y, zoom)
 
 
-async def calculate_area_coordinates(page):
-    tiles = await page.query_selector_all('.leaflet-tile-loaded')
+def calculate_tiles_coordinates(tiles):
     centers_x, centers_y = [], []
     zoom = None
 
     for tile in tiles:
-        src = await tile.get_attribute('src')
-        style = await tile.get_attribute('style')
+        src = tile.get('url')
+        style = tile.get('style')
         if not src or not style:
             continue
 
         try:
-            url_parts = src.split('/')
-            zoom = int(url_parts[-3])
-            tile_x = int(url_parts[-2])
-            tile_y = int(url_parts[-1].split('.')[0].split('@')[0])
+            zoom, tile_x, tile_y = parse_tile_url(src)
             offset_x, offset_y = extract_translate3d(style)
             global_x = tile_x * 256 - offset_x + 128
             global_y = tile_y * 256 - offset_y + 128
@@ -118,21 +109,20 @@ async def calculate_area_coordinates(page):
         return pixel_to_latlng(avg_x, avg_y, zoom)
     return None, None
 
-async def get_coordinates(page):
-    # Get marker offset (if it exists)
-    marker_offset = await get_marker_offset(page)
-    if marker_offset:
-        # If a marker is found, calculate coordinates based on tile info
-        tile_info = await get_tile_info(page)
-        if tile_info:
-            lat, lng = calculate_marker_coordinates(tile_info, tile_info['transform'], marker_offset)
-            print(f"Marker Coordinates:\nLatitude: {lat}\nLongitude: {lng}")
-            print(f"https://www.google.com/maps?q={lat},{lng}")
-            return lat, lng
+
+def coordinates_from_geometry(geometry):
+    # Marker position relative to the first loaded tile, if a marker exists
+    marker_offset = extract_translate3d(geometry['marker_style']) if geometry.get('marker_style') else None
+    tiles = geometry.get('tiles') or []
+    if marker_offset and marker_offset[0] is not None and tiles:
+        lat, lng = calculate_marker_coordinates(tiles[0], tiles[0]['transform'], marker_offset)
+        print(f"Marker Coordinates:\nLatitude: {lat}\nLongitude: {lng}")
+        print(f"https://www.google.com/maps?q={lat},{lng}")
+        return lat, lng
 
     # Fallback if no marker is found
     print("No marker found. Falling back to center of tiles...")
-    lat, lng = await calculate_area_coordinates(page)
+    lat, lng = calculate_tiles_coordinates(tiles)
     if lat is not None and lng is not None:
         print(f"Area Coordinates:\nLatitude: {lat}\nLongitude: {lng}")
         print(f"https://www.google.com/maps?q={lat},{lng}")
@@ -142,189 +132,123 @@ async def get_coordinates(page):
         return None, None
 
 '''
-TECHNICAL SHEET
+DETAILS EXTRACTION
 '''
 
-async def get_technical_sheet(page, timeout):
-    try:
-        await page.wait_for_selector('div.technical-sheet', timeout=timeout)
-
-        # Add logging inside the JS
-        data = await page.evaluate("""
+# Every field scrape_details_page needs, read from the DOM in one round trip.
+# A field is null when its section is not on the page.
+DETAILS_SCRIPT = r"""
     () => {
-        const sheet = document.querySelector('div.technical-sheet');
-        if (!sheet) return { error: "No technical-sheet found" };
-
-        const items = sheet.querySelectorAll('.ant-row');
-        console.log("Found technical-sheet with", items.length, "items");
-
-        const result = {};
-        items.forEach((item, index) => {
-            const labelEl = item.querySelector('span.ant-typography:not([class*=" "])');
-            const valueContainer = item.querySelector('.ant-typography.ant-typography-ellipsis.ant-typography-ellipsis-multiple-line');
-            const valueEl = valueContainer?.querySelector('strong');
-
-            const label = labelEl?.innerText.trim();
-            const value = valueEl?.innerText.trim();
-
-            // Store the label and value (if available) in the result object
-            if (label && value) {
-                result[label] = value; // Include title as part of the result
-            } else {
-                console.log(`Item ${index} incomplete — label missing`);
+        const text = (el) => el ? el.innerText.trim() : null;
+
+        let price = null;
+        let administracion = null;
+        const priceTag = document.querySelector('div.property-price-tag');
+        const adminSpan = priceTag?.querySelector('span.commonExpenses');
+        if (priceTag) {
+            // The price is the tag's text without the common expenses span
+            const tag = priceTag.cloneNode(true);
+            tag.querySelector('span.commonExpenses')?.remove();
+            const match = tag.textContent.match(/\$\s?([\d.,]+)/);
+            if (match && match[1]) {
+                price = parseInt(match[1].replace(/[.,]/g, ''), 10);
             }
-        });
-
-        return result;
-    }
-""")
-
-        return data
-
-    except Exception as e:
-        print(f"Error extracting technical sheet: {e}")
-        return None
-'''
-DESCRIPTION
-'''
-
-async def get_description(page, timeout):
-    try:
-        # Wait for the description element to be available
-        await page.wait_for_selector('div.ant-typography.property-description.body.body-regular.body-1.high', timeout=timeout)
-
-        # Capture the description text using evaluate
-        description = await page.evaluate("""
-            () => {
-                const descriptionEl = document.querySelector('div.ant-typography.property-description.body.body-regular.body-1.high span');
-                if (!descriptionEl) return { error: "No description found" };
-                
-                const description = descriptionEl.innerText.trim(); // Get the text inside the span element
-                return description;
-            }
-        """)
-
-        # Log and return the description
-        if description and description != "No description found":
-            return description
-        else:
-            return None
-
-    except Exception as e:
-        print(f"Error extracting description: {e}")
-        return {}
-
-'''
-UPLOAD DATE
-'''
-
-
-async def get_upload_date(page, timeout):
-    try:
-        # Wait for the span element to be available
-        await page.wait_for_selector('span.ant-typography[style="font-size:13px"]', timeout=timeout)
-
-        # Capture the fecha ingresada using evaluate
-        fecha = await page.evaluate("""
-            () => {
-                const descriptionEl = document.querySelector('span.ant-typography[style="font-size:13px"]');
-                if (!descriptionEl) return { error: "No description found" };
-
-                const text = descriptionEl.innerText.trim(); // Get the text inside the span element
-                // Extract the date using regex. This pattern will capture the date format like "5 de abril de 2025"
-                const datePattern = /\d{1,2}\sde\s\w+\sde\s\d{4}/;
-                const dateMatch = text.match(datePattern);
-                return dateMatch ? dateMatch[0] : 'Date not found';
+        }
+        if (adminSpan) {
+            const match = adminSpan.innerText.trim().match(/\$\s?([\d.,]+)/);
+            if (match && match[1]) {
+                administracion = parseInt(match[1].replace(/[.,]/g, ''), 10);
             }
-        """)
-
-        # Log and return the fecha ingresada
-        if fecha and fecha != "Date not found":
-            fecha_dt = parse_date_text(fecha)
-            return fecha_dt
-        else:
-            return None
-
-    except Exception as e:
-        print(f"Error extracting fecha ingresada: {e}")
-        return {}
-
-'''
-FACILITIES
-'''
+        }
+
+        let facilities = null;
+        const facilitiesContainer = document.querySelector('div.property-facilities');
+        if (facilitiesContainer) {
+            facilities = [];
+            facilitiesContainer.querySelectorAll('div.ant-row').forEach(item => {
+                const label = text(item.querySelector('span.ant-typography:not([class*=" "])'));
+                if (label) facilities.push(label);
+            });
+        }
+
+        let technical_data = null;
+        const sheet = document.querySelector('div.technical-sheet');
+        if (sheet) {
+            technical_data = {};
+            sheet.querySelectorAll('.ant-row').forEach(item => {
+                const label = text(item.querySelector('span.ant-typography:not([class*=" "])'));
+                const valueContainer = item.querySelector('.ant-typography.ant-typography-ellipsis.ant-typography-ellipsis-multiple-line');
+                const value = text(valueContainer?.querySelector('strong'));
+                if (label && value) technical_data[label] = value;
+            });
+        }
+
+        const description = text(document.querySelector('div.ant-typography.property-description.body.body-regular.body-1.high span'));
+
+        let upload_date = null;
+        const dateText = text(document.querySelector('span.ant-typography[style="font-size:13px"]'));
+        if (dateText) {
+            const dateMatch = dateText.match(/\d{1,2}\sde\s\w+\sde\s\d{4}/);
+            upload_date = dateMatch ? dateMatch[0] : null;
+        }
+
+        const marker = document.querySelector('img[src="/icons/fr-symbol.svg"]');
+        const tiles = Array.from(document.querySelectorAll('.leaflet-tile-loaded')).map(tile => ({
+            url: tile.src,
+            style: tile.getAttribute('style'),
+            transform: tile.style.transform
+        }));
 
-async def get_facilities(page, timeout):
-    try:
-        # Wait for the property-facilities container
-        await page.wait_for_selector('div.property-facilities', timeout=timeout)
-
-        # Evaluate JavaScript to extract the facilities list
-        facilities = await page.evaluate("""
-            () => {
-                const container = document.querySelector('div.property-facilities');
-                if (!container) return [];
-
-                const rows = container.querySelectorAll('div.ant-row');
-                const result = [];
-
-                rows.forEach((item, index) => {
-                    const labelEl = item.querySelector('span.ant-typography:not([class*=" "])');
-                    const label = labelEl?.innerText.trim();
-
-                    if (label) {
-                        result.push(label);
-                    } else {
-                        console.log(`${index} not found`);
-                    }
-                });
-
-                return result;
+        return {
+            price: price,
+            administracion: administracion,
+            facilities: facilities,
+            technical_data: technical_data,
+            description: description,
+            upload_date: upload_date,
+            geometry: {
+                marker_style: marker ? marker.getAttribute('style') : null,
+                tiles: tiles
             }
-        """)
-        facilities = set(facilities) 
-        return facilities
-
-    except Exception as e:
-        print(f"Error extracting facilities: {e}")
-        return []
-
-'''
-ADMINISTRATION VALUE
-'''
-
-async def get_admin_value(page, timeout):
+        };
+    }
+"""
+
+@METRICS.timed("extractor", extractor="extract_details")
+async def extract_details(page, timeout):
+    """
+    Waits once for the page to settle and reads every detail field plus the
+    map geometry in a single evaluate. Returns the fields, the coordinates and
+    the list of fields that were not found on the page.
+    """
     try:
-        # Wait for the price tag container to appear 
-        await page.wait_for_selector('div.property-price-tag', timeout=timeout)
-        # Evaluate JavaScript to extract the administración value
-        administracion = await page.evaluate("""
-            () => {
-                const container = document.querySelector('div.property-price-tag');
-                if (!container) return null;
-
-                const adminSpan = container.querySelector('span.commonExpenses');
-                if (!adminSpan) return null;
-
-                const text = adminSpan.innerText.trim();
-                const match = text.match(/\\$\\s?([\\d.,]+)/);
-
-                if (match && match[1]) {
-                    const numericString = match[1].replace(/[.,]/g, '');
-                    return parseInt(numericString, 10);
-                }
-
-                return null;
-            }
-        """)
-        # Return the extracted administración value
-        if administracion is not None:
-            return administracion
-        else:
-            return None
-    # Handle any exceptions that occur during the extraction process
-    except Exception as e:
-        print(f"Error extracting administración value: {e}")
-        return None
+        with METRICS.timer("extract_phase", phase="network_idle"):
+            await page.wait_for_load_state('networkidle', timeout=timeout)
+    except Exception:
+        print("Page did not reach network idle. Extracting what is loaded...")
+
+    with METRICS.timer("extract_phase", phase="evaluate"):
+        data = await page.evaluate(DETAILS_SCRIPT)
+
+    with METRICS.timer("extract_phase", phase="coordinates"):
+        coordinates = coordinates_from_geometry(data['geometry'])
+
+    details = {
+        "coordinates": coordinates,
+        "price": data.get('price'),
+        "administracion": data.get('administracion'),
+        "facilities": set(data['facilities']) if data.get('facilities') is not None else None,
+        "upload_date": parse_date_text(data['upload_date']) if data.get('upload_date') else None,
+        "technical_data": data.get('technical_data'),
+        "description": data.get('description')
+    }
+    # Same check as parse_details_html, so REQUIRED_FIELDS means the same in both modes
+    details["missing_fields"] = missing_detail_fields(details)
+    if details["missing_fields"]:
+        print(f"Missing fields: {', '.join(details['missing_fields'])}")
+    if details["facilities"] is None:
+        details["facilities"] = []
+    return details
 
 '''
 MAIN FUNCTION
@@ -336,49 +260,113 @@ async def scrape_details_page(headless:bool,
                               url:str, 
                               img_folder:str,
                               timeout:int, 
-                              element_timeout:int):
-
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(proxy=proxy, headless=headless)
-        context = await browser.new_context(extra_http_headers=headers)
-        page = await context.new_page()
-
+                              element_timeout:int,
+                              pool:BrowserPool = None,
+                              downloader:ImageDownloader = None,
+                              limiter:RateLimiter = None):
+
+    # Without a shared pool, fall back to a one-shot browser for this page
+    if pool is None:
+        async with BrowserPool(headless=headless, proxy=proxy, headers=headers) as pool:
+            return await scrape_details_page(headless=headless,
+                                             proxy=proxy,
+                                             headers=headers,
+                                             url=url,
+                                             img_folder=img_folder,
+                                             timeout=timeout,
+                                             element_timeout=element_timeout,
+                                             pool=pool,
+                                             downloader=downloader,
+                                             limiter=limiter)
+
+    async with pool.page() as page:
         try:
-            # Step 1: Navigate to the listing page
-            await page.goto(url=url, timeout=timeout)
-            await page.wait_for_selector('.leaflet-container', timeout=timeout)
-
-            admin_value = await get_admin_value(page, element_timeout)
-            facilities = await get_facilities(page, element_timeout)
-            upload_date = await get_upload_date(page, element_timeout)
-            technical_data = await get_technical_sheet(page, element_timeout)
-            description = await get_description(page, element_timeout)
-            upload_date = await get_upload_date(page, element_timeout)
-
-
-
-            # Step 2: Download the images
-            await get_apartment_images(page, element_timeout, img_folder)
-            
-            # Step 3: Get coordinates from the page
-            lat, lng = await get_coordinates(page)
+            # Step 1: Navigate to the listing page, paced like the HTTP requests to the same host
+            with METRICS.timer("navigation"):
+                async with limited(limiter, url) as slot:
+                    response = await page.goto(url=url, timeout=timeout)
+                    if response is not None:
+                        slot.record(response)
+                        if response.status == 429 or response.status >= 500:
+                            raise ValueError(f"Details page answered {response.status}")
+                    await page.wait_for_selector('.leaflet-container', timeout=timeout)
+
+            # Step 2: Read every field and the map geometry in one round trip
+            details = await extract_details(page, element_timeout)
+
+            # Step 3: Collect the gallery, downloading it only when a folder is given
+            details["image_urls"] = await get_apartment_images(page, element_timeout, img_folder, downloader)
+
+            lat, lng = details['coordinates']
             if lat is None or lng is None:
                 print("No coordinates could be found.")
             else:
-                coordinates = (lat, lng)
-                details = {
-                    "coordinates": coordinates,
-                    "administracion": admin_value,
-                    "facilities": facilities,
-                    "upload_date": upload_date,
-                    "technical_data": technical_data,
-                    "description": description
-                }
                 print(f"Coordinates successfully extracted: Latitude = {lat}, Longitude = {lng}")
+                details["route_stats"] = pool.route_stats(page)
+                if details["route_stats"]:
+                    print(f"Requests blocked: {details['route_stats']['blocked']}, "
+                          f"stubbed: {details['route_stats']['stubbed']}, "
+                          f"bytes saved: {details['route_stats']['bytes_saved']}")
                 return details
 
         except Exception as e:
             print(f"Error during scraping: {e}")
-        finally:
-            await browser.close()
+            pool.mark_failed(page)
+
+
+async def scrape_details(url:str,
+                         img_folder:str,
+                         timeout:int,
+                         element_timeout:int,
+                         pool:BrowserPool,
+                         downloader:ImageDownloader = None,
+                         session:aiohttp.ClientSession = None,
+                         http_proxy:str = None,
+                         mode:str = "browser",
+                         required_fields:list = ("coordinates",),
+                         proxy_pool:ProxyPool = None,
+                         limiter:RateLimiter = None,
+                         resilience:Resilience = None):
+    """
+    In "http" mode, reads the details from the server-rendered HTML with a
+    single request and only falls back to the browser when a required field
+    is missing. In "browser" mode it is scrape_details_page. With a
+    `proxy_pool`, the request goes through one of its endpoints instead of
+    `http_proxy`. A `limiter` paces the HTTP requests per host, and
+    `resilience` retries and hedges them as its "details" endpoint. The
+    limiter also paces the browser's navigations.
+    """
+    if mode == "http":
+        async def request():
+            if proxy_pool is not None:
+                return await proxy_pool.call(lambda endpoint: request_details_html(session=session,
+                                                                                   url=url,
+                                                                                   proxy=endpoint["url"],
+                                                                                   headers=endpoint["headers"],
+                                                                                   limiter=limiter))
+            return await request_details_html(session=session, url=url, proxy=http_proxy, limiter=limiter)
 
+        try:
+            html = await (resilience.call("details", request) if resilience is not None else request())
+            details = parse_details_html(html)
+        except Exception as e:
+            print(f"Error fetching details page {url}: {e}")
+            details = None
+        if details:
+            missing_required = [field for field in required_fields if field in details["missing_fields"]]
+            if not missing_required:
+                if img_folder:
+                    await download_images(details["image_urls"], img_folder, downloader)
+                return details
+            print(f"Missing required fields {missing_required}. Falling back to browser...")
+
+    return await scrape_details_page(headless=pool.headless,
+                                     proxy=pool.proxy,
+                                     headers=pool.headers,
+                                     url=url,
+                                     img_folder=img_folder,
+                                     timeout=timeout,
+                                     element_timeout=element_timeout,
+                                     pool=pool,
+                                     downloader=downloader,
+                                     limiter=limiter)
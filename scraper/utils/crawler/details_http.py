@@ -0,0 +1,247 @@
+import re
+import copy
+import json
+import aiohttp
+import pandas as pd
+from bs4 import BeautifulSoup
+from utils.connection.rate_limit import RateLimiter, limited
+from utils.monitoring.metrics import METRICS
+from utils.processing.parsing import *
+
+
+'''
+EMBEDDED DATA
+'''
+
+def extract_next_data(soup: BeautifulSoup) -> dict:
+    # Listing data is server-rendered into <script id="__NEXT_DATA__">
+    script_tag = soup.find("script", id="__NEXT_DATA__")
+    if not script_tag or not script_tag.string:
+        return {}
+    try:
+        data = json.loads(script_tag.string)
+    except ValueError:
+        return {}
+    return data.get("props", {}).get("pageProps", {}).get("data", {}) or {}
+
+
+def parse_location_point(point: str):
+    # "POINT (lng lat)" -> (lat, lng)
+    match = re.search(r"POINT\s*\(\s*([-\d.]+)\s+([-\d.]+)\s*\)", point or "")
+    if not match:
+        return None
+    return float(match.group(2)), float(match.group(1))
+
+
+def to_int(value):
+    # "$ 350.000" or 350000.0 -> 350000, matching the browser extractor's parseInt
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    digits = re.sub(r"[^\d]", "", str(value))
+    return int(digits) if digits else None
+
+
+def to_naive_utc(value):
+    # The Parquet schema stores naive timestamps, so aware ones are converted to UTC first
+    timestamp = pd.to_datetime(value, errors="coerce", utc=True)
+    return None if pd.isna(timestamp) else timestamp.tz_convert(None)
+
+
+def details_from_next_data(data: dict) -> dict:
+    coordinates = None
+    if data.get("latitude") is not None and data.get("longitude") is not None:
+        coordinates = (data["latitude"], data["longitude"])
+    else:
+        coordinates = parse_location_point((data.get("locations") or {}).get("location_point"))
+
+    price = data.get("price")
+    if isinstance(price, dict):
+        price = price.get("amount")
+    common_expenses = (data.get("commonExpenses") or {}).get("amount")
+
+    facilities = None
+    if data.get("facilities") is not None:
+        facilities = {f.get("name") if isinstance(f, dict) else f for f in data["facilities"]}
+        facilities.discard(None)
+
+    technical_data = None
+    if data.get("technicalSheet") is not None:
+        technical_data = {item["text"]: item["value"]
+                          for item in data["technicalSheet"]
+                          if item.get("text") and item.get("value")}
+
+    upload_date = to_naive_utc(data["created_at"]) if data.get("created_at") else None
+
+    # None, not an empty gallery, when the page carries no image list at all
+    image_urls = None
+    if data.get("images") is not None:
+        image_urls = [img["image"] for img in data["images"] if isinstance(img, dict) and img.get("image")]
+
+    return {
+        "coordinates": coordinates,
+        "price": to_int(price) or None,
+        "administracion": to_int(common_expenses) or None,
+        "facilities": facilities,
+        "upload_date": upload_date,
+        "technical_data": technical_data,
+        "description": data.get("description"),
+        "image_urls": image_urls
+    }
+
+
+'''
+HTML
+'''
+
+def plain_label(row):
+    # span.ant-typography:not([class*=" "]) in DETAILS_SCRIPT: a span whose only class is ant-typography
+    return row.find(lambda tag: tag.name == "span" and tag.get("class") == ["ant-typography"])
+
+
+def details_from_html(soup: BeautifulSoup) -> dict:
+    # Same selectors as the browser extractor (DETAILS_SCRIPT), applied to the raw HTML
+    price = None
+    price_tag = soup.select_one("div.property-price-tag")
+    if price_tag:
+        # The price is the tag's text without the common expenses span
+        price_tag = copy.copy(price_tag)
+        for span in price_tag.select("span.commonExpenses"):
+            span.decompose()
+        match = re.search(r"\$\s?([\d.,]+)", price_tag.get_text(" ", strip=True))
+        if match:
+            price = int(re.sub(r"[.,]", "", match.group(1)))
+
+    administracion = None
+    admin_span = soup.select_one("div.property-price-tag span.commonExpenses")
+    if admin_span:
+        match = re.search(r"\$\s?([\d.,]+)", admin_span.get_text(strip=True))
+        if match:
+            administracion = int(re.sub(r"[.,]", "", match.group(1)))
+
+    facilities = None
+    container = soup.select_one("div.property-facilities")
+    if container:
+        facilities = set()
+        for row in container.select("div.ant-row"):
+            label = plain_label(row)
+            if label and label.get_text(strip=True):
+                facilities.add(label.get_text(strip=True))
+
+    technical_data = None
+    sheet = soup.select_one("div.technical-sheet")
+    if sheet:
+        technical_data = {}
+        for row in sheet.select(".ant-row"):
+            label = plain_label(row)
+            value = row.select_one(".ant-typography.ant-typography-ellipsis.ant-typography-ellipsis-multiple-line strong")
+            if label and value:
+                technical_data[label.get_text(strip=True)] = value.get_text(strip=True)
+
+    description_el = soup.select_one("div.ant-typography.property-description.body.body-regular.body-1.high span")
+    description = description_el.get_text(strip=True) if description_el else None
+
+    upload_date = None
+    date_el = soup.select_one('span.ant-typography[style="font-size:13px"]')
+    if date_el:
+        match = re.search(r"\d{1,2}\sde\s\w+\sde\s\d{4}", date_el.get_text(strip=True))
+        if match:
+            upload_date = parse_date_text(match.group(0))
+
+    return {
+        "price": price,
+        "administracion": administracion,
+        "facilities": facilities,
+        "upload_date": upload_date,
+        "technical_data": technical_data,
+        "description": description
+    }
+
+
+'''
+MAIN FUNCTION
+'''
+
+# Fields both extractors look for, checked against DETAIL.REQUIRED_FIELDS
+DETAIL_FIELDS = ("coordinates", "administracion", "facilities", "upload_date", "technical_data", "description")
+
+
+def missing_detail_fields(details: dict) -> list:
+    # Coordinates count as missing when either half is, as in (None, None)
+    missing = []
+    for field in DETAIL_FIELDS:
+        value = details.get(field)
+        if value is None or (field == "coordinates" and None in value):
+            missing.append(field)
+    return missing
+
+
+def parse_details_html(html) -> dict:
+    """
+    Builds the same `details` dict as scrape_details_page from the raw HTML,
+    preferring the embedded __NEXT_DATA__ JSON and filling gaps from the DOM.
+    Fields that could not be found are listed in `missing_fields`. The
+    gallery is only in __NEXT_DATA__, so without it "image_urls" is
+    missing too.
+    """
+    soup = BeautifulSoup(html, "html.parser")
+    details = details_from_next_data(extract_next_data(soup))
+    for field, value in details_from_html(soup).items():
+        if details.get(field) is None:
+            details[field] = value
+
+    details["missing_fields"] = missing_detail_fields(details)
+    if details["image_urls"] is None:
+        details["missing_fields"].append("image_urls")
+        details["image_urls"] = []
+    if details["facilities"] is None:
+        details["facilities"] = []
+    return details
+
+
+async def request_details_html(session: aiohttp.ClientSession,
+                               url: str,
+                               proxy: str,
+                               headers: dict = None,
+                               limiter: RateLimiter = None) -> bytes:
+    # Raises on failure, so callers can retry
+    async with limited(limiter, url) as slot:
+        async with session.get(url, proxy=proxy, headers=headers) as response:
+            slot.record(response)
+            response.raise_for_status()
+            html = await response.read()
+    METRICS.inc("bytes_transferred", len(html), source="details")
+    return html
+
+
+async def request_details_conditional(session: aiohttp.ClientSession,
+                                      url: str,
+                                      proxy: str,
+                                      headers: dict = None,
+                                      etag: str = None,
+                                      last_modified: str = None,
+                                      limiter: RateLimiter = None) -> dict:
+    """
+    Conditional GET of a details page with the validators of the last
+    check. Returns the status, the body (None on 304 Not Modified or a
+    removed listing) and the new validators. Other errors raise, so
+    callers can retry.
+    """
+    headers = dict(headers or {})
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    async with limited(limiter, url) as slot:
+        async with session.get(url, proxy=proxy, headers=headers) as response:
+            slot.record(response)
+            if response.status not in (304, 404, 410):
+                response.raise_for_status()
+            html = await response.read() if response.status == 200 else None
+            result = {"status": response.status,
+                      "html": html,
+                      "etag": response.headers.get("ETag") or etag,
+                      "last_modified": response.headers.get("Last-Modified") or last_modified}
+    METRICS.inc("bytes_transferred", len(html or b""), source="details")
+    return result
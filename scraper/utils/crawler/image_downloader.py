@@ -0,0 +1,185 @@
+import os
+import time
+import random
+import shutil
+import tempfile
+import asyncio
+import aiohttp
+from utils.connection.replay import ReplaySession
+from utils.monitoring.metrics import METRICS
+
+
+'''
+IMAGE DOWNLOADER
+'''
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class ImageDownloader:
+    """
+    Shared image download session for a worker. Downloads are bounded by a
+    semaphore, streamed to disk in chunks without blocking the event loop and
+    retried with exponential backoff on transient failures. Every download
+    returns a record with its timing and byte count; the downloader keeps
+    none of them, so a run-long instance does not grow.
+    """
+
+    def __init__(self,
+                 concurrency: int = 8,
+                 limit_per_host: int = 8,
+                 retries: int = 3,
+                 backoff: float = 0.5,
+                 chunk_size: int = 65536,
+                 timeout: int = 30,
+                 headers: dict = None,
+                 replay_url: str = None):
+        self.concurrency = concurrency
+        self.limit_per_host = limit_per_host
+        self.retries = retries
+        self.backoff = backoff
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self.headers = headers
+        self.replay_url = replay_url
+        self._session = None
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def start(self):
+        connector = aiohttp.TCPConnector(limit_per_host=self.limit_per_host)
+        self._session = aiohttp.ClientSession(headers=self.headers,
+                                              connector=connector,
+                                              timeout=aiohttp.ClientTimeout(total=self.timeout))
+        if self.replay_url:
+            self._session = ReplaySession(self._session, self.replay_url)
+        return self
+
+    async def close(self):
+        if self._session:
+            await self._session.close()
+            self._session = None
+
+    async def _stream_to_file(self, response, filename) -> int:
+        # Chunks are written from a worker thread so disk I/O never blocks the loop
+        temp_filename = filename + ".part"
+        size = 0
+        file = await asyncio.to_thread(open, temp_filename, 'wb')
+        try:
+            try:
+                async for chunk in response.content.iter_chunked(self.chunk_size):
+                    await asyncio.to_thread(file.write, chunk)
+                    size += len(chunk)
+            finally:
+                await asyncio.to_thread(file.close)
+        except BaseException:
+            # A download cut off mid-stream leaves no half-written file behind
+            os.remove(temp_filename)
+            raise
+        await asyncio.to_thread(os.replace, temp_filename, filename)
+        return size
+
+    async def _read_to_memory(self, response) -> bytes:
+        content = bytearray()
+        async for chunk in response.content.iter_chunked(self.chunk_size):
+            content.extend(chunk)
+        return bytes(content)
+
+    async def _get(self, image_url: str, record: dict, consume) -> dict:
+        async with self._semaphore:
+            start = time.perf_counter()
+            for attempt in range(1, self.retries + 2):
+                record["attempts"] = attempt
+                try:
+                    async with self._session.get(image_url) as response:
+                        record["status"] = response.status
+                        if response.status == 200:
+                            await consume(response)
+                            break
+                        if response.status not in RETRY_STATUSES:
+                            break
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    record["status"] = type(e).__name__
+                    if isinstance(e, asyncio.TimeoutError):
+                        METRICS.inc("timeouts", endpoint="images")
+                if attempt <= self.retries:
+                    METRICS.inc("retries", endpoint="images", kind=str(record["status"]))
+                    await asyncio.sleep(self.backoff * 2 ** (attempt - 1) * (1 + random.random()))
+            record["seconds"] = time.perf_counter() - start
+        METRICS.observe("image_download", record["seconds"])
+        METRICS.inc("bytes_transferred", record["bytes"], source="images")
+
+        if record["status"] != 200:
+            print(f"Failed to download {image_url} ({record['status']})")
+        return record
+
+    async def download(self, image_url: str, folder: str) -> dict:
+        filename = os.path.join(folder, image_url.split('/')[-1])
+        record = {"url": image_url, "file": filename, "status": None,
+                  "bytes": 0, "seconds": 0.0, "attempts": 0}
+
+        async def consume(response):
+            record["bytes"] = await self._stream_to_file(response, filename)
+
+        return await self._get(image_url, record, consume)
+
+    async def fetch(self, image_url: str) -> dict:
+        # Same as download, but the body stays in memory under "content"
+        record = {"url": image_url, "content": None, "status": None,
+                  "bytes": 0, "seconds": 0.0, "attempts": 0}
+
+        async def consume(response):
+            record["content"] = await self._read_to_memory(response)
+            record["bytes"] = len(record["content"])
+
+        return await self._get(image_url, record, consume)
+
+    async def download_all(self, image_urls: list, folder: str) -> list:
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+        return await asyncio.gather(*[self.download(url, folder) for url in image_urls])
+
+    async def fetch_all(self, image_urls: list) -> list:
+        return await asyncio.gather(*[self.fetch(url) for url in image_urls])
+
+
+async def collect_listing_images(downloader: ImageDownloader,
+                                 image_urls: list,
+                                 spool_root: str = None) -> dict:
+    """
+    Gathers the images of one listing. By default the bytes stay in memory;
+    with `spool_root` they are streamed to a temp folder private to this
+    listing instead, so concurrent listings never share a directory.
+    """
+    if spool_root:
+        os.makedirs(spool_root, exist_ok=True)
+        image_dir = tempfile.mkdtemp(dir=spool_root)
+        records = await downloader.download_all(image_urls, image_dir)
+        return {"images": [], "image_dir": image_dir, "records": records}
+
+    records = await downloader.fetch_all(image_urls)
+    images = [r["content"] for r in records if r["content"]]
+    return {"images": images, "image_dir": None, "records": records}
+
+
+def release_listing_images(listing_images: dict) -> None:
+    # Drops the listing's spool folder, if it was spooled to disk
+    if listing_images.get("image_dir"):
+        shutil.rmtree(listing_images["image_dir"], ignore_errors=True)
+
+
+def summarize_downloads(records: list) -> dict:
+    ok = [r for r in records if r["status"] == 200]
+    return {
+        "images": len(records),
+        "downloaded": len(ok),
+        "bytes": sum(r["bytes"] for r in ok),
+        "seconds": max((r["seconds"] for r in records), default=0.0),
+        "retries": sum(r["attempts"] - 1 for r in records)
+    }
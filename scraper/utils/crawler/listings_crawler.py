@@ -1,8 +1,12 @@
 import re
+import aiohttp
 import requests
-import bs4
-from bs4 import BeautifulSoup
-from datetime import datetime
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from utils.connection.rate_limit import RateLimiter, limited
+from utils.connection.replay import ReplayAdapter
+from utils.crawler.card_parsers import get_card_parser
+from utils.monitoring.metrics import METRICS
 
 
 '''
@@ -12,57 +16,102 @@ LISTING PAGE
 
 def scrape_listing_page(url: str, 
                         headers: dict, 
-                        proxies: dict) -> list:
+                        proxies: dict,
+                        backend: str = "bs4",
+                        timeout: int = 20,
+                        retries: int = 3,
+                        session: requests.Session = None) -> list:
     
-    session = requests.Session()
+    session = session or requests.Session()
     session.headers.update(headers)
+    # Transient statuses and connection errors are retried with backoff, honouring Retry-After
+    retry = Retry(total=retries, backoff_factor=0.5, status_forcelist=(408, 429, 500, 502, 503, 504),
+                  respect_retry_after_header=True)
+    if not isinstance(session.get_adapter(url), ReplayAdapter):
+        session.mount("https://", HTTPAdapter(max_retries=retry))
+        session.mount("http://", HTTPAdapter(max_retries=retry))
 
-    response = session.get(url, proxies=proxies, verify=False, timeout=20)
-    soup = BeautifulSoup(response.content, "html.parser")
-    cards = soup.find_all("div", class_="listingCard")
-    return cards
+    response = session.get(url, proxies=proxies, verify=False, timeout=timeout)
+    response.raise_for_status()
+    return parse_listing_cards(response.content, backend)
 
 
-def scrape_listing_card(card: bs4.element.Tag, 
+def parse_listing_cards(html, backend: str = "bs4") -> list:
+    # Card records (see card_parsers.card_record) in page order
+    return get_card_parser(backend)(html)
+
+
+# <a|link rel="last" href=".../paginaN">, attributes in any order
+REL_LAST_PATTERN = re.compile(r"<(?:a|link)\b[^>]*\brel=[\"']last[\"'][^>]*>", re.IGNORECASE)
+# A page count in the embedded page data
+TOTAL_PAGES_PATTERN = re.compile(r'"(?:totalPages|total_pages|lastPage|last_page)"\s*:\s*(\d+)')
+
+
+def parse_last_page(html) -> int:
+    """
+    The last page when the page states it, through a rel="last" link or a
+    page count in the embedded data. None otherwise: the highest paginator
+    link is not an answer, a windowed paginator (1 2 3 ... 7) stops short.
+    """
+    if isinstance(html, bytes):
+        html = html.decode("utf-8", errors="replace")
+    for tag in REL_LAST_PATTERN.findall(html):
+        match = re.search(r"pagina(\d+)", tag)
+        if match:
+            return int(match.group(1))
+    match = TOTAL_PAGES_PATTERN.search(html)
+    return int(match.group(1)) if match else None
+
+
+'''
+CONCURRENT LISTING PAGES
+'''
+
+
+async def request_listing_html(session: aiohttp.ClientSession,
+                               url: str,
+                               proxy: str,
+                               headers: dict = None,
+                               limiter: RateLimiter = None) -> bytes:
+    # Raises on failure, so callers can retry
+    async with limited(limiter, url) as slot:
+        async with session.get(url, proxy=proxy, headers=headers) as response:
+            slot.record(response)
+            # A blocked or failing page is an error, not a page without cards
+            response.raise_for_status()
+            html = await response.read()
+    METRICS.inc("bytes_transferred", len(html), source="listings")
+    return html
+
+
+def scrape_listing_card(card: dict, 
                         existing_links:list, 
                         typology_pattern: re.Pattern) -> dict:
-    link_tag = card.find('a', class_='lc-cardCover')
-    link = "https://www.fincaraiz.com.co" + link_tag['href'] if link_tag else None
+    """
+    Builds card_info from a card record. `typology_pattern` should be
+    compiled once by the caller, a pattern string is compiled here.
+    """
+    link = card["link"]
     if not link or link in existing_links:
         return None  
 
-    price_tag = card.find('div', class_='lc-price')
-    price = price_tag.get_text(strip=True) if price_tag else None
-    price = re.sub(r"[^\d]", "", price)
-
-    location_tag = card.find('strong', class_='lc-location')
-    location = location_tag.get_text(strip=True) if location_tag else None
-
-    typology_tag = card.find('div', class_='lc-typologyTag')
-    typology = typology_tag.get_text(strip=True) if typology_tag else None
-    typology_pattern = re.compile(typology_pattern)
+    price = re.sub(r"[^\d]", "", card["price"]) if card["price"] else None
 
     bedrooms = bathrooms = area = None
-    if typology:
-        match = typology_pattern.search(typology)
+    if card["typology"]:
+        match = re.compile(typology_pattern).search(card["typology"])
         if match:
             bedrooms, bathrooms, area = match.groups()
 
-    agency_tag = card.find('strong', class_='body body-2 high')
-    agency = agency_tag.get_text(strip=True) if agency_tag else None
-
-    now = datetime.now()
-    now = now.strftime("%Y-%m-%d %H:%M:%S")
-
     card_info = {
             "Link": link,
             "Price": price,
             "Bedrooms": bedrooms,
             "Bathrooms": bathrooms,
             "Area": area,
-            "Agency": agency,
-            "Location": location,
-            "Datetime_Added": now
+            "Agency": card["agency"],
+            "Location": card["location"],
+            "Datetime_Added": card["added_at"]
         }
 
     return card_info
@@ -0,0 +1,76 @@
+import re
+import base64
+
+
+'''
+REQUEST ROUTING
+'''
+
+# 1x1 transparent PNG served in place of map tiles. Leaflet still fires the
+# load event and keeps the tile transforms, which is all coordinates_from_geometry reads.
+STUB_TILE_PNG = base64.b64decode(
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVR42mNkYAAAAAYAAjCB0C8AAAAASUVORK5CYII="
+)
+
+
+def new_route_stats() -> dict:
+    return {"allowed": 0, "blocked": 0, "stubbed": 0, "bytes_saved": 0}
+
+
+def reset_route_stats(stats: dict) -> None:
+    stats.update(new_route_stats())
+
+
+def matches_any(url: str, patterns: list) -> bool:
+    return any(pattern.search(url) for pattern in patterns)
+
+
+def create_route_handler(routing_config: dict, stats: dict):
+    """
+    Builds a Playwright route handler from CRAWLERS.DETAIL.ROUTING.
+
+    Order of precedence: allowed URL patterns, tile stubbing, blocked URL
+    patterns, allowed resource types (when non-empty, everything else is
+    blocked) and blocked resource types. Bytes saved are estimated per
+    resource type from ESTIMATED_BYTES, since aborted requests never report
+    a size. Allowed requests fall back to earlier routes, such as the replay
+    route, and go to the network when there are none.
+    """
+    allow_urls = [re.compile(p) for p in routing_config.get('ALLOW_URL_PATTERNS', [])]
+    block_urls = [re.compile(p) for p in routing_config.get('BLOCK_URL_PATTERNS', [])]
+    allow_types = set(routing_config.get('ALLOW_RESOURCE_TYPES', []))
+    block_types = set(routing_config.get('BLOCK_RESOURCE_TYPES', []))
+    stub_tiles = routing_config.get('STUB_TILES', False)
+    tile_pattern = re.compile(routing_config.get('TILE_URL_PATTERN', r"/\d+/\d+/\d+(@2x)?\.png"))
+    estimated_bytes = routing_config.get('ESTIMATED_BYTES', {})
+
+    def saved(resource_type):
+        return estimated_bytes.get(resource_type, estimated_bytes.get('default', 0))
+
+    async def handle(route):
+        request = route.request
+        url = request.url
+        resource_type = request.resource_type
+
+        if matches_any(url, allow_urls):
+            stats["allowed"] += 1
+            await route.fallback()
+        elif stub_tiles and resource_type == "image" and tile_pattern.search(url):
+            stats["stubbed"] += 1
+            stats["bytes_saved"] += max(saved(resource_type) - len(STUB_TILE_PNG), 0)
+            await route.fulfill(status=200, content_type="image/png", body=STUB_TILE_PNG)
+        elif (matches_any(url, block_urls)
+              or (allow_types and resource_type not in allow_types)
+              or resource_type in block_types):
+            stats["blocked"] += 1
+            stats["bytes_saved"] += saved(resource_type)
+            await route.abort()
+        else:
+            stats["allowed"] += 1
+            await route.fallback()
+
+    return handle
+
+
+async def install_routes(page, routing_config: dict, stats: dict) -> None:
+    await page.route("**/*", create_route_handler(routing_config, stats))
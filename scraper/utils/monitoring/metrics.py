@@ -0,0 +1,171 @@
+import os
+import json
+import time
+import bisect
+import functools
+import threading
+from contextlib import contextmanager
+from aiohttp import web
+
+
+'''
+METRICS
+'''
+
+# Upper bounds in seconds, from a cached lookup to a slow vision call
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, float("inf"))
+
+
+def label_key(labels: dict) -> tuple:
+    return tuple(sorted(labels.items()))
+
+
+def format_labels(labels: tuple, extra: dict = None) -> str:
+    items = list(labels) + list((extra or {}).items())
+    if not items:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in items) + "}"
+
+
+class Metrics:
+    """
+    Process-wide timing histograms and counters. Disabled by default, in
+    which case every call returns right away. Once started, each
+    observation is also appended to a JSON-lines log, and the current
+    values can be served in the Prometheus text format.
+
+    Usage:
+        with METRICS.timer("vision_call"):
+            ...
+        METRICS.inc("cache_hits", cache="vision")
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.histograms = {}
+        self.counters = {}
+        self._log = None
+        self._runner = None
+        # Caches and the sync clients record from worker threads
+        self._lock = threading.Lock()
+
+    async def start(self, metrics_config: dict) -> None:
+        self.enabled = metrics_config['ENABLED']
+        if not self.enabled:
+            return
+        if metrics_config['LOG_PATH']:
+            os.makedirs(os.path.dirname(os.path.abspath(metrics_config['LOG_PATH'])), exist_ok=True)
+            self._log = open(metrics_config['LOG_PATH'], "a", encoding="utf-8")
+        if metrics_config['PROMETHEUS_PORT']:
+            app = web.Application()
+            app.router.add_get("/metrics", self._serve)
+            self._runner = web.AppRunner(app, access_log=None)
+            await self._runner.setup()
+            await web.TCPSite(self._runner, "0.0.0.0", metrics_config['PROMETHEUS_PORT']).start()
+            print(f"Prometheus metrics on port {metrics_config['PROMETHEUS_PORT']}/metrics")
+
+    async def close(self) -> None:
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+        if self._log:
+            summary = self.summary()
+            with self._lock:
+                self._write({"type": "summary", "summary": summary})
+                self._log.close()
+                self._log = None
+
+    def _write(self, event: dict) -> None:
+        if self._log:
+            event["ts"] = round(time.time(), 3)
+            self._log.write(json.dumps(event, ensure_ascii=False) + "\n")
+
+    def observe(self, name: str, seconds: float, **labels) -> None:
+        if not self.enabled:
+            return
+        key = (name, label_key(labels))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = {"buckets": [0] * len(BUCKETS), "sum": 0.0, "count": 0}
+            histogram["buckets"][bisect.bisect_left(BUCKETS, seconds)] += 1
+            histogram["sum"] += seconds
+            histogram["count"] += 1
+            self._write({"type": "timing", "name": name, "seconds": round(seconds, 6), "labels": labels})
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        if not self.enabled:
+            return
+        key = (name, label_key(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+            self._write({"type": "counter", "name": name, "value": value, "labels": labels})
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        if not self.enabled:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def timed(self, name: str, **labels):
+        """Decorator timing every call of an async function."""
+        def decorator(function):
+            @functools.wraps(function)
+            async def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return await function(*args, **kwargs)
+                with self.timer(name, **labels):
+                    return await function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def _snapshot(self) -> tuple:
+        # Copies taken under the lock, since worker threads keep recording
+        with self._lock:
+            histograms = {key: {"buckets": list(h["buckets"]), "sum": h["sum"], "count": h["count"]}
+                          for key, h in self.histograms.items()}
+            return histograms, dict(self.counters)
+
+    def summary(self) -> dict:
+        # Count, mean and total seconds per timing, and every counter
+        histograms, counters = self._snapshot()
+        timings = {f"{name}{format_labels(labels)}": {"count": h["count"],
+                                                      "mean": round(h["sum"] / h["count"], 4) if h["count"] else None,
+                                                      "sum": round(h["sum"], 3)}
+                   for (name, labels), h in histograms.items()}
+        counters = {f"{name}{format_labels(labels)}": value for (name, labels), value in counters.items()}
+        return {"timings": timings, "counters": counters}
+
+    def prometheus(self) -> str:
+        histograms, counters = self._snapshot()
+        lines = []
+        typed = set()
+        for (name, labels), histogram in sorted(histograms.items()):
+            metric = f"scraper_{name}_seconds"
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f"# TYPE {metric} histogram")
+            cumulative = 0
+            for bound, count in zip(BUCKETS, histogram["buckets"]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else str(bound)
+                lines.append(f"{metric}_bucket{format_labels(labels, {'le': le})} {cumulative}")
+            lines.append(f"{metric}_sum{format_labels(labels)} {histogram['sum']}")
+            lines.append(f"{metric}_count{format_labels(labels)} {histogram['count']}")
+        for (name, labels), value in sorted(counters.items()):
+            if f"scraper_{name}_total" not in typed:
+                typed.add(f"scraper_{name}_total")
+                lines.append(f"# TYPE scraper_{name}_total counter")
+            lines.append(f"scraper_{name}_total{format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    async def _serve(self, request: web.Request) -> web.Response:
+        return web.Response(text=self.prometheus(), content_type="text/plain")
+
+
+METRICS = Metrics()
@@ -0,0 +1,89 @@
+import os
+import socket
+import asyncio
+from utils.connection.listing_store import *
+from utils.connection.work_queue import *
+
+
+'''
+COORDINATOR
+'''
+
+def worker_name() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+async def wait_for_tasks(queue: WorkQueue, task_ids: list, poll_seconds: float) -> dict:
+    # Results of `task_ids` once all of them are done or failed for good
+    while True:
+        results = await asyncio.to_thread(queue.results, task_ids)
+        if len(results) == len(task_ids):
+            return results
+        await asyncio.to_thread(queue.requeue_expired)
+        await asyncio.sleep(poll_seconds)
+
+
+async def run_coordinator(config: dict, store: ListingStore, queue: WorkQueue) -> None:
+    """
+    Puts the listing-page tasks of the run on the shared queue and waits
+    for the workers to drain it. Pages go out in windows of PAGE_WINDOW,
+    and the sweep follows the same rules as ScraperPipeline.produce_pages:
+    page 1 may state the last page, otherwise MAX_PAGES bounds it, and an
+    empty page or STOP_AFTER_SEEN_PAGES consecutive pages of already seen
+    listings end it. Workers turn every new card of a page into a listing
+    task, deduplicated by listing id.
+    """
+    listings_config = config['CRAWLERS']['LISTINGS']
+    distributed_config = config['DISTRIBUTED']
+    poll_seconds = distributed_config['POLL_SECONDS']
+    stop_after = listings_config['STOP_AFTER_SEEN_PAGES']
+
+    await asyncio.to_thread(queue.open_run)
+    pending = store.pending(config['GENERAL']['MAX_RESUME_ATTEMPTS'])
+    for listing in pending:
+        link = listing["card_info"]["Link"]
+        queue.put("listing", listing_id(link), {"link": link})
+    if pending:
+        print(f"Queued {len(pending)} partial listings")
+
+    async def sweep(pages):
+        for page_num in pages:
+            queue.put("page", str(page_num), {"page": page_num})
+        results = await wait_for_tasks(queue, [f"page:{page_num}" for page_num in pages], poll_seconds)
+        return [(page_num, results[f"page:{page_num}"]) for page_num in pages]
+
+    # Page 1 alone, to learn how many pages there are
+    fetched = await sweep([1])
+    last_page = listings_config['MAX_PAGES']
+    if fetched[0][1] is not None:
+        last_page = min(fetched[0][1]["last_page"] or last_page, last_page)
+    print(f"Sweeping up to {last_page} listing pages")
+
+    seen_pages = 0
+    next_page = 2
+    while fetched:
+        for page_num, result in fetched:
+            # A page that failed every attempt neither counts as seen nor ends the sweep
+            if result is None:
+                continue
+            if not result["cards"]:
+                last_page = page_num
+                break
+            seen_pages = seen_pages + 1 if result["seen"] else 0
+            if seen_pages >= stop_after:
+                print(f"Stopping after {seen_pages} pages of already seen listings")
+                last_page = page_num
+                break
+
+        window = stop_after - seen_pages if seen_pages else distributed_config['PAGE_WINDOW']
+        pages = list(range(next_page, min(next_page + window, last_page + 1)))
+        next_page = next_page + len(pages)
+        fetched = await sweep(pages) if pages else []
+
+    # Workers exit once the closed queue is empty
+    await asyncio.to_thread(queue.close_run)
+    while not await asyncio.to_thread(queue.drained):
+        await asyncio.to_thread(queue.requeue_expired)
+        print(f"Work queue: {queue.stats()}")
+        await asyncio.sleep(distributed_config['STATUS_SECONDS'])
+    print(f"Work queue drained: {queue.stats()}")
@@ -0,0 +1,765 @@
+import re
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from utils.connection.http import *
+from utils.connection.listing_store import *
+from utils.connection.loader import *
+from utils.connection.proxy_pool import *
+from utils.connection.recrawl_schedule import *
+from utils.connection.rate_limit import *
+from utils.connection.replay import *
+from utils.connection.resilience import *
+from utils.connection.sinks import *
+from utils.connection.work_queue import *
+from utils.crawler.browser_pool import *
+from utils.crawler.details_crawler import *
+from utils.crawler.image_downloader import *
+from utils.crawler.listings_crawler import *
+from utils.monitoring.metrics import *
+from utils.processing.imaging import *
+from utils.processing.selection import *
+from utils.services.nearby import *
+from utils.services.nearby_cache import *
+from utils.services.vision import *
+from utils.services.vision_cache import *
+
+
+'''
+STAGES
+'''
+
+# Marks the end of a queue. Each stage forwards it once all its workers are done.
+STOP = object()
+
+
+async def run_stage(name: str,
+                    worker,
+                    inbox: asyncio.Queue,
+                    outbox: asyncio.Queue,
+                    concurrency: int,
+                    on_error=None) -> None:
+    """
+    Runs `concurrency` copies of `worker` over the items of `inbox`. Results
+    that are not None go to `outbox`, whose bounded size gives backpressure
+    to this stage. A failing item is logged and dropped, after being handed
+    to `on_error`.
+    """
+    async def loop():
+        while True:
+            item = await inbox.get()
+            if item is STOP:
+                # Let the sibling workers see the end of the queue too
+                await inbox.put(STOP)
+                return
+            try:
+                result = await worker(item)
+            except Exception as e:
+                print(f"Error in {name} stage: {e}")
+                if on_error is not None:
+                    on_error(item)
+                continue
+            if result is not None and outbox is not None:
+                await outbox.put(result)
+
+    await asyncio.gather(*[loop() for _ in range(concurrency)])
+    if outbox is not None:
+        await outbox.put(STOP)
+
+
+'''
+PIPELINE
+'''
+
+
+class ScraperPipeline:
+    """
+    Listing pages -> cards -> details -> images -> vision + nearby -> sink,
+    connected by bounded queues. Every stage has its own concurrency under
+    PIPELINE.CONCURRENCY, and the vision and nearby lookups of a listing run
+    concurrently since both only need the detail result.
+
+    Finished stages are recorded in the ListingStore, so listings left
+    partial by an interrupted run are resumed first and skip the stages
+    they already completed.
+
+    With a `work_queue`, the pipeline runs as a distributed worker: instead
+    of sweeping the listing pages itself it claims page and listing tasks
+    put there by run_coordinator, heartbeats their leases while they are in
+    flight and completes them once their rows are flushed.
+
+    With a `schedule`, `recrawl` revisits known listings instead (see
+    RecrawlSchedule).
+    """
+
+    def __init__(self,
+                 config: dict,
+                 env_dict: dict,
+                 headers: dict,
+                 proxy_server_dict: dict,
+                 proxy_http_dict: dict,
+                 store: ListingStore,
+                 work_queue: WorkQueue = None,
+                 worker: str = None,
+                 schedule: RecrawlSchedule = None):
+        self.config = config
+        self.env_dict = env_dict
+        self.headers = headers
+        self.proxy_server_dict = proxy_server_dict
+        self.proxy_http_dict = proxy_http_dict
+        self.store = store
+        self.work_queue = work_queue
+        self.worker = worker
+        self.schedule = schedule
+        self._in_flight = set()
+        # Leases held by this worker: listing link -> task id, and the page tasks being fetched
+        self._leases = {}
+        self._page_leases = set()
+        self.replay_server = None
+        self.proxy_pool = None
+        self.limiter = None
+        self.resilience = None
+        self.pool = None
+        self.downloader = None
+        self.image_executor = None
+        self.vision_cache = None
+        self.nearby_cache = None
+        self.listing_session = None
+        self.details_session = None
+        self.vision_session = None
+        self.places_session = None
+        self.sink = None
+        self.parse_cards = None
+        self.typology_pattern = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def start(self):
+        config = self.config
+        listings_config = config['CRAWLERS']['LISTINGS']
+        detail_config = config['CRAWLERS']['DETAIL']
+        images_config = config['CRAWLERS']['IMAGES']
+
+        self.parse_cards = get_card_parser(listings_config['PARSER'])
+        self.typology_pattern = re.compile(listings_config['TYPOLOGY_PATTERN'])
+
+        # Stage timings and counters, a no-op unless METRICS.ENABLED
+        await METRICS.start(config['METRICS'])
+
+        # Offline runs: every request goes to the record/replay stand-in server
+        replay_url = None
+        self.replay_server = create_replay_server(config['REPLAY'], upstream_proxy=self.proxy_http_dict['http'])
+        if self.replay_server is not None:
+            await self.replay_server.start()
+            replay_url = self.replay_server.base_url
+
+        # Listing pages, detail pages and browser contexts all draw from one proxy pool
+        self.proxy_pool = create_proxy_pool(self.env_dict, config)
+        # Per-host pacing shared by the listing site, OpenAI and Places
+        self.limiter = RateLimiter(config['RATE_LIMITS'])
+        # Retries, hedging and circuit breakers for the listing site and the APIs
+        self.resilience = Resilience(config['RESILIENCE'])
+
+        self.pool = BrowserPool(headless=detail_config['HEADLESS'],
+                                proxy=self.proxy_server_dict,
+                                headers=self.headers,
+                                size=detail_config['POOL']['CONTEXTS'],
+                                max_navigations=detail_config['POOL']['MAX_NAVIGATIONS'],
+                                routing=detail_config['ROUTING'],
+                                proxy_pool=self.proxy_pool,
+                                replay_url=replay_url)
+        await self.pool.start()
+
+        self.downloader = ImageDownloader(concurrency=images_config['CONCURRENCY'],
+                                          limit_per_host=images_config['LIMIT_PER_HOST'],
+                                          retries=images_config['RETRIES'],
+                                          backoff=images_config['BACKOFF'],
+                                          chunk_size=images_config['CHUNK_SIZE'],
+                                          timeout=images_config['REQUEST_TIMEOUT'],
+                                          replay_url=replay_url)
+        await self.downloader.start()
+
+        self.image_executor = ProcessPoolExecutor(max_workers=config['OPENAI']['PREPROCESS']['WORKERS'])
+
+        cache_config = config['OPENAI']['CACHE']
+        if cache_config['ENABLED']:
+            self.vision_cache = VisionCache(path=cache_config['PATH'], max_bytes=cache_config['MAX_BYTES'])
+
+        nearby_cache_config = config['MAPS_NEARBY']['CACHE']
+        if nearby_cache_config['ENABLED']:
+            self.nearby_cache = NearbyCache(path=nearby_cache_config['PATH'],
+                                            ttl=nearby_cache_config['TTL_DAYS'] * 86400)
+
+        self.listing_session = create_http_session(headers=self.headers,
+                                                   limit_per_host=listings_config['LIMIT_PER_HOST'],
+                                                   timeout=listings_config['REQUEST_TIMEOUT'])
+        self.details_session = create_http_session(headers=self.headers,
+                                                   limit_per_host=detail_config['HTTP']['LIMIT_PER_HOST'],
+                                                   timeout=detail_config['HTTP']['REQUEST_TIMEOUT'])
+        # Connections to the APIs are bounded by the rate limiter alone
+        self.vision_session = create_http_session(headers={},
+                                                  limit_per_host=0,
+                                                  timeout=config['OPENAI']['REQUEST_TIMEOUT'],
+                                                  verify_ssl=True)
+        self.places_session = create_http_session(headers={},
+                                                  limit_per_host=0,
+                                                  timeout=config['MAPS_NEARBY']['REQUEST_TIMEOUT'],
+                                                  verify_ssl=True)
+        if replay_url:
+            self.listing_session = ReplaySession(self.listing_session, replay_url)
+            self.details_session = ReplaySession(self.details_session, replay_url)
+            self.vision_session = ReplaySession(self.vision_session, replay_url)
+            self.places_session = ReplaySession(self.places_session, replay_url)
+
+        # Rows count as done only once their buffer has been written
+        self.sink = create_sink(config['GENERAL']['SINK'],
+                                csv_path=config['GENERAL']['CSV_PATH'],
+                                on_flush=self.mark_flushed)
+        return self
+
+    async def close(self):
+        if self.sink:
+            await asyncio.to_thread(self.sink.flush)
+        if self.listing_session:
+            await self.listing_session.close()
+        if self.details_session:
+            await self.details_session.close()
+        if self.vision_session:
+            await self.vision_session.close()
+        if self.places_session:
+            await self.places_session.close()
+        if self.downloader:
+            await self.downloader.close()
+        if self.image_executor:
+            self.image_executor.shutdown()
+        if self.vision_cache is not None:
+            print(f"Vision cache: {self.vision_cache.stats()}")
+            self.vision_cache.close()
+        if self.nearby_cache is not None:
+            print(f"Nearby cache: {self.nearby_cache.stats()}")
+            self.nearby_cache.close()
+        if self.pool:
+            await self.pool.close()
+        if self.proxy_pool is not None:
+            print(f"Proxy pool: {self.proxy_pool.stats()}")
+        if self.limiter is not None:
+            print(f"Rate limits: {self.limiter.stats()}")
+        if self.resilience is not None:
+            print(f"Resilience: {self.resilience.stats()}")
+        if self.replay_server is not None:
+            await self.replay_server.close()
+        if METRICS.enabled:
+            print(f"Metrics: {METRICS.summary()}")
+        await METRICS.close()
+
+    # Stage workers
+
+    async def fetch_page(self, page_num: int) -> tuple:
+        # (url, html) of a listing page, raising once retries are exhausted
+        url = self.config['CRAWLERS']['LISTINGS']['URL_TEMPLATE'].format(page=page_num)
+
+        async def request():
+            return await self.proxy_pool.call(lambda endpoint: request_listing_html(self.listing_session, url,
+                                                                                    proxy=endpoint["url"],
+                                                                                    headers=endpoint["headers"],
+                                                                                    limiter=self.limiter))
+        return url, await self.resilience.call("listings", request)
+
+    async def produce_pages(self, outbox: asyncio.Queue) -> None:
+        """
+        Walks the newest-first listing pages of LISTINGS.URL_TEMPLATE, up
+        to the last page when page 1 states it (see parse_last_page) and up
+        to MAX_PAGES otherwise. The sweep ends at an empty page, or once
+        STOP_AFTER_SEEN_PAGES consecutive pages hold only listings already
+        in the store, so incremental runs fetch a handful of pages.
+        """
+        listings_config = self.config['CRAWLERS']['LISTINGS']
+        concurrency = listings_config['CONCURRENCY']
+        stop_after = listings_config['STOP_AFTER_SEEN_PAGES']
+        semaphore = asyncio.Semaphore(concurrency)
+
+        pending = self.store.pending(self.config['GENERAL']['MAX_RESUME_ATTEMPTS'])
+        if pending:
+            print(f"Resuming {len(pending)} partial listings")
+        for listing in pending:
+            await outbox.put(listing)
+
+        async def fetch(page_num):
+            async with semaphore:
+                try:
+                    url, html = await self.fetch_page(page_num)
+                except Exception as e:
+                    print(f"Error fetching listing page {page_num}: {e}")
+                    url, html = None, None
+            return page_num, url, html
+
+        # Page 1 alone, to learn how many pages there are
+        fetched = [await fetch(1)]
+        last_page = listings_config['MAX_PAGES']
+        if fetched[0][2] is not None:
+            last_page = min(parse_last_page(fetched[0][2]) or last_page, last_page)
+        print(f"Sweeping up to {last_page} listing pages")
+
+        seen_pages = 0
+        next_page = 2
+        while fetched:
+            for page_num, url, html in fetched:
+                # A failed fetch neither counts as seen nor ends the sweep
+                if html is None:
+                    continue
+                cards = self.parse_cards(html)
+                print(len(cards), "cards found on:", url)
+                if not cards:
+                    last_page = page_num
+                    break
+                if all(card["link"] in self.store for card in cards):
+                    seen_pages += 1
+                else:
+                    seen_pages = 0
+                for card in cards:
+                    await outbox.put(card)
+                if seen_pages >= stop_after:
+                    print(f"Stopping after {seen_pages} pages of already seen listings")
+                    last_page = page_num
+                    break
+
+            # Within a run of seen pages, fetch only what is needed to decide whether to stop
+            window = stop_after - seen_pages if seen_pages else concurrency
+            pages = range(next_page, min(next_page + window, last_page + 1))
+            next_page = pages.stop
+            fetched = await asyncio.gather(*[fetch(page_num) for page_num in pages])
+        await outbox.put(STOP)
+
+    async def run_page_task(self, page_num: int) -> dict:
+        """
+        Fetches a listing page for the coordinator and queues a listing task
+        for each new card. Returns what the coordinator needs to steer the
+        sweep: the card count, whether every card was already seen and the
+        last page of the paginator.
+        """
+        url, html = await self.fetch_page(page_num)
+        cards = self.parse_cards(html)
+        print(len(cards), "cards found on:", url)
+        seen = all(card["link"] in self.store for card in cards)
+        queued = 0
+        for card in cards:
+            card_info = scrape_listing_card(card=card,
+                                            existing_links=self.store,
+                                            typology_pattern=self.typology_pattern)
+            if not card_info:
+                continue
+            # Saved before it is queued, so whichever worker claims it finds the card in the store
+            self.store.save_stage(card_info["Link"], "card_info", card_info)
+            if self.work_queue.put("listing", listing_id(card_info["Link"]), {"link": card_info["Link"]}):
+                queued += 1
+        print(f"Queued {queued} listings from page {page_num}")
+        return {"cards": len(cards), "seen": seen, "last_page": parse_last_page(html)}
+
+    async def produce_tasks(self, outbox: asyncio.Queue) -> None:
+        # Distributed counterpart of produce_pages: claims tasks until the coordinator's run is drained
+        distributed_config = self.config['DISTRIBUTED']
+
+        async def page_task(task):
+            try:
+                result = await self.run_page_task(task["payload"]["page"])
+            except Exception as e:
+                print(f"Error in page task {task['id']}: {e}")
+                await asyncio.to_thread(self.work_queue.fail, task["id"], self.worker, str(e))
+            else:
+                await asyncio.to_thread(self.work_queue.complete, task["id"], self.worker, result)
+            finally:
+                self._page_leases.discard(task["id"])
+
+        # A close left over from the previous run is not this worker's cue to exit
+        run_id = await asyncio.to_thread(self.work_queue.current_run)
+        if run_id is None:
+            print("Waiting for the coordinator to open a run")
+        while run_id is None:
+            await asyncio.sleep(distributed_config['POLL_SECONDS'])
+            run_id = await asyncio.to_thread(self.work_queue.current_run)
+
+        while True:
+            tasks = await asyncio.to_thread(self.work_queue.claim, self.worker, distributed_config['CLAIM_BATCH'])
+            if not tasks:
+                if await asyncio.to_thread(self.work_queue.finished, self.worker, run_id):
+                    break
+                await asyncio.sleep(distributed_config['POLL_SECONDS'])
+                continue
+
+            # Heartbeat every claimed lease from now on, not just once its listing enters the pipeline
+            listing_tasks = []
+            for task in tasks:
+                if task["kind"] == "page":
+                    self._page_leases.add(task["id"])
+                elif task["payload"]["link"] not in self._leases:
+                    self._leases[task["payload"]["link"]] = task["id"]
+                    listing_tasks.append(task)
+                # Otherwise this worker already has the listing in flight, and release() settles its lease
+
+            await asyncio.gather(*[page_task(task) for task in tasks if task["kind"] == "page"])
+            for task in listing_tasks:
+                link = task["payload"]["link"]
+                # The shared index decides: a listing finished anywhere is never enriched again
+                if link in self.store:
+                    await asyncio.to_thread(self.release, link, True)
+                    continue
+                listing = self.store.get(link)
+                if not listing or "card_info" not in listing:
+                    print(f"Listing task {task['id']} is not in the listing store")
+                    await asyncio.to_thread(self.release, link, False)
+                    continue
+                await outbox.put(listing)
+        await outbox.put(STOP)
+
+    async def heartbeat(self) -> None:
+        interval = self.config['DISTRIBUTED']['HEARTBEAT_SECONDS']
+        while True:
+            await asyncio.sleep(interval)
+            held = list(self._leases.values()) + list(self._page_leases)
+            lost = await asyncio.to_thread(self.work_queue.heartbeat, self.worker, held)
+            for task_id in lost:
+                print(f"Lease on {task_id} lost, another worker may take it over")
+            self._page_leases.difference_update(lost)
+            for link, task_id in list(self._leases.items()):
+                if task_id in lost:
+                    self._leases.pop(link, None)
+
+    def release(self, link: str, done: bool) -> None:
+        task_id = self._leases.pop(link, None)
+        if task_id is None:
+            return
+        if done:
+            self.work_queue.complete(task_id, self.worker)
+        else:
+            self.work_queue.fail(task_id, self.worker, "dropped by the pipeline")
+
+    def drop(self, listing) -> None:
+        # A listing that failed a stage: free it for a later run, or for another worker
+        if not isinstance(listing, dict) or "card_info" not in listing:
+            return
+        link = listing["card_info"]["Link"]
+        self._in_flight.discard(link)
+        self.release(link, done=False)
+
+    async def parse_card(self, card):
+        # Resumed listings arrive already parsed
+        if "card_info" in card:
+            if card["card_info"]["Link"] in self._in_flight:
+                return None
+            self._in_flight.add(card["card_info"]["Link"])
+            return card
+
+        card_info = scrape_listing_card(card=card,
+                                        existing_links=self.store,
+                                        typology_pattern=self.typology_pattern)
+        if not card_info or card_info["Link"] in self._in_flight:
+            return None
+        self._in_flight.add(card_info["Link"])
+        self.store.save_stage(card_info["Link"], "card_info", card_info)
+        return {"card_info": card_info}
+
+    async def scrape_details(self, listing: dict):
+        if "details" in listing:
+            return listing
+        detail_config = self.config['CRAWLERS']['DETAIL']
+        details = await scrape_details(url=listing["card_info"]["Link"],
+                                       img_folder=None,
+                                       timeout=detail_config['TIMEOUT']['REQUEST_TIMEOUT'],
+                                       element_timeout=detail_config['TIMEOUT']['ELEMENT_TIMEOUT'],
+                                       pool=self.pool,
+                                       downloader=self.downloader,
+                                       session=self.details_session,
+                                       http_proxy=self.proxy_http_dict['http'],
+                                       mode=detail_config['MODE'],
+                                       required_fields=detail_config['REQUIRED_FIELDS'],
+                                       proxy_pool=self.proxy_pool,
+                                       limiter=self.limiter,
+                                       resilience=self.resilience)
+        if not details:
+            self.drop(listing)
+            return None
+        listing["details"] = details
+        self.store.save_stage(listing["card_info"]["Link"], "details", details)
+        return listing
+
+    async def collect_images(self, listing: dict):
+        if "description" in listing:
+            return listing
+        # Images of this listing only, kept in memory unless spooling is enabled
+        general_config = self.config['GENERAL']
+        spool_root = general_config['IMAGE_DIR'] if general_config['SPOOL_IMAGES'] else None
+        listing_images = await collect_listing_images(downloader=self.downloader,
+                                                      image_urls=listing["details"]['image_urls'],
+                                                      spool_root=spool_root)
+        try:
+            images = listing_images['images']
+            if listing_images['image_dir']:
+                images = await asyncio.to_thread(load_images_from_dir, listing_images['image_dir'])
+        finally:
+            release_listing_images(listing_images)
+        listing["images"] = images
+        return listing
+
+    async def describe(self, images: list) -> str:
+        openai_config = self.config['OPENAI']
+        preprocess_config = openai_config['PREPROCESS']
+
+        selected = await asyncio.to_thread(select_diverse_images,
+                                           images=images,
+                                           k=openai_config['MAX_IMAGES'],
+                                           max_hamming=openai_config['DUPLICATE_HAMMING'])
+        print(f"Selected {len(selected)} of {len(images)} images for the vision call")
+
+        # Same images and settings as a previous call: reuse its description
+        cache_key = None
+        if self.vision_cache is not None:
+            cache_key = vision_cache_key(selected, settings={"prompt": openai_config['PROMPT'],
+                                                             "model": openai_config['MODEL'],
+                                                             "detail": openai_config['IMAGE_DETAIL'],
+                                                             "max_tokens": openai_config['MAX_TOKENS'],
+                                                             "preprocess": preprocess_config})
+            description = self.vision_cache.get(cache_key)
+            if description is not None:
+                print("Vision cache hit")
+                return description
+
+        images = selected
+        if preprocess_config['ENABLED']:
+            images, payload_stats = await prepare_images(images=images,
+                                                         detail=openai_config['IMAGE_DETAIL'],
+                                                         quality=preprocess_config['QUALITY'],
+                                                         executor=self.image_executor,
+                                                         min_batch=preprocess_config['PROCESS_POOL_MIN_BATCH'])
+            print(f"Vision payload: {payload_stats['bytes_before']} -> {payload_stats['bytes_after']} bytes")
+
+        # A failed call fails the stage, the listing stays pending instead of being saved without a description
+        description = await self.resilience.call("vision", lambda: describe_apartment_images_async(
+            session=self.vision_session,
+            api_key=self.env_dict['OPENAI_API_KEY'],
+            prompt_text=openai_config['PROMPT'],
+            model=openai_config['MODEL'],
+            image_detail=openai_config['IMAGE_DETAIL'],
+            max_tokens=openai_config['MAX_TOKENS'],
+            images=images,
+            limiter=self.limiter))
+        if self.vision_cache is not None:
+            self.vision_cache.put(cache_key, description)
+        return description
+
+    async def nearby(self, coordinates: tuple) -> list:
+        nearby_config = self.config['MAPS_NEARBY']
+        if self.nearby_cache is not None:
+            return await self.resilience.call("places", lambda: get_nearby_places_cached_async(
+                session=self.places_session,
+                cache=self.nearby_cache,
+                api_key=self.env_dict['MAPS_API_KEY'],
+                latitude=coordinates[0],
+                longitude=coordinates[1],
+                radius=nearby_config['RADIUS'],
+                included_types=nearby_config['INCLUDED_TYPES'],
+                precision=nearby_config['CACHE']['PRECISION'],
+                limiter=self.limiter))
+        return await self.resilience.call("places", lambda: get_nearby_places_async(
+            session=self.places_session,
+            api_key=self.env_dict['MAPS_API_KEY'],
+            latitude=coordinates[0],
+            longitude=coordinates[1],
+            radius=nearby_config['RADIUS'],
+            included_types=nearby_config['INCLUDED_TYPES'],
+            limiter=self.limiter))
+
+    async def enrich(self, listing: dict):
+        link = listing["card_info"]["Link"]
+
+        async def describe_stage():
+            if "description" not in listing:
+                listing["description"] = await self.describe(listing.pop("images"))
+                self.store.save_stage(link, "description", listing["description"])
+
+        async def nearby_stage():
+            if "places" not in listing:
+                listing["places"] = await self.nearby(listing["details"]['coordinates'])
+                self.store.save_stage(link, "places", listing["places"])
+
+        await asyncio.gather(describe_stage(), nearby_stage())
+        return listing
+
+    async def save(self, listing: dict):
+        row = build_row(listing["card_info"],
+                        listing["details"],
+                        listing["description"],
+                        listing["places"],
+                        nested=self.sink.nested)
+        # Still in flight until the row is flushed: mark_flushed releases it
+        await asyncio.to_thread(self.sink.add, row)
+        return None
+
+    def mark_flushed(self, rows: list):
+        for row in rows:
+            self.store.mark_done(row["Link"])
+            self._in_flight.discard(row["Link"])
+            self.release(row["Link"], done=True)
+
+    async def flush_periodically(self):
+        # Time-based flushes for runs where rows trickle in slowly
+        while True:
+            await asyncio.sleep(self.sink.flush_seconds)
+            await asyncio.to_thread(self.sink.flush_if_due)
+
+    # Run
+
+    async def run(self) -> None:
+        pipeline_config = self.config['PIPELINE']
+        concurrency = pipeline_config['CONCURRENCY']
+        queue_size = pipeline_config['QUEUE_SIZE']
+
+        cards = asyncio.Queue(maxsize=queue_size)
+        to_details = asyncio.Queue(maxsize=queue_size)
+        to_images = asyncio.Queue(maxsize=queue_size)
+        to_enrich = asyncio.Queue(maxsize=queue_size)
+        to_sink = asyncio.Queue(maxsize=queue_size)
+
+        background = [asyncio.create_task(self.flush_periodically())]
+        if self.work_queue is not None:
+            background.append(asyncio.create_task(self.heartbeat()))
+        produce = self.produce_tasks if self.work_queue is not None else self.produce_pages
+        try:
+            await asyncio.gather(
+                produce(cards),
+                run_stage("cards", self.parse_card, cards, to_details, concurrency['CARDS'], self.drop),
+                run_stage("details", self.scrape_details, to_details, to_images, concurrency['DETAILS'], self.drop),
+                run_stage("images", self.collect_images, to_images, to_enrich, concurrency['IMAGES'], self.drop),
+                run_stage("enrich", self.enrich, to_enrich, to_sink, concurrency['ENRICH'], self.drop),
+                run_stage("sink", self.save, to_sink, None, concurrency['SINK'], self.drop)
+            )
+        finally:
+            for task in background:
+                task.cancel()
+            await asyncio.to_thread(self.sink.flush)
+
+    # Recrawl
+
+    async def check_details(self, entry: dict) -> dict:
+        # Conditional request of a known listing's details page, through the proxy pool and the "details" endpoint
+        url = entry["link"]
+
+        async def request():
+            return await self.proxy_pool.call(lambda endpoint: request_details_conditional(
+                session=self.details_session,
+                url=url,
+                proxy=endpoint["url"],
+                headers=endpoint["headers"],
+                etag=entry["etag"],
+                last_modified=entry["last_modified"],
+                limiter=self.limiter))
+        return await self.resilience.call("details", request)
+
+    async def refresh(self, entry: dict) -> str:
+        """
+        Checks a known listing and returns what the check found: unchanged,
+        changed, delisted, or baseline when there was nothing comparable to
+        check against. A change re-runs only what it affects: vision when
+        the gallery changed, Places when the coordinates moved. The
+        refreshed listing goes to the sink as a new row, with the price of
+        the details page.
+        """
+        link = entry["link"]
+        detail_config = self.config['CRAWLERS']['DETAIL']
+        checked = await self.check_details(entry)
+        validators = {"etag": checked["etag"], "last_modified": checked["last_modified"]}
+        if checked["status"] in (404, 410):
+            self.schedule.mark_delisted(link)
+            print(f"Listing removed: {link}")
+            return "delisted"
+        if checked["status"] == 304:
+            self.schedule.record(link, changed=False, **validators)
+            return "unchanged"
+
+        details = parse_details_html(checked["html"])
+        extractor = "http"
+        if any(field in details["missing_fields"] for field in detail_config['REQUIRED_FIELDS']):
+            details = await scrape_details_page(headless=detail_config['HEADLESS'],
+                                                proxy=self.proxy_server_dict,
+                                                headers=self.headers,
+                                                url=link,
+                                                img_folder=None,
+                                                timeout=detail_config['TIMEOUT']['REQUEST_TIMEOUT'],
+                                                element_timeout=detail_config['TIMEOUT']['ELEMENT_TIMEOUT'],
+                                                pool=self.pool,
+                                                limiter=self.limiter)
+            if not details:
+                raise ValueError(f"No details could be read from {link}")
+            extractor = "browser"
+
+        fingerprints = {"fingerprint": details_fingerprint(details),
+                        "images": images_fingerprint(details),
+                        "coordinates": coordinates_key(details),
+                        "extractor": extractor}
+        if entry["fingerprint"] is None or entry["extractor"] != extractor:
+            # The extractors normalise fields differently: only fingerprints of the same one are compared
+            self.schedule.record(link, changed=False, **validators, **fingerprints)
+            return "baseline"
+        if fingerprints["fingerprint"] == entry["fingerprint"]:
+            self.schedule.record(link, changed=False, **validators, **fingerprints)
+            return "unchanged"
+
+        # Scheduled listings have every stage stored, so only what the change affects runs again
+        listing = self.store.get(link)
+        listing["details"] = details
+        self.store.save_stage(link, "details", details)
+        if details.get("price") is not None:
+            listing["card_info"]["Price"] = str(details["price"])
+            self.store.save_stage(link, "card_info", listing["card_info"])
+        if fingerprints["images"] != entry["images"]:
+            listing.pop("description", None)
+        if fingerprints["coordinates"] != entry["coordinates"]:
+            listing.pop("places", None)
+        print(f"Listing changed: {link} (vision: {'description' not in listing}, "
+              f"places: {'places' not in listing})")
+
+        self._in_flight.add(link)
+        try:
+            listing = await self.collect_images(listing)
+            listing = await self.enrich(listing)
+            await self.save(listing)
+        except Exception:
+            self._in_flight.discard(link)
+            raise
+        # The fingerprints move only once the listing is refreshed, so a failed refresh is retried in full
+        self.schedule.record(link, changed=True, **validators, **fingerprints)
+        return "changed"
+
+    async def recrawl(self) -> dict:
+        """
+        Revisits up to RECRAWL.BATCH due listings of the schedule, most
+        overdue first, RECRAWL.CONCURRENCY at a time.
+        """
+        recrawl_config = self.config['RECRAWL']
+        semaphore = asyncio.Semaphore(recrawl_config['CONCURRENCY'])
+        due = await asyncio.to_thread(self.schedule.due, recrawl_config['BATCH'])
+        print(f"Recrawling {len(due)} listings")
+        outcomes = {"unchanged": 0, "changed": 0, "delisted": 0, "baseline": 0, "failed": 0}
+
+        async def check(entry):
+            async with semaphore:
+                try:
+                    outcome = await self.refresh(entry)
+                except Exception as e:
+                    print(f"Error recrawling {entry['link']}: {e}")
+                    await asyncio.to_thread(self.schedule.record_failure, entry['link'])
+                    outcome = "failed"
+            outcomes[outcome] += 1
+            METRICS.inc("recrawl", outcome=outcome)
+
+        flusher = asyncio.create_task(self.flush_periodically())
+        try:
+            await asyncio.gather(*[check(entry) for entry in due])
+        finally:
+            flusher.cancel()
+            await asyncio.to_thread(self.sink.flush)
+        print(f"Recrawl: {outcomes}, schedule: {self.schedule.stats()}")
+        return outcomes
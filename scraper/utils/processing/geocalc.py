@@ -1,17 +1,112 @@
 import math
+import numpy as np
 
-# Distance calculator (Haversine formula)
+EARTH_RADIUS_KM = 6371.0
+
+# Distance calculator (Haversine formula), thin wrapper over the vectorized version
 def calculate_distance(lat1, lon1, lat2, lon2):
-    R = 6371.0  # Radius of Earth in km
-    dlat = math.radians(lat2 - lat1)
-    dlon = math.radians(lon2 - lon1)
-    a = math.sin(dlat/2)**2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon/2)**2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    return R * c
+    return float(haversine_one_to_many(lat1, lon1, [lat2], [lon2])[0])
+
+def haversine_one_to_many(lat, lng, lats, lngs):
+    """Distances in km from one point to arrays of points."""
+    lat = np.radians(lat)
+    lats = np.radians(np.asarray(lats, dtype=np.float64))
+    dlat = lats - lat
+    dlng = np.radians(np.asarray(lngs, dtype=np.float64) - lng)
+    a = np.sin(dlat / 2)**2 + np.cos(lat) * np.cos(lats) * np.sin(dlng / 2)**2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+def iter_haversine_chunks(lats1, lngs1, lats2, lngs2, chunk_size=1024):
+    """
+    Yields (row_offset, block) where block holds the km distances from
+    `chunk_size` rows of the first set to every point of the second set,
+    so memory stays bounded at chunk_size x len(lats2).
+    """
+    lats1 = np.radians(np.asarray(lats1, dtype=np.float64))
+    lngs1 = np.radians(np.asarray(lngs1, dtype=np.float64))
+    lats2 = np.radians(np.asarray(lats2, dtype=np.float64))[np.newaxis, :]
+    lngs2 = np.radians(np.asarray(lngs2, dtype=np.float64))[np.newaxis, :]
+    cos_lats2 = np.cos(lats2)
+
+    for start in range(0, len(lats1), chunk_size):
+        lat = lats1[start:start + chunk_size, np.newaxis]
+        lng = lngs1[start:start + chunk_size, np.newaxis]
+        a = np.sin((lats2 - lat) / 2)**2 + np.cos(lat) * cos_lats2 * np.sin((lngs2 - lng) / 2)**2
+        yield start, 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+def haversine_matrix(lats1, lngs1, lats2=None, lngs2=None, chunk_size=1024):
+    """Full km distance matrix between two point sets (or one set and itself)."""
+    if lats2 is None:
+        lats2, lngs2 = lats1, lngs1
+    matrix = np.empty((len(lats1), len(lats2)), dtype=np.float64)
+    for start, block in iter_haversine_chunks(lats1, lngs1, lats2, lngs2, chunk_size):
+        matrix[start:start + len(block)] = block
+    return matrix
+
+def find_close_pairs(lats, lngs, threshold_km, chunk_size=1024):
+    """
+    Index pairs (i, j), i < j, of points closer than `threshold_km`, e.g. to
+    flag duplicate listings. Never materializes the full matrix.
+    """
+    pairs = []
+    for start, block in iter_haversine_chunks(lats, lngs, lats, lngs, chunk_size):
+        rows, cols = np.nonzero(block < threshold_km)
+        rows = rows + start
+        keep = rows < cols
+        pairs.extend(zip(rows[keep].tolist(), cols[keep].tolist()))
+    return pairs
 
 def pixel_to_latlng(pixel_x, pixel_y, zoom):
     scale = 256 * 2**zoom
     lng = pixel_x / scale * 360.0 - 180.0
     n = math.pi - (2 * math.pi * pixel_y) / scale
     lat = math.degrees(math.atan(math.sinh(n)))
-    return lat, lng
\ No newline at end of file
+    return lat, lng
+
+def pixels_to_latlng(pixels_x, pixels_y, zoom):
+    """Batched pixel_to_latlng over arrays of web-mercator pixel coordinates."""
+    scale = 256 * 2**np.asarray(zoom, dtype=np.float64)
+    lngs = np.asarray(pixels_x, dtype=np.float64) / scale * 360.0 - 180.0
+    n = np.pi - (2 * np.pi * np.asarray(pixels_y, dtype=np.float64)) / scale
+    lats = np.degrees(np.arctan(np.sinh(n)))
+    return lats, lngs
+
+
+# Geohash cells, used to share lookups between nearby listings
+GEOHASH_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+def encode_geohash(lat, lng, precision):
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    geohash, bits, bit_count, even = [], 0, 0, True
+    while len(geohash) < precision:
+        rng, value = (lng_range, lng) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            rng[0] = mid
+        else:
+            bits = bits << 1
+            rng[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            geohash.append(GEOHASH_BASE32[bits])
+            bits, bit_count = 0, 0
+    return "".join(geohash)
+
+def decode_geohash(geohash):
+    # Returns the cell as (center_lat, center_lng, lat_half_height, lng_half_width)
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    even = True
+    for char in geohash:
+        bits = GEOHASH_BASE32.index(char)
+        for shift in range(4, -1, -1):
+            rng = lng_range if even else lat_range
+            mid = (rng[0] + rng[1]) / 2
+            if (bits >> shift) & 1:
+                rng[0] = mid
+            else:
+                rng[1] = mid
+            even = not even
+    return ((lat_range[0] + lat_range[1]) / 2, (lng_range[0] + lng_range[1]) / 2,
+            (lat_range[1] - lat_range[0]) / 2, (lng_range[1] - lng_range[0]) / 2)
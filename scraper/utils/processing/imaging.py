@@ -0,0 +1,72 @@
+import io
+import asyncio
+from PIL import Image
+
+
+'''
+IMAGE PREPROCESSING
+'''
+
+# The vision model fits "low" images into 512x512. "high" images are fitted
+# into 2048x2048 and then scaled so the shortest side is at most 768.
+LOW_DETAIL_MAX_SIDE = 512
+HIGH_DETAIL_MAX_SIDE = 2048
+HIGH_DETAIL_MAX_SHORT_SIDE = 768
+
+
+def target_size(width: int, height: int, detail: str) -> tuple:
+    if detail == "low":
+        scale = min(1.0, LOW_DETAIL_MAX_SIDE / max(width, height))
+    else:
+        scale = min(1.0, HIGH_DETAIL_MAX_SIDE / max(width, height))
+        short_side = min(width, height) * scale
+        scale *= min(1.0, HIGH_DETAIL_MAX_SHORT_SIDE / short_side)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def downscale_image(content: bytes, detail: str, quality: int) -> bytes:
+    """
+    Resizes an image to the largest size the model uses for `detail` and
+    re-encodes it as JPEG. Returns the original bytes if they are smaller or
+    cannot be decoded.
+    """
+    try:
+        with Image.open(io.BytesIO(content)) as image:
+            size = target_size(image.width, image.height, detail)
+            if image.mode != "RGB":
+                image = image.convert("RGB")
+            if size != (image.width, image.height):
+                image = image.resize(size, Image.LANCZOS)
+            output = io.BytesIO()
+            image.save(output, format="JPEG", quality=quality, optimize=True)
+    except Exception as e:
+        print(f"Error downscaling image: {e}")
+        return content
+
+    resized = output.getvalue()
+    return resized if len(resized) < len(content) else content
+
+
+async def prepare_images(images: list,
+                         detail: str,
+                         quality: int,
+                         executor=None,
+                         min_batch: int = 8) -> tuple:
+    """
+    Downscales a listing's images off the event loop. Batches of at least
+    `min_batch` images go to `executor` (a ProcessPoolExecutor) when given.
+    Returns the prepared images and the payload bytes before and after.
+    """
+    if executor is not None and len(images) >= min_batch:
+        loop = asyncio.get_running_loop()
+        prepared = await asyncio.gather(*[loop.run_in_executor(executor, downscale_image, image, detail, quality)
+                                          for image in images])
+    else:
+        prepared = await asyncio.to_thread(lambda: [downscale_image(image, detail, quality) for image in images])
+
+    stats = {
+        "images": len(images),
+        "bytes_before": sum(len(image) for image in images),
+        "bytes_after": sum(len(image) for image in prepared)
+    }
+    return list(prepared), stats
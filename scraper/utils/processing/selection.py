@@ -0,0 +1,96 @@
+import io
+import numpy as np
+from PIL import Image
+
+
+'''
+IMAGE FINGERPRINTS
+'''
+
+HASH_SIZE = 8
+HISTOGRAM_BINS = 8
+
+
+def difference_hash(image: Image.Image) -> int:
+    # 64-bit dHash: compares each pixel with its right neighbour on a 9x8 thumbnail
+    pixels = np.asarray(image.convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.BILINEAR), dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int("".join("1" if bit else "0" for bit in bits), 2)
+
+
+def colour_histogram(image: Image.Image) -> np.ndarray:
+    pixels = np.asarray(image.convert("RGB").resize((64, 64)), dtype=np.uint8).reshape(-1, 3)
+    channels = [np.histogram(pixels[:, c], bins=HISTOGRAM_BINS, range=(0, 256))[0] for c in range(3)]
+    histogram = np.concatenate(channels).astype(np.float64)
+    return histogram / histogram.sum()
+
+
+def image_fingerprint(content: bytes):
+    """Returns (dhash, histogram) for an image, or None if it cannot be decoded."""
+    try:
+        with Image.open(io.BytesIO(content)) as image:
+            # JPEG draft mode decodes at reduced scale, which is all a fingerprint needs
+            image.draft("RGB", (128, 128))
+            return difference_hash(image), colour_histogram(image)
+    except Exception as e:
+        print(f"Error fingerprinting image: {e}")
+        return None
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def fingerprint_distance(a, b) -> float:
+    # Structure (dHash) and colour (histogram L1) both scaled to [0, 1]
+    structure = hamming_distance(a[0], b[0]) / (HASH_SIZE * HASH_SIZE)
+    colour = np.abs(a[1] - b[1]).sum() / 2
+    return structure + colour
+
+
+'''
+SELECTION
+'''
+
+def cluster_near_duplicates(fingerprints: list, max_hamming: int) -> list:
+    """
+    Greedily groups images whose dHash is within `max_hamming` bits of a
+    cluster's first image. Returns clusters as lists of indices.
+    """
+    clusters = []
+    for index, fingerprint in enumerate(fingerprints):
+        for cluster in clusters:
+            if hamming_distance(fingerprints[cluster[0]][0], fingerprint[0]) <= max_hamming:
+                cluster.append(index)
+                break
+        else:
+            clusters.append([index])
+    return clusters
+
+
+def select_diverse_images(images: list, k: int, max_hamming: int) -> list:
+    """
+    Keeps at most `k` images of a listing: near-duplicates are collapsed to
+    one representative and the most mutually distant representatives are
+    picked, starting from the cover photo. Images keep their gallery order.
+    """
+    fingerprints = [image_fingerprint(image) for image in images]
+    valid = [i for i, fingerprint in enumerate(fingerprints) if fingerprint is not None]
+    if not valid:
+        return images[:k]
+
+    clusters = cluster_near_duplicates([fingerprints[i] for i in valid], max_hamming)
+    representatives = [valid[cluster[0]] for cluster in clusters]
+
+    # Farthest-point sampling over the cluster representatives
+    selected = representatives[:1]
+    distances = {i: fingerprint_distance(fingerprints[i], fingerprints[selected[0]])
+                 for i in representatives[1:]}
+    while distances and len(selected) < k:
+        farthest = max(distances, key=distances.get)
+        selected.append(farthest)
+        del distances[farthest]
+        for i in distances:
+            distances[i] = min(distances[i], fingerprint_distance(fingerprints[i], fingerprints[farthest]))
+
+    return [images[i] for i in sorted(selected)]
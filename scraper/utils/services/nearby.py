@@ -1,13 +1,17 @@
+import aiohttp
 import requests
-from utils.processing.geocalc import calculate_distance
+from utils.connection.rate_limit import RateLimiter, limited
+from utils.monitoring.metrics import METRICS
+from utils.processing.geocalc import calculate_distance, haversine_one_to_many, encode_geohash, decode_geohash
 
-# Unified search function
-def get_nearby_places(api_key:str, 
-                      latitude:float, 
-                      longitude:float, 
-                      radius: int,
-                      included_types: list ) -> list:
-    url = "https://places.googleapis.com/v1/places:searchNearby"
+PLACES_NEARBY_URL = "https://places.googleapis.com/v1/places:searchNearby"
+
+# Request shared by the sync and async clients
+def build_nearby_request(api_key:str,
+                         latitude:float,
+                         longitude:float,
+                         radius: int,
+                         included_types: list) -> tuple:
     headers = {
         "Content-Type": "application/json",
         "X-Goog-Api-Key": api_key,
@@ -27,20 +31,63 @@ def get_nearby_places(api_key:str,
         "includedTypes": included_types,
         "languageCode": "es-CO"  # Ya pides respuesta en español
     }
+    return headers, payload
 
-    response = requests.post(url, headers=headers, json=payload)
+# Raw Places search. Raises when the request fails, so a failure is never read as "no places"
+def search_nearby_places(api_key:str, 
+                         latitude:float, 
+                         longitude:float, 
+                         radius: int,
+                         included_types: list,
+                         session:requests.Session = None):
+    headers, payload = build_nearby_request(api_key, latitude, longitude, radius, included_types)
+    # `session` replaces the module-level requests client, e.g. with replay_requests_session
+    with METRICS.timer("places_call"):
+        response = (session or requests).post(PLACES_NEARBY_URL, headers=headers, json=payload)
     if response.status_code != 200:
         print(f"Error: {response.status_code} - {response.text}")
-        return []
+    response.raise_for_status()
+
+    return response.json().get("places", [])
+
+# Same search on a shared aiohttp session, paced by the per-host rate limiter
+async def search_nearby_places_async(session:aiohttp.ClientSession,
+                                     api_key:str,
+                                     latitude:float,
+                                     longitude:float,
+                                     radius: int,
+                                     included_types: list,
+                                     limiter:RateLimiter = None):
+    headers, payload = build_nearby_request(api_key, latitude, longitude, radius, included_types)
+    async with limited(limiter, PLACES_NEARBY_URL) as slot:
+        with METRICS.timer("places_call"):
+            async with session.post(PLACES_NEARBY_URL, headers=headers, json=payload) as response:
+                slot.record(response)
+                if response.status != 200:
+                    print(f"Error: {response.status} - {await response.text()}")
+                response.raise_for_status()
+                data = await response.json()
+    return data.get("places", [])
+
+# Distances from the exact listing point, optionally dropping places beyond `radius` meters
+def format_places(places: list,
+                  latitude: float,
+                  longitude: float,
+                  radius: int = None) -> list:
+    # One vectorized distance computation for every place with a location
+    located = [i for i, lugar in enumerate(places) if lugar.get("location")]
+    distances = [None] * len(places)
+    if located:
+        dists = haversine_one_to_many(latitude, longitude,
+                                      [places[i]["location"].get("latitude") for i in located],
+                                      [places[i]["location"].get("longitude") for i in located])
+        for i, dist in zip(located, dists.tolist()):
+            distances[i] = dist
 
-    data = response.json()
     resultados = []
-    for lugar in data.get("places", []):
-        loc = lugar.get("location", {})
-        dist = calculate_distance(lat1=latitude, 
-                                  lon1=longitude, 
-                                  lat2=loc.get("latitude"), 
-                                  lon2=loc.get("longitude")) if loc else None
+    for lugar, dist in zip(places, distances):
+        if radius is not None and dist is not None and dist * 1000 > radius:
+            continue
         resultados.append({
             "nombre": lugar.get("displayName", {}).get("text", ""),
             "dirección": lugar.get("formattedAddress", ""),
@@ -50,3 +97,63 @@ def get_nearby_places(api_key:str,
 
     return resultados
 
+# Unified search function
+def get_nearby_places(api_key:str, 
+                      latitude:float, 
+                      longitude:float, 
+                      radius: int,
+                      included_types: list,
+                      session:requests.Session = None) -> list:
+    places = search_nearby_places(api_key, latitude, longitude, radius, included_types, session)
+    return format_places(places, latitude, longitude)
+
+async def get_nearby_places_async(session:aiohttp.ClientSession,
+                                  api_key:str,
+                                  latitude:float,
+                                  longitude:float,
+                                  radius: int,
+                                  included_types: list,
+                                  limiter:RateLimiter = None) -> list:
+    places = await search_nearby_places_async(session, api_key, latitude, longitude,
+                                              radius, included_types, limiter)
+    return format_places(places, latitude, longitude)
+
+# Cache key, search center and widened radius for the listing's geohash cell
+def nearby_cell_query(latitude:float,
+                      longitude:float,
+                      radius: int,
+                      included_types: list,
+                      precision: int) -> tuple:
+    cell = encode_geohash(latitude, longitude, precision)
+    key = f"{cell}|{radius}|{','.join(sorted(included_types))}"
+    center_lat, center_lng, lat_err, lng_err = decode_geohash(cell)
+    half_diagonal = calculate_distance(center_lat, center_lng, center_lat + lat_err, center_lng + lng_err) * 1000
+    return key, center_lat, center_lng, radius + int(half_diagonal) + 1
+
+# Cached search shared by every listing in the same geohash cell
+async def get_nearby_places_cached_async(session:aiohttp.ClientSession,
+                                         cache,
+                                         api_key:str,
+                                         latitude:float,
+                                         longitude:float,
+                                         radius: int,
+                                         included_types: list,
+                                         precision: int,
+                                         limiter:RateLimiter = None) -> list:
+    """
+    Looks up places around the center of the listing's geohash cell, with the
+    radius widened by the cell's half-diagonal so the listing's own circle is
+    covered. Results are cached per cell, types and radius, and distances are
+    always recomputed from the exact listing point, keeping only places
+    within `radius`. Places returns at most 20 results, so in very dense
+    cells a few of the farthest places can be missing.
+    """
+    key, center_lat, center_lng, search_radius = nearby_cell_query(latitude, longitude, radius,
+                                                                   included_types, precision)
+    places = cache.get(key)
+    if places is None:
+        places = await search_nearby_places_async(session, api_key, center_lat, center_lng,
+                                                  search_radius, included_types, limiter)
+        cache.put(key, places)
+
+    return format_places(places, latitude, longitude, radius=radius)
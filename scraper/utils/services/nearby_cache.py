@@ -0,0 +1,64 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from utils.monitoring.metrics import METRICS
+
+
+'''
+NEARBY CACHE
+'''
+
+class NearbyCache:
+    """
+    Persistent SQLite cache of raw Places results, keyed by geohash cell,
+    radius and included types. Entries older than `ttl` seconds are ignored
+    and purged.
+    """
+
+    def __init__(self, path: str, ttl: float):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        # Shared by pipeline worker threads, so every statement holds the lock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS nearby_cache (
+                key TEXT PRIMARY KEY,
+                places TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("DELETE FROM nearby_cache WHERE created_at < ?", (time.time() - self.ttl,))
+        self._conn.commit()
+
+    def get(self, key: str):
+        with self._lock:
+            row = self._conn.execute("SELECT places FROM nearby_cache WHERE key = ? AND created_at >= ?",
+                                     (key, time.time() - self.ttl)).fetchone()
+            if row is None:
+                self.misses += 1
+                METRICS.inc("cache_misses", cache="nearby")
+                return None
+            self.hits += 1
+            METRICS.inc("cache_hits", cache="nearby")
+        return json.loads(row[0])
+
+    def put(self, key: str, places: list) -> None:
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO nearby_cache VALUES (?, ?, ?)",
+                               (key, json.dumps(places), time.time()))
+            self._conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM nearby_cache").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "entries": entries}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -1,12 +1,26 @@
 import base64
 import os
+import aiohttp
 import requests
+from utils.connection.rate_limit import RateLimiter, limited
+from utils.monitoring.metrics import METRICS
 
 
 # Function to encode an image to base64
 def encode_image(image_path:str) -> str:
     with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode('utf-8')
+        return encode_image_bytes(image_file.read())
+
+def encode_image_bytes(content:bytes) -> str:
+    return base64.b64encode(content).decode('utf-8')
+
+def load_images_from_dir(image_dir:str, extensions: tuple = ('.png', '.jpg', '.jpeg')) -> list:
+    image_files = [f for f in os.listdir(image_dir) if f.lower().endswith(extensions)]
+    images = []
+    for file_name in image_files:
+        with open(os.path.join(image_dir, file_name), "rb") as image_file:
+            images.append(image_file.read())
+    return images
     
 def delete_images_in_dir(image_dir: str, extensions: tuple = ('.png', '.jpg', '.jpeg')) -> None:
     """Delete all image files in a directory with the specified extensions."""
@@ -17,16 +31,15 @@ def delete_images_in_dir(image_dir: str, extensions: tuple = ('.png', '.jpg', '.
         except Exception as e:
             print(f"Failed to delete {file_name}: {e}")
 
-# Function to analyze apartment images
-def describe_apartment_images(api_key:str,
-                              prompt_text:str,
-                              model:str, 
-                              image_detail:str,
-                              max_tokens:int, 
-                              image_dir:str,
-                              ) -> str:
-    
-    image_files = [f for f in os.listdir(image_dir) if f.lower().endswith(('.png', '.jpg', '.jpeg'))]
+OPENAI_CHAT_URL = "https://api.openai.com/v1/chat/completions"
+
+# Request shared by the sync and async clients
+def build_vision_request(api_key:str,
+                         prompt_text:str,
+                         model:str,
+                         image_detail:str,
+                         max_tokens:int,
+                         images:list) -> tuple:
     content = []
 
     # Detailed prompt
@@ -37,9 +50,8 @@ def describe_apartment_images(api_key:str,
     content.append(prompt)
 
     # Add image content
-    for file_name in image_files:
-        image_path = os.path.join(image_dir, file_name)
-        base64_image = encode_image(image_path)
+    for image in images:
+        base64_image = encode_image_bytes(image)
         image_url = {
             "type": "image_url",
             "image_url": {
@@ -64,13 +76,64 @@ def describe_apartment_images(api_key:str,
         ],
         "max_tokens": max_tokens
     }
-    response = requests.post(url = "https://api.openai.com/v1/chat/completions", 
-                             headers=headers, 
-                             json=payload)
+    return headers, payload
+
+def parse_vision_response(data:dict) -> str:
+    # An error body or an empty answer must not end up as the description
+    choices = data.get('choices') if isinstance(data, dict) else None
+    if not choices or not choices[0].get('message', {}).get('content'):
+        error = data.get('error') if isinstance(data, dict) else None
+        raise ValueError(f"Unexpected OpenAI response: {error or data}")
+    return choices[0]['message']['content']
+
+# Function to analyze apartment images
+def describe_apartment_images(api_key:str,
+                              prompt_text:str,
+                              model:str, 
+                              image_detail:str,
+                              max_tokens:int, 
+                              image_dir:str = None,
+                              images:list = None,
+                              session:requests.Session = None,
+                              ) -> str:
+    """
+    Describes a listing from its images. `images` are raw image bytes kept in
+    memory for this listing; `image_dir` is the legacy path, whose files are
+    read and then deleted. `session` replaces the module-level requests
+    client, e.g. with replay_requests_session.
+    """
+    if images is None:
+        images = load_images_from_dir(image_dir)
+
+    headers, payload = build_vision_request(api_key, prompt_text, model, image_detail, max_tokens, images)
+    with METRICS.timer("vision_call"):
+        response = (session or requests).post(url = OPENAI_CHAT_URL, 
+                                              headers=headers, 
+                                              json=payload)
+    response.raise_for_status()
     data = response.json()
-    description = data['choices'][0]['message']['content']
+    description = parse_vision_response(data)
+
+    if image_dir:
+        delete_images_in_dir(image_dir)
 
-    delete_images_in_dir(image_dir)
 
+    return description
 
-    return description
\ No newline at end of file
+# Same call on a shared aiohttp session, paced by the per-host rate limiter
+async def describe_apartment_images_async(session:aiohttp.ClientSession,
+                                          api_key:str,
+                                          prompt_text:str,
+                                          model:str,
+                                          image_detail:str,
+                                          max_tokens:int,
+                                          images:list,
+                                          limiter:RateLimiter = None) -> str:
+    headers, payload = build_vision_request(api_key, prompt_text, model, image_detail, max_tokens, images)
+    async with limited(limiter, OPENAI_CHAT_URL) as slot:
+        with METRICS.timer("vision_call"):
+            async with session.post(OPENAI_CHAT_URL, headers=headers, json=payload) as response:
+                slot.record(response)
+                response.raise_for_status()
+                data = await response.json()
+    return parse_vision_response(data)
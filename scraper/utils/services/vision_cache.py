@@ -0,0 +1,95 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+import hashlib
+from utils.monitoring.metrics import METRICS
+
+
+'''
+VISION CACHE
+'''
+
+def vision_cache_key(images: list, settings: dict) -> str:
+    """
+    Content key for a vision call: the hashes of the selected images (order
+    independent) plus every setting that changes the answer, such as the
+    prompt, model and detail level.
+    """
+    digest = hashlib.sha256()
+    for image_hash in sorted(hashlib.sha256(image).hexdigest() for image in images):
+        digest.update(image_hash.encode())
+    digest.update(json.dumps(settings, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+class VisionCache:
+    """
+    Persistent SQLite cache of image descriptions. Entries are evicted least
+    recently used first once the stored descriptions exceed `max_bytes`.
+    """
+
+    def __init__(self, path: str, max_bytes: int):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        # Shared by pipeline worker threads, so every statement holds the lock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS vision_cache (
+                key TEXT PRIMARY KEY,
+                description TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_vision_cache_access ON vision_cache (last_access)")
+        self._conn.commit()
+
+    def get(self, key: str):
+        with self._lock:
+            row = self._conn.execute("SELECT description FROM vision_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                METRICS.inc("cache_misses", cache="vision")
+                return None
+            self.hits += 1
+            METRICS.inc("cache_hits", cache="vision")
+            self._conn.execute("UPDATE vision_cache SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            return row[0]
+
+    def put(self, key: str, description: str) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO vision_cache VALUES (?, ?, ?, ?, ?)",
+                               (key, description, len(description.encode()), now, now))
+            self._conn.commit()
+            self._evict()
+
+    def _evict(self) -> None:
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM vision_cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        expired = []
+        for key, size in self._conn.execute("SELECT key, size FROM vision_cache ORDER BY last_access"):
+            if total <= self.max_bytes:
+                break
+            expired.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM vision_cache WHERE key = ?", expired)
+        self._conn.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM vision_cache").fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "bytes": size}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()